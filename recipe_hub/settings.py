@@ -5,6 +5,8 @@ Django settings for recipe_hub project.
 from pathlib import Path
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Try to import deployment packages, fallback if not available
 try:
     import dj_database_url
@@ -62,6 +64,20 @@ MIDDLEWARE.extend([
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ])
 
+# Opt-in per-view timing and query statistics (recipes/profiling.py), shown to
+# staff at /profiling/stats/ and sent in a Server-Timing header
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'False').lower() == 'true'
+# Requests per view the percentiles are computed over
+PROFILING_WINDOW = int(os.environ.get('PROFILING_WINDOW', 500))
+# Fraction of requests run under cProfile; dumps are kept for requests slower than the threshold
+PROFILING_CPROFILE_SAMPLE_RATE = float(os.environ.get('PROFILING_CPROFILE_SAMPLE_RATE', 0))
+PROFILING_CPROFILE_THRESHOLD_MS = float(os.environ.get('PROFILING_CPROFILE_THRESHOLD_MS', 500))
+PROFILING_CPROFILE_DIR = os.environ.get('PROFILING_CPROFILE_DIR', str(BASE_DIR / 'profiles'))
+
+if PROFILING_ENABLED:
+    # First, so the wall time covers every other middleware
+    MIDDLEWARE.insert(0, 'recipes.profiling.ProfilingMiddleware')
+
 ROOT_URLCONF = 'recipe_hub.urls'
 
 TEMPLATES = [
@@ -80,18 +96,123 @@ TEMPLATES = [
     },
 ]
 
+if PROFILING_ENABLED:
+    TEMPLATES[0]['BACKEND'] = 'recipes.profiling.ProfiledDjangoTemplates'
+
 WSGI_APPLICATION = 'recipe_hub.wsgi.application'
 
+# Serve home, recipe_detail and user_profile from async views (use with an
+# ASGI server, e.g. gunicorn -k uvicorn.workers.UvicornWorker recipe_hub.asgi:application)
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', 'False').lower() == 'true'
+# Threads (each with its own database connection) running the async views' concurrent queries
+ASYNC_QUERY_WORKERS = int(os.environ.get('ASYNC_QUERY_WORKERS', 16))
+
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DATABASE_URL (e.g. the Render PostgreSQL URL) replaces the local SQLite file;
+# parsing it needs dj_database_url
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+
+if DATABASE_URL and not dj_database_url:
+    raise ImproperlyConfigured('DATABASE_URL is set but dj_database_url is not installed')
+
+if DATABASE_URL:
+    DATABASES = {'default': dj_database_url.parse(DATABASE_URL)}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
     }
+
+# Read replicas: comma-separated database URLs (or SQLite file paths) in
+# DATABASE_REPLICAS. GET requests to REPLICA_VIEWS read from a replica unless
+# the client wrote within REPLICA_STICKINESS_SECONDS (recipes/routers.py).
+# Locally, `python manage.py sync_replicas` copies db.sqlite3 into SQLite replicas.
+DATABASE_REPLICAS = []
+for number, replica in enumerate(filter(None, os.environ.get('DATABASE_REPLICAS', '').split(',')), start=1):
+    replica = replica.strip()
+    if '://' in replica:
+        if not dj_database_url:
+            raise ImproperlyConfigured(f'DATABASE_REPLICAS entry {number} is a database URL but dj_database_url is not installed')
+        DATABASES[f'replica{number}'] = dj_database_url.parse(replica)
+    else:
+        DATABASES[f'replica{number}'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': replica}
+    DATABASES[f'replica{number}']['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+REPLICA_VIEWS = ['home', 'recipe_detail', 'user_profile']
+REPLICA_STICKINESS_SECONDS = int(os.environ.get('REPLICA_STICKINESS_SECONDS', 5))
+
+if DATABASE_REPLICAS:
+    DATABASE_ROUTERS = ['recipes.routers.ReplicaRouter']
+    MIDDLEWARE.append('recipes.routers.ReplicaRoutingMiddleware')
+
+# DATABASE_PROFILE=production keeps connections open for DATABASE_CONN_MAX_AGE
+# seconds (checked before reuse) instead of reconnecting on every request, and
+# applies SQLITE_PRAGMAS to each new SQLite connection (recipes/db.py): WAL lets
+# readers run alongside the writer, synchronous=NORMAL is safe with WAL, and
+# mmap_size/cache_size (negative: KiB) keep hot pages in memory.
+# `python manage.py benchmark_database` compares both profiles.
+DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE', 'development')
+
+if DATABASE_PROFILE == 'production':
+    for database in DATABASES.values():
+        database['CONN_MAX_AGE'] = int(os.environ.get('DATABASE_CONN_MAX_AGE', 600))
+        database['CONN_HEALTH_CHECKS'] = True
+        if database['ENGINE'] == 'django.db.backends.sqlite3':
+            # Seconds a writer waits for the lock before "database is locked"
+            database.setdefault('OPTIONS', {})['timeout'] = 20
+
+# Defined for every profile so benchmark_database can apply them from a development shell
+PRODUCTION_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -64000)),
+    'temp_store': 'MEMORY',
 }
+SQLITE_PRAGMAS = PRODUCTION_SQLITE_PRAGMAS if DATABASE_PROFILE == 'production' else {}
+
+
+# Cache
+# CACHE_BACKEND selects locmem (default, LRU eviction per process), file, or
+# redis (set REDIS_URL; configure the server with an allkeys-lru maxmemory policy)
+
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 2000))
+
+if CACHE_BACKEND == 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/1'),
+        }
+    }
+elif CACHE_BACKEND == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_LOCATION', BASE_DIR / '.cache'),
+            'OPTIONS': {'MAX_ENTRIES': CACHE_MAX_ENTRIES},
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'recipe-hub',
+            'OPTIONS': {'MAX_ENTRIES': CACHE_MAX_ENTRIES},
+        }
+    }
+
+# Cache used for anonymous pages and listing querysets, and their TTL in seconds
+RECIPE_CACHE_ALIAS = 'default'
+RECIPE_PAGE_CACHE_TIMEOUT = int(os.environ.get('RECIPE_PAGE_CACHE_TIMEOUT', 300))
 
 
 # Password validation
@@ -134,19 +255,61 @@ STATICFILES_DIRS = [
     BASE_DIR / 'static',
 ]
 
-# WhiteNoise configuration (only if available)
+# WhiteNoise configuration (only if available). collectstatic minifies the
+# CSS bundles in static/css, content-hashes every file name and writes .gz
+# copies, plus .br copies when the Brotli package is installed.
 if WHITENOISE_AVAILABLE:
-    STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+    STATICFILES_STORAGE = 'recipes.storage.MinifiedCompressedManifestStaticFilesStorage'
 
 # Media files (User uploaded files)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Uploaded image variants are generated outside the request cycle:
+# 'thread' or 'process' pool, or 'sync' to process inline (tests, scripts)
+IMAGE_PROCESSING_MODE = os.environ.get('IMAGE_PROCESSING_MODE', 'thread')
+IMAGE_PROCESSING_WORKERS = int(os.environ.get('IMAGE_PROCESSING_WORKERS', 2))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# "Similar recipes" (python manage.py build_recommendations): how many are stored
+# per recipe, and the share of the score from ratings as opposed to content
+RECOMMENDATIONS_TOP_K = int(os.environ.get('RECOMMENDATIONS_TOP_K', 6))
+RECOMMENDATIONS_RATING_WEIGHT = float(os.environ.get('RECOMMENDATIONS_RATING_WEIGHT', 0.3))
+
+# Moderation: recipes moved per transaction by bulk approve/reject
+MODERATION_BATCH_SIZE = int(os.environ.get('MODERATION_BATCH_SIZE', 500))
+
+# "What can I cook" search: the in-process ingredient index is rebuilt after
+# recipes change, at most once per this many seconds
+INGREDIENT_INDEX_REFRESH_SECONDS = int(os.environ.get('INGREDIENT_INDEX_REFRESH_SECONDS', 60))
+
+# Search box suggestions: each process indexes the titles of at most
+# SUGGESTION_INDEX_MAX_RECIPES popular recipes in memory, and catches up with
+# approved, edited and rejected recipes at most once per this many seconds
+SUGGESTION_INDEX_MAX_RECIPES = int(os.environ.get('SUGGESTION_INDEX_MAX_RECIPES', 20000))
+SUGGESTION_INDEX_REFRESH_SECONDS = int(os.environ.get('SUGGESTION_INDEX_REFRESH_SECONDS', 5))
+
+# Recipe page views are counted in memory and added to the database every
+# VIEW_COUNT_FLUSH_SECONDS (at most that much is lost if a process crashes),
+# or sooner once VIEW_COUNT_FLUSH_THRESHOLD views are pending
+VIEW_COUNT_FLUSH_SECONDS = int(os.environ.get('VIEW_COUNT_FLUSH_SECONDS', 10))
+VIEW_COUNT_FLUSH_THRESHOLD = int(os.environ.get('VIEW_COUNT_FLUSH_THRESHOLD', 1000))
+
+# Trending listing (home ?sort=trending): ratings and comments lose half their
+# weight every this many hours; run renormalize_trending daily
+TRENDING_HALF_LIFE_HOURS = float(os.environ.get('TRENDING_HALF_LIFE_HOURS', 48))
+
+# Listing pagination: 'page' numbers or keyset 'cursor' tokens (a ?cursor=
+# parameter always selects cursor mode). With PAGINATION_ESTIMATE_COUNT the
+# total is estimated once it passes PAGINATION_COUNT_LIMIT rows.
+PAGINATION_MODE = os.environ.get('PAGINATION_MODE', 'page')
+PAGINATION_ESTIMATE_COUNT = os.environ.get('PAGINATION_ESTIMATE_COUNT', 'False').lower() == 'true'
+PAGINATION_COUNT_LIMIT = int(os.environ.get('PAGINATION_COUNT_LIMIT', 10000))
+
 # Login URLs
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'home'
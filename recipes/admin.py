@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Category, Recipe, Comment, Rating
+from .models import AuthorStats, Category, Ingredient, ModerationLog, Recipe, Comment, Rating
+from .moderation import transition
 
 
 @admin.register(Category)
@@ -14,7 +15,7 @@ class RecipeAdmin(admin.ModelAdmin):
     list_display = ['title', 'author', 'category', 'status', 'average_rating', 'created_at']
     list_filter = ['status', 'category', 'created_at']
     search_fields = ['title', 'description', 'author__username']
-    readonly_fields = ['created_at', 'updated_at', 'average_rating']
+    readonly_fields = ['created_at', 'updated_at', 'average_rating', 'rating_count', 'view_count']
     fieldsets = (
         ('Basic Information', {
             'fields': ('title', 'description', 'category', 'author', 'image')
@@ -23,19 +24,19 @@ class RecipeAdmin(admin.ModelAdmin):
             'fields': ('ingredients', 'instructions', 'prep_time', 'cook_time', 'servings')
         }),
         ('Status & Ratings', {
-            'fields': ('status', 'average_rating', 'created_at', 'updated_at')
+            'fields': ('status', 'average_rating', 'rating_count', 'view_count', 'created_at', 'updated_at')
         }),
     )
     actions = ['approve_recipes', 'reject_recipes']
 
     def approve_recipes(self, request, queryset):
-        queryset.update(status='approved')
-        self.message_user(request, f"{queryset.count()} recipe(s) approved.")
+        changed = transition(queryset.values_list('pk', flat=True), 'approved', request.user)
+        self.message_user(request, f"{changed} recipe(s) approved.")
     approve_recipes.short_description = "Approve selected recipes"
 
     def reject_recipes(self, request, queryset):
-        queryset.update(status='rejected')
-        self.message_user(request, f"{queryset.count()} recipe(s) rejected.")
+        changed = transition(queryset.values_list('pk', flat=True), 'rejected', request.user)
+        self.message_user(request, f"{changed} recipe(s) rejected.")
     reject_recipes.short_description = "Reject selected recipes"
 
 
@@ -54,3 +55,23 @@ class RatingAdmin(admin.ModelAdmin):
     search_fields = ['recipe__title', 'user__username']
     readonly_fields = ['created_at', 'updated_at']
 
+
+@admin.register(AuthorStats)
+class AuthorStatsAdmin(admin.ModelAdmin):
+    list_display = ['user', 'total_recipes', 'approved_recipes', 'pending_recipes', 'average_rating', 'updated_at']
+    search_fields = ['user__username']
+    readonly_fields = [field.name for field in AuthorStats._meta.fields]
+
+
+@admin.register(Ingredient)
+class IngredientAdmin(admin.ModelAdmin):
+    list_display = ['name']
+    search_fields = ['name']
+
+
+@admin.register(ModerationLog)
+class ModerationLogAdmin(admin.ModelAdmin):
+    list_display = ['recipe_title', 'from_status', 'to_status', 'moderator', 'created_at']
+    list_filter = ['to_status', 'created_at']
+    search_fields = ['recipe_title', 'moderator__username']
+    readonly_fields = [field.name for field in ModerationLog._meta.fields]
@@ -0,0 +1,190 @@
+"""
+Read-only JSON API for recipes, categories, comments and ratings.
+
+Rows are read with ``values()`` and serialized straight from the dicts, so no
+model instances are built. ``fields=`` picks the columns a client needs (the
+query selects only those, like ``.only()``), ``ids=`` fetches a batch of
+recipes in one query, and lists page with the same keyset cursors as the
+HTML listings. Anonymous responses are stored in the page cache under the
+scopes of the data they show.
+"""
+from functools import wraps
+
+from django.core.files.storage import default_storage
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+
+from .cache import CATEGORIES, LISTING, cache_anonymous_page, cached_value, recipe_scope
+from .models import Category, Comment, Rating, Recipe
+from .pagination import CursorPaginator
+
+# Public field name -> ORM lookup read with values()
+RECIPE_FIELDS = {
+    'id': 'id',
+    'title': 'title',
+    'description': 'description',
+    'ingredients': 'ingredients',
+    'instructions': 'instructions',
+    'ingredient_items': 'ingredient_items',
+    'instruction_steps': 'instruction_steps',
+    'prep_time': 'prep_time',
+    'cook_time': 'cook_time',
+    'servings': 'servings',
+    'image': 'image',
+    'category': 'category_id',
+    'category_name': 'category__name',
+    'author': 'author__username',
+    'average_rating': 'average_rating',
+    'rating_count': 'rating_count',
+    'comment_count': 'comment_count',
+    'view_count': 'view_count',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+}
+# Lists leave out the long text fields unless asked for them
+LIST_FIELDS = [
+    'id', 'title', 'description', 'category', 'category_name', 'author', 'prep_time', 'cook_time',
+    'servings', 'image', 'average_rating', 'rating_count', 'comment_count', 'created_at',
+]
+COMMENT_FIELDS = {'id': 'id', 'author': 'author__username', 'content': 'content', 'created_at': 'created_at'}
+RATING_FIELDS = {'id': 'id', 'user': 'user__username', 'rating': 'rating', 'created_at': 'created_at'}
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+class BadRequest(Exception):
+    pass
+
+
+def api_view(view_func):
+    """GET only; a ``BadRequest`` becomes a 400 JSON error"""
+    @require_GET
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view_func(request, *args, **kwargs)
+        except BadRequest as error:
+            return JsonResponse({'error': str(error)}, status=400)
+    return wrapper
+
+
+def requested_fields(request, available, default):
+    """The ``fields=`` names, checked against ``available``"""
+    if 'fields' not in request.GET:
+        return list(default)
+    fields = [name.strip() for name in request.GET['fields'].split(',') if name.strip()]
+    unknown = [name for name in fields if name not in available]
+    if unknown:
+        raise BadRequest(f'Unknown field(s): {", ".join(unknown)}. Available: {", ".join(available)}')
+    return fields or list(default)
+
+
+def int_list(value, name, limit=MAX_LIMIT):
+    try:
+        values = [int(part) for part in value.split(',') if part.strip()]
+    except ValueError:
+        raise BadRequest(f'{name} must be a comma-separated list of integers')
+    if len(values) > limit:
+        raise BadRequest(f'At most {limit} {name} per request')
+    return values
+
+
+def page_limit(request):
+    try:
+        return min(max(int(request.GET.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+    except ValueError:
+        raise BadRequest('limit must be an integer')
+
+
+def select(queryset, available, fields, paged=False):
+    """``values()`` of the lookups behind ``fields``; cursor paging also needs created_at and id"""
+    lookups = {available[name] for name in fields}
+    if paged:
+        lookups |= {'id', 'created_at'}
+    return queryset.values(*lookups)
+
+
+def serialize(row, available, fields):
+    data = {name: row[available[name]] for name in fields}
+    if 'average_rating' in data:
+        data['average_rating'] = float(data['average_rating'])
+    if 'image' in data:
+        data['image'] = default_storage.url(data['image']) if data['image'] else None
+    return data
+
+
+def cursor_page(request, queryset, available, fields):
+    """One keyset page of a ``values()`` queryset, newest first, as a JSON-ready dict"""
+    page = CursorPaginator(queryset, page_limit(request)).get_page(request.GET.get('cursor'))
+    return {
+        'results': [serialize(row, available, fields) for row in page],
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor,
+    }
+
+
+@api_view
+@cache_anonymous_page(lambda: [LISTING])
+def recipe_list(request):
+    """Approved recipes, newest first; ``ids=`` returns those recipes instead, in the order given"""
+    fields = requested_fields(request, RECIPE_FIELDS, LIST_FIELDS)
+    recipes = Recipe.objects.approved()
+
+    if 'ids' in request.GET:
+        ids = int_list(request.GET['ids'], 'ids')
+        rows = {row['id']: row for row in select(recipes.filter(pk__in=ids), RECIPE_FIELDS, [*fields, 'id'])}
+        return JsonResponse({
+            'results': [serialize(rows[pk], RECIPE_FIELDS, fields) for pk in ids if pk in rows],
+            'missing': [pk for pk in ids if pk not in rows],
+        })
+
+    if request.GET.get('category'):
+        recipes = recipes.filter(category_id__in=int_list(request.GET['category'], 'category'))
+    if request.GET.get('author'):
+        recipes = recipes.filter(author__username=request.GET['author'])
+    return JsonResponse(cursor_page(request, select(recipes, RECIPE_FIELDS, fields, paged=True), RECIPE_FIELDS, fields))
+
+
+@api_view
+@cache_anonymous_page(lambda pk: [recipe_scope(pk)])
+def recipe_detail(request, pk):
+    """One approved recipe, with every field unless ``fields=`` says otherwise"""
+    fields = requested_fields(request, RECIPE_FIELDS, RECIPE_FIELDS)
+    row = select(Recipe.objects.approved().filter(pk=pk), RECIPE_FIELDS, fields).first()
+    if row is None:
+        return JsonResponse({'error': 'Recipe not found'}, status=404)
+    return JsonResponse(serialize(row, RECIPE_FIELDS, fields))
+
+
+def recipe_children(request, pk, model, available):
+    """Keyset page of the comments or ratings of an approved recipe"""
+    if not Recipe.objects.approved().filter(pk=pk).exists():
+        return JsonResponse({'error': 'Recipe not found'}, status=404)
+    fields = requested_fields(request, available, available)
+    rows = select(model.objects.filter(recipe_id=pk), available, fields, paged=True)
+    return JsonResponse(cursor_page(request, rows, available, fields))
+
+
+@api_view
+@cache_anonymous_page(lambda pk: [recipe_scope(pk)])
+def recipe_comments(request, pk):
+    """A recipe's comments, newest first"""
+    return recipe_children(request, pk, Comment, COMMENT_FIELDS)
+
+
+@api_view
+@cache_anonymous_page(lambda pk: [recipe_scope(pk)])
+def recipe_ratings(request, pk):
+    """A recipe's ratings, newest first"""
+    return recipe_children(request, pk, Rating, RATING_FIELDS)
+
+
+@api_view
+@cache_anonymous_page(lambda: [LISTING, CATEGORIES])
+def category_list(request):
+    """Every category with its recipe count"""
+    categories = cached_value(LISTING, 'api-categories', lambda: list(
+        Category.objects.with_recipe_counts().order_by('name').values('id', 'name', 'description', 'recipe_count')
+    ))
+    return JsonResponse({'results': categories})
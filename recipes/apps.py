@@ -5,3 +5,10 @@ class RecipesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipes'
 
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import signals  # noqa: F401  Register signal handlers
+        from .db import configure_sqlite
+
+        connection_created.connect(configure_sqlite, dispatch_uid='recipes.db.configure_sqlite')
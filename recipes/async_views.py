@@ -0,0 +1,172 @@
+"""
+Async versions of the read-heavy pages, routed instead of the sync views in
+``recipes.views`` when ``ASYNC_VIEWS`` is enabled and the site runs under ASGI.
+
+Django's async ORM methods still funnel through a single thread per request,
+so independent queries are run with ``concurrently``: each callable runs on a
+pooled worker thread holding its own database connection (kept for
+``CONN_MAX_AGE``), and they overlap on the database.
+Templates are synchronous and are rendered in a worker thread.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.models import User
+from django.db import close_old_connections
+from django.http import Http404
+from django.shortcuts import redirect, render
+
+from . import views
+from .cache import CATEGORIES, LISTING, cache_anonymous_page, get_generations, page_timeout, recipe_scope
+from .conditional import conditional_page, listing_validators, recipe_validators
+from .counters import count_views
+from .forms import CommentForm, RatingForm
+from .models import Rating, Recipe
+from .pagination import paginate
+
+
+_query_executor = None
+
+
+def get_query_executor():
+    """Threads for ``concurrently``, sized so in-flight requests don't queue behind each other"""
+    global _query_executor
+    if _query_executor is None:
+        _query_executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'ASYNC_QUERY_WORKERS', 16), thread_name_prefix='async-query'
+        )
+    return _query_executor
+
+
+def _with_own_connection(func):
+    def run():
+        # Like the request_started/request_finished handlers: the workers form a
+        # fixed pool, so each keeps its connection between jobs (like a
+        # connection pool) until it is broken or older than CONN_MAX_AGE
+        close_old_connections()
+        try:
+            return func()
+        finally:
+            close_old_connections()
+    return run
+
+
+async def concurrently(*funcs):
+    """Run sync callables that query the database in parallel and return their results"""
+    return await asyncio.gather(*[
+        sync_to_async(_with_own_connection(func), thread_sensitive=False, executor=get_query_executor())()
+        for func in funcs
+    ])
+
+
+async def resolve_user(request):
+    """Load the lazy ``request.user`` in a thread so async code can read it"""
+    def load():
+        request.user.is_authenticated  # Evaluates the lazy object (session + user query)
+        return request.user
+    return await sync_to_async(load)()
+
+
+def _materialize(page_obj):
+    """Evaluate a page's rows so the template never queries lazily"""
+    page_obj.object_list = list(page_obj.object_list)
+    return page_obj
+
+
+@conditional_page(listing_validators)
+@cache_anonymous_page(lambda: [LISTING, CATEGORIES])
+async def home(request):
+    """Homepage; the recipe page and the category strip are fetched concurrently"""
+    await resolve_user(request)
+
+    def recipe_page():
+        recipes, search_query, category_id, user_filter, facets = views.home_recipes(request)
+        page_obj = _materialize(paginate(
+            request, recipes, 9, ordered_by_date=views.by_date(request, search_query), count=facets.total,
+        ))
+        return page_obj, search_query, category_id, user_filter, facets
+
+    (page_obj, search_query, category_id, user_filter, facets), categories, generations = await concurrently(
+        recipe_page, views.home_categories, lambda: get_generations(LISTING, CATEGORIES),
+    )
+
+    context = {
+        'page_obj': page_obj,
+        'categories': categories,
+        'search_query': search_query,
+        'selected_category': category_id,
+        'user_filter': user_filter,
+        'cache_generation': '-'.join(map(str, generations)),
+        'cache_timeout': page_timeout(),
+        **views.facet_context(facets, categories),
+    }
+    return await sync_to_async(render)(request, 'recipes/home.html', context)
+
+
+@count_views
+@conditional_page(recipe_validators)
+@cache_anonymous_page(lambda pk: [recipe_scope(pk), CATEGORIES])
+async def recipe_detail(request, pk):
+    """Recipe page; the recipe, its first comments, the user's rating and the recommendations are fetched concurrently"""
+    if request.method == 'POST':
+        return await sync_to_async(views.recipe_detail)(request, pk=pk)
+
+    user = await resolve_user(request)
+
+    def get_recipe():
+        return Recipe.objects.select_related('author', 'category').filter(pk=pk).first()
+
+    def get_user_rating():
+        if not user.is_authenticated:
+            return None
+        return Rating.objects.filter(recipe_id=pk, user=user).first()
+
+    recipe, comments, user_rating, recommendations = await concurrently(
+        get_recipe, lambda: views.comment_page(pk), get_user_rating,
+        lambda: list(Recipe.objects.recommended_for(pk).for_listing()),
+    )
+    if recipe is None:
+        raise Http404('No Recipe matches the given query.')
+
+    # Only show approved recipes to non-admin users
+    if not user.is_staff and recipe.status != 'approved':
+        await sync_to_async(messages.error)(request, 'This recipe is not available.')
+        return redirect('home')
+
+    context = {
+        'recipe': recipe,
+        'comments': comments,
+        'comment_form': CommentForm(),
+        'rating_form': RatingForm(),
+        'user_rating': user_rating,
+        'recommendations': recommendations,
+    }
+    return await sync_to_async(render)(request, 'recipes/recipe_detail.html', context)
+
+
+async def user_profile(request, username):
+    """Profile page; the stats row gives the page count, so the recipe page follows it directly"""
+    user = await resolve_user(request)
+    try:
+        profile_user = await User.objects.aget(username=username)
+    except User.DoesNotExist:
+        raise Http404('No User matches the given query.')
+
+    def recipe_page():
+        recipes, total_recipes, stats = views.profile_recipes(user, profile_user)
+        page_obj = _materialize(paginate(request, recipes.for_listing(), 12, count=total_recipes))
+        return page_obj, total_recipes, stats
+
+    page_obj, total_recipes, stats = await sync_to_async(recipe_page)()
+
+    context = {
+        'profile_user': profile_user,
+        'page_obj': page_obj,
+        'total_recipes': total_recipes,
+        'approved_recipes': stats.approved_recipes,
+        'avg_rating': views.profile_average_rating(user, profile_user, stats),
+    }
+    return await sync_to_async(render)(request, 'recipes/user_profile.html', context)
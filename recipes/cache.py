@@ -0,0 +1,180 @@
+"""
+Caching for the public recipe pages.
+
+Rendered pages for anonymous visitors and the category list are stored in the
+cache configured by ``RECIPE_CACHE_ALIAS``. Keys embed a generation number per
+scope ("listing", "categories", "recipe:<pk>"); the signal handlers in
+``recipes.signals`` bump the generations a change affects, so stale entries are
+never read again and simply age out through the backend's TTL and eviction.
+"""
+import asyncio
+import hashlib
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import caches
+from django.http import HttpResponse
+
+from .routers import read_from_replica
+
+KEY_PREFIX = 'recipes'
+STATS_KEYS = {'hits': f'{KEY_PREFIX}:stats:hits', 'misses': f'{KEY_PREFIX}:stats:misses'}
+
+LISTING = 'listing'
+CATEGORIES = 'categories'
+# Recipe ingredients and statuses, read by the in-process ingredient index
+INGREDIENTS = 'ingredients'
+# Bumped when the in-process suggestion index has to be rebuilt rather than caught up
+SUGGESTIONS = 'suggestions'
+
+
+def recipe_scope(pk):
+    return f'recipe:{pk}'
+
+
+def get_cache():
+    return caches[getattr(settings, 'RECIPE_CACHE_ALIAS', 'default')]
+
+
+def page_timeout():
+    return getattr(settings, 'RECIPE_PAGE_CACHE_TIMEOUT', 300)
+
+
+def _generation_key(scope):
+    return f'{KEY_PREFIX}:gen:{scope}'
+
+
+def get_generations(*scopes):
+    """Return the current generation of each scope, starting new scopes at 1"""
+    cache = get_cache()
+    keys = [_generation_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    missing = {key: 1 for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        found.update(missing)
+    return [found[key] for key in keys]
+
+
+def invalidate(*scopes):
+    """Bump the generation of each scope so entries built from it are no longer read"""
+    cache = get_cache()
+    for scope in scopes:
+        key = _generation_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 2, timeout=None)
+
+
+def invalidate_recipes(recipe_ids):
+    """Invalidate the listings and the detail pages of the given recipes"""
+    invalidate(LISTING, *[recipe_scope(pk) for pk in recipe_ids])
+
+
+def _count(stat):
+    cache = get_cache()
+    try:
+        cache.incr(STATS_KEYS[stat])
+    except ValueError:
+        # Missing or evicted counter; restart it rather than fail the request
+        cache.set(STATS_KEYS[stat], 1, timeout=None)
+
+
+def cache_stats():
+    """Return shared hit/miss counters for the page and queryset caches"""
+    values = get_cache().get_many(STATS_KEYS.values())
+    hits = values.get(STATS_KEYS['hits'], 0)
+    misses = values.get(STATS_KEYS['misses'], 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else 0.0,
+    }
+
+
+def cached_value(scope, name, builder):
+    """Return ``builder()`` cached under ``name`` for the current generation of ``scope``"""
+    cache = get_cache()
+    generation, = get_generations(scope)
+    key = f'{KEY_PREFIX}:value:{scope}:{generation}:{name}'
+    value = cache.get(key)
+    if value is None:
+        _count('misses')
+        value = builder()
+        # A lagging replica's value would outlive the generation it was read for
+        if not read_from_replica():
+            cache.set(key, value, page_timeout())
+    else:
+        _count('hits')
+    return value
+
+
+def is_cacheable_request(request):
+    if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+        return False
+    # A pending flash message would be baked into the page and never consumed
+    return len(get_messages(request)) == 0
+
+
+def _page_key(request, view_name, scopes):
+    generations = get_generations(*scopes)
+    query = sorted(request.GET.lists())
+    digest = hashlib.md5(f'{request.path}?{query}'.encode(), usedforsecurity=False).hexdigest()
+    return f'{KEY_PREFIX}:page:{view_name}:{"-".join(map(str, generations))}:{digest}'
+
+
+def _lookup_page(request, view_name, scopes):
+    """Return ``(key, cached response)``; the key is None when the request must not be cached"""
+    if not is_cacheable_request(request):
+        return None, None
+    key = _page_key(request, view_name, scopes)
+    cached = get_cache().get(key)
+    if cached is None:
+        _count('misses')
+        return key, None
+    _count('hits')
+    content, content_type = cached
+    return key, HttpResponse(content, content_type=content_type)
+
+
+def _store_page(request, key, response):
+    if (key is not None and response.status_code == 200 and not response.streaming
+            and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE') and not read_from_replica()):
+        get_cache().set(key, (response.content, response['Content-Type']), page_timeout())
+
+
+def cache_anonymous_page(scopes):
+    """
+    Cache the rendered response for anonymous GET requests.
+
+    ``scopes`` receives the view kwargs and returns the scopes the page is built
+    from; the page key combines their generations with the query string.
+    Works for both sync and async views.
+    """
+    def decorator(view_func):
+        if asyncio.iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                key, cached = await sync_to_async(_lookup_page)(request, view_func.__name__, scopes(**kwargs))
+                if cached is not None:
+                    return cached
+                response = await view_func(request, *args, **kwargs)
+                await sync_to_async(_store_page)(request, key, response)
+                return response
+            return async_wrapper
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            key, cached = _lookup_page(request, view_func.__name__, scopes(**kwargs))
+            if cached is not None:
+                return cached
+            response = view_func(request, *args, **kwargs)
+            _store_page(request, key, response)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,148 @@
+"""
+HTTP conditional GET for the public pages and for uploaded media.
+
+``conditional_page(validators)`` gives responses to anonymous GET and HEAD
+requests an ETag and a Last-Modified header. ``validators`` receives the view
+kwargs and returns ``(parts, last_modified)``: the ETag hashes ``parts``
+(database timestamps and counters and/or the cache generations of the page's
+scopes) together with the query string. A request whose If-None-Match or
+If-Modified-Since still matches is answered 304 before the page cache or the
+view runs, so a browser or CDN revalidation costs at most one small indexed
+query.
+
+``serve_media`` serves uploads in development with an ETag next to Django's
+Last-Modified, and marks image variants requested with their fingerprint
+(``images.VARIANT_VERSION``) as cacheable for a year.
+"""
+import asyncio
+import hashlib
+import os
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.db.models import OuterRef, Subquery
+from django.http import Http404
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control, quote_etag
+from django.utils.http import http_date
+from django.views.static import serve
+
+from .cache import CATEGORIES, LISTING, get_generations, is_cacheable_request, recipe_scope
+from .images import VARIANT_VERSION
+from .models import Comment, Rating, Recipe, RecipeRecommendation
+
+
+def latest(*timestamps):
+    return max((timestamp for timestamp in timestamps if timestamp is not None), default=None)
+
+
+def recipe_validators(pk):
+    """Validators of an approved recipe's page; None for other recipes"""
+    row = Recipe.objects.filter(pk=pk, status='approved').annotate(
+        last_comment=Subquery(
+            Comment.objects.filter(recipe=OuterRef('pk')).order_by('-created_at').values('created_at')[:1]
+        ),
+        last_rating=Subquery(
+            Rating.objects.filter(recipe=OuterRef('pk')).order_by('-updated_at').values('updated_at')[:1]
+        ),
+        # Rebuilt recommendations get new rows
+        last_recommendation=Subquery(
+            RecipeRecommendation.objects.filter(recipe=OuterRef('pk')).order_by('-pk').values('pk')[:1]
+        ),
+    ).values_list(
+        'updated_at', 'last_comment', 'last_rating', 'rating_sum', 'rating_count', 'comment_count',
+        'last_recommendation',
+    ).first()
+    if row is None:
+        return None
+    # Deletions leave no timestamp; the counters and generations catch them
+    return [*row, *get_generations(recipe_scope(pk), CATEGORIES)], latest(*row[:3])
+
+
+def listing_validators():
+    """
+    Validators of the home listing: the generations its page cache is keyed
+    on, so revalidating costs no query. There is no Last-Modified.
+    """
+    return get_generations(LISTING, CATEGORIES), None
+
+
+def _conditional(request, validators, kwargs):
+    """Return ``(etag, last modified timestamp)``, or None when the request gets no validators"""
+    if not is_cacheable_request(request):
+        return None
+    found = validators(**kwargs)
+    if found is None:
+        return None
+    parts, last_modified = found
+    query = sorted(request.GET.lists())
+    digest = hashlib.md5(f'{parts}{request.path}?{query}'.encode(), usedforsecurity=False).hexdigest()
+    return quote_etag(digest), int(last_modified.timestamp()) if last_modified else None
+
+
+def _not_modified(request, validated):
+    etag, last_modified = validated
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        _set_validators(response, validated)
+    return response
+
+
+def _set_validators(response, validated):
+    etag, last_modified = validated
+    if response.status_code in (200, 304):
+        response.headers.setdefault('ETag', etag)
+        if last_modified is not None:
+            response.headers.setdefault('Last-Modified', http_date(last_modified))
+        # Stored by browsers and CDNs, but revalidated on every use
+        patch_cache_control(response, no_cache=True)
+    return response
+
+
+def conditional_page(validators):
+    """Answer anonymous revalidations with 304; see the module docstring. Works for sync and async views."""
+    def decorator(view_func):
+        if asyncio.iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                validated = await sync_to_async(_conditional)(request, validators, kwargs)
+                if validated is None:
+                    return await view_func(request, *args, **kwargs)
+                response = _not_modified(request, validated)
+                if response is None:
+                    response = _set_validators(await view_func(request, *args, **kwargs), validated)
+                return response
+            return async_wrapper
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            validated = _conditional(request, validators, kwargs)
+            if validated is None:
+                return view_func(request, *args, **kwargs)
+            response = _not_modified(request, validated)
+            if response is None:
+                response = _set_validators(view_func(request, *args, **kwargs), validated)
+            return response
+        return wrapper
+    return decorator
+
+
+def serve_media(request, path):
+    """Uploaded media (development server only), with validators and long caching of fingerprinted variants"""
+    try:
+        stat = os.stat(safe_join(settings.MEDIA_ROOT, path))
+    except (OSError, SuspiciousFileOperation):
+        raise Http404('"%s" does not exist' % path)
+    etag = quote_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    response.headers.setdefault('ETag', etag)
+    if '/variants/' in f'/{path}' and request.GET.get('v') == VARIANT_VERSION:
+        patch_cache_control(response, public=True, max_age=365 * 24 * 60 * 60, immutable=True)
+    else:
+        patch_cache_control(response, no_cache=True)
+    return response
@@ -0,0 +1,139 @@
+"""
+Recipe view counts, buffered in process memory and written behind.
+
+``count_views`` records a view for every GET of a recipe page that is
+answered with the page (200) or a revalidation (304), cached or not. Views
+only go into a per-process ``{recipe id: views}`` buffer; a background thread
+adds the buffer to ``Recipe.view_count`` every ``VIEW_COUNT_FLUSH_SECONDS``,
+or as soon as ``VIEW_COUNT_FLUSH_THRESHOLD`` views are pending, with one
+``UPDATE ... SET view_count = view_count + CASE id WHEN ... END`` per
+``FLUSH_BATCH_SIZE`` recipes. The request path never writes to the database.
+
+A crash loses at most the views of one interval (a clean shutdown flushes
+them). The stored counts lag the real ones by at most one interval, and the
+counts shown on cached pages by at most the page cache timeout on top. The
+recipe page's ETag leaves the count out, so a flush alone doesn't turn
+revalidations into full pages; a revalidated copy shows its count until the
+recipe next changes.
+"""
+import asyncio
+import atexit
+import logging
+import threading
+from collections import Counter
+from functools import wraps
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+# Recipes per UPDATE; keeps the statement's parameters under SQLite's limit
+FLUSH_BATCH_SIZE = 300
+
+
+def flush_interval():
+    return getattr(settings, 'VIEW_COUNT_FLUSH_SECONDS', 10)
+
+
+class ViewCounter:
+    """Per-process buffer of view increments with a flushing thread"""
+
+    def __init__(self):
+        self.pending = Counter()
+        self.pending_total = 0
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+
+    def add(self, recipe_id, views=1):
+        with self.lock:
+            self.pending[recipe_id] += views
+            self.pending_total += views
+            total = self.pending_total
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='view-counter', daemon=True)
+                self.thread.start()
+        if total >= getattr(settings, 'VIEW_COUNT_FLUSH_THRESHOLD', 1000):
+            self.wake.set()
+
+    def run(self):
+        while True:
+            self.wake.wait(flush_interval())
+            self.wake.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            except DatabaseError:
+                # The views stay pending until the next interval
+                logger.exception('Flushing recipe view counts failed')
+
+    def flush(self):
+        """Write the pending views to the database; returns the number of recipes updated"""
+        with self.lock:
+            batch, self.pending = self.pending, Counter()
+            self.pending_total = 0
+        if not batch:
+            return 0
+        items = sorted(batch.items())  # A fixed order, so concurrent flushes lock rows alike
+        try:
+            with transaction.atomic():
+                for start in range(0, len(items), FLUSH_BATCH_SIZE):
+                    chunk = items[start:start + FLUSH_BATCH_SIZE]
+                    increments = Case(
+                        *[When(pk=pk, then=Value(views)) for pk, views in chunk],
+                        default=Value(0),
+                        output_field=IntegerField(),
+                    )
+                    Recipe.objects.filter(pk__in=[pk for pk, _ in chunk]).update(
+                        view_count=F('view_count') + increments
+                    )
+        except DatabaseError:
+            # Keep the views for the next flush rather than drop them
+            with self.lock:
+                self.pending.update(batch)
+                self.pending_total += sum(batch.values())
+            raise
+        return len(items)
+
+
+_counter = None
+_counter_lock = threading.Lock()
+
+
+def get_view_counter():
+    """The process-wide counter, flushed at exit"""
+    global _counter
+    if _counter is None:
+        with _counter_lock:
+            if _counter is None:
+                _counter = ViewCounter()
+                atexit.register(_counter.flush)
+    return _counter
+
+
+def _is_view(request, response):
+    return request.method == 'GET' and response.status_code in (200, 304)
+
+
+def count_views(view_func):
+    """Count a view of recipe ``pk`` for each page served; works for sync and async views"""
+    if asyncio.iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def async_wrapper(request, pk, *args, **kwargs):
+            response = await view_func(request, *args, pk=pk, **kwargs)
+            if _is_view(request, response):
+                get_view_counter().add(pk)
+            return response
+        return async_wrapper
+
+    @wraps(view_func)
+    def wrapper(request, pk, *args, **kwargs):
+        response = view_func(request, *args, pk=pk, **kwargs)
+        if _is_view(request, response):
+            get_view_counter().add(pk)
+        return response
+    return wrapper
@@ -0,0 +1,21 @@
+"""
+Per-connection database setup.
+
+``configure_sqlite`` runs on ``connection_created`` and applies
+``SQLITE_PRAGMAS`` (set by ``DATABASE_PROFILE = 'production'``) to every new
+SQLite connection; most of them only last as long as the connection, so they
+cannot be set once in the database file.
+"""
+from django.conf import settings
+
+
+def apply_sqlite_pragmas(cursor, pragmas):
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if connection.vendor == 'sqlite' and pragmas:
+        with connection.cursor() as cursor:
+            apply_sqlite_pragmas(cursor, pragmas)
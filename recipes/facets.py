@@ -0,0 +1,168 @@
+"""
+Faceted browsing of the home listing.
+
+Besides the category, the listing can be narrowed to a range of total time
+(prep + cook, stored in the indexed ``Recipe.total_time``), a minimum average
+rating and a range of servings. Each range facet offers fixed options, and
+their boundaries cut the values into cells, so one grouped query counts the
+recipes of the current search per (category, time cell, rating cell,
+servings cell). Every count the filter panel shows is added up from those rows
+in Python: an option's count applies all the *other* selected filters, i.e.
+it is the number of results the listing would have with that option chosen.
+
+Anonymous listings share the grouped counts of a search through the cache
+(under the listing generation), so switching filters costs no counting query
+at all, and the total of the selected cells is handed to the paginator instead
+of a COUNT.
+"""
+import hashlib
+
+from django.db.models import Case, Count, IntegerField, Q, Value, When
+
+from .cache import LISTING, cached_value
+
+
+class Facet:
+    """A filter on ``field`` with options ``(key, label, minimum, maximum)``: minimum <= value < maximum"""
+
+    def __init__(self, name, field, empty_label, options):
+        self.name = name
+        self.field = field
+        self.empty_label = empty_label
+        self.options = options
+        bounds = sorted({bound for _, _, *range_ in options for bound in range_ if bound is not None})
+        self.cells = list(zip([None, *bounds], [*bounds, None]))
+
+    def option(self, key):
+        return next((option for option in self.options if option[0] == key), None)
+
+    def filter(self, option):
+        _, _, minimum, maximum = option
+        q = Q()
+        if minimum is not None:
+            q &= Q(**{f'{self.field}__gte': minimum})
+        if maximum is not None:
+            q &= Q(**{f'{self.field}__lt': maximum})
+        return q
+
+    def cell(self):
+        """SQL expression numbering the cell ``field`` falls in"""
+        return Case(
+            *[When(**{f'{self.field}__lt': maximum}, then=Value(index))
+              for index, (_, maximum) in enumerate(self.cells[:-1])],
+            default=Value(len(self.cells) - 1),
+            output_field=IntegerField(),
+        )
+
+    def covers(self, option, cell):
+        """True when every value of cell number ``cell`` is within ``option``"""
+        _, _, minimum, maximum = option
+        low, high = self.cells[cell]
+        return ((minimum is None or (low is not None and low >= minimum))
+                and (maximum is None or (high is not None and high <= maximum)))
+
+
+FACETS = [
+    Facet('time', 'total_time', '⏱️ Any Total Time', [
+        ('under-15', 'Under 15 min', None, 15),
+        ('15-30', '15-30 min', 15, 30),
+        ('30-60', '30-60 min', 30, 60),
+        ('60-120', '1-2 hours', 60, 120),
+        ('over-120', 'Over 2 hours', 120, None),
+    ]),
+    Facet('rating', 'average_rating', '⭐ Any Rating', [
+        ('4', '4+ stars', 4, None),
+        ('3', '3+ stars', 3, None),
+        ('2', '2+ stars', 2, None),
+        ('1', '1+ stars', 1, None),
+    ]),
+    Facet('servings', 'servings', '🍽️ Any Servings', [
+        ('1-2', '1-2 servings', 1, 3),
+        ('3-4', '3-4 servings', 3, 5),
+        ('5-8', '5-8 servings', 5, 9),
+        ('9-plus', '9+ servings', 9, None),
+    ]),
+]
+
+
+def selected_options(query):
+    """``{facet name: option}`` of the valid facet parameters in ``query``"""
+    selected = {}
+    for facet in FACETS:
+        option = facet.option(query.get(facet.name, ''))
+        if option is not None:
+            selected[facet.name] = option
+    return selected
+
+
+def apply_facets(queryset, selected):
+    for facet in FACETS:
+        if facet.name in selected:
+            queryset = queryset.filter(facet.filter(selected[facet.name]))
+    return queryset
+
+
+def count_cells(queryset):
+    """``[(category id, time cell, rating cell, servings cell, count)]`` of ``queryset`` in one grouped query"""
+    cells = {f'{facet.name}_cell': facet.cell() for facet in FACETS}
+    rows = queryset.order_by().annotate(**cells).values('category_id', *cells).annotate(count=Count('pk'))
+    return [(row['category_id'], *(row[name] for name in cells), row['count']) for row in rows]
+
+
+class FacetCounts:
+    """Counts of every category and facet option for the current selection"""
+
+    def __init__(self, rows, category_id, selected):
+        self.rows = rows
+        self.category_id = category_id
+        self.selected = selected
+
+    def matches(self, row, skip=None):
+        """True when ``row`` passes every selected filter except ``skip``"""
+        if skip != 'category' and self.category_id and row[0] != self.category_id:
+            return False
+        return all(
+            facet.covers(self.selected[facet.name], row[position])
+            for position, facet in enumerate(FACETS, start=1)
+            if facet.name != skip and facet.name in self.selected
+        )
+
+    @property
+    def total(self):
+        """Number of recipes the listing shows"""
+        return sum(row[-1] for row in self.rows if self.matches(row))
+
+    def categories(self):
+        """``{category id: count}`` with the category filter left out"""
+        counts = {}
+        for row in self.rows:
+            if self.matches(row, skip='category'):
+                counts[row[0]] = counts.get(row[0], 0) + row[-1]
+        return counts
+
+    def facets(self):
+        """``[(facet, [(key, label, count, selected)])]`` for the filter panel"""
+        panel = []
+        for position, facet in enumerate(FACETS, start=1):
+            rows = [row for row in self.rows if self.matches(row, skip=facet.name)]
+            options = []
+            for option in facet.options:
+                count = sum(row[-1] for row in rows if facet.covers(option, row[position]))
+                options.append((option[0], option[1], count, self.selected.get(facet.name) == option))
+            panel.append((facet, options))
+        return panel
+
+
+def facet_counts(queryset, category_id, selected, cache_key=None):
+    """
+    ``FacetCounts`` of ``queryset`` (the listing before its category and facet
+    filters). With ``cache_key`` the grouped rows are shared through the cache
+    by every request with the same key until the listings change.
+    """
+    category_id = int(category_id) if str(category_id).isdigit() else None
+    if cache_key is None:
+        rows = count_cells(queryset)
+    else:
+        digest = hashlib.md5(cache_key.encode(), usedforsecurity=False).hexdigest()
+        rows = cached_value(LISTING, f'facets:{digest}', lambda: count_cells(queryset))
+    return FacetCounts(rows, category_id, selected)
@@ -0,0 +1,207 @@
+"""
+Image pipeline for uploaded recipe images and avatars.
+
+Every original gets resized WebP and JPEG variants (see ``VARIANTS``) written
+next to it under ``variants/``, with a small JSON manifest of their real
+widths for the srcset. The variants are re-encoded from pixel data only, so
+EXIF metadata (camera, GPS position) never reaches visitors.
+Processing runs in a thread or process pool after the upload's transaction
+commits, never inside the request.
+
+Pages look up the processed variants and their widths with
+``processed_widths``, which reads the cache (filled when processing finishes)
+rather than the storage, so a listing of N images costs no storage round trips.
+"""
+import hashlib
+import json
+import logging
+import posixpath
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from .cache import KEY_PREFIX, get_cache
+
+logger = logging.getLogger(__name__)
+
+# Variant name -> longest edge in pixels
+VARIANTS = {
+    'thumb': 320,
+    'card': 640,
+    'detail': 1280,
+}
+AVATAR_VARIANTS = ('thumb',)
+# Layout width hints for the srcset each variant is the largest candidate of
+SIZES = {
+    'thumb': '160px',
+    'card': '(min-width: 992px) 33vw, (min-width: 768px) 50vw, 100vw',
+    'detail': '(min-width: 992px) 50vw, 100vw',
+}
+FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+}
+
+# Part of every variant URL: it changes with the sizes and encodings, and an
+# original is never overwritten in place, so variant URLs can be cached forever
+VARIANT_VERSION = hashlib.md5(repr((VARIANTS, FORMATS)).encode(), usedforsecurity=False).hexdigest()[:10]
+
+# Seconds an image is remembered as (partly) unprocessed before the storage is checked again
+UNPROCESSED_TIMEOUT = 60
+
+_executor = None
+
+
+def variant_name(name, variant, extension):
+    """Storage name of one variant of the original stored at ``name``"""
+    directory, filename = posixpath.split(name)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(directory, 'variants', f'{stem}-{variant}.{extension}')
+
+
+def manifest_name(name):
+    """Storage name of the manifest of the variants' widths"""
+    directory, filename = posixpath.split(name)
+    return posixpath.join(directory, 'variants', f'{posixpath.splitext(filename)[0]}.json')
+
+
+def versioned_url(name, variant, extension):
+    """Fingerprinted URL of one variant"""
+    return f'{default_storage.url(variant_name(name, variant, extension))}?v={VARIANT_VERSION}'
+
+
+def has_variants(name, variants=('card',)):
+    return all(default_storage.exists(variant_name(name, v, 'jpg')) for v in variants)
+
+
+def process_image(name, variants=tuple(VARIANTS), force=False):
+    """Write every missing variant of the original at ``name``; returns how many were written"""
+    if not force and has_variants(name, variants):
+        return 0
+    with default_storage.open(name, 'rb') as original:
+        image = Image.open(original)
+        # Apply the EXIF orientation to the pixels before the metadata is dropped
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGB')
+
+    written = 0
+    widths = {}
+    for variant in variants:
+        resized = image.copy()
+        resized.thumbnail((VARIANTS[variant], VARIANTS[variant]), Image.LANCZOS)
+        widths[variant] = resized.width
+        for extension, save_options in FORMATS.items():
+            buffer = BytesIO()
+            resized.save(buffer, **save_options)
+            _replace(variant_name(name, variant, extension), buffer.getvalue())
+            written += 1
+    _replace(manifest_name(name), json.dumps(widths).encode())
+    return written
+
+
+def _replace(target, content):
+    if default_storage.exists(target):
+        default_storage.delete(target)
+    default_storage.save(target, ContentFile(content))
+
+
+def _widths_key(name):
+    digest = hashlib.md5(name.encode(), usedforsecurity=False).hexdigest()
+    return f'{KEY_PREFIX}:images:{VARIANT_VERSION}:{digest}'
+
+
+def _stored_widths(name):
+    """
+    ``({variant: width}, complete)`` of the variants in storage. Variants
+    written before the manifest existed, or while the original is still being
+    processed, are measured from their file header.
+    """
+    try:
+        with default_storage.open(manifest_name(name)) as manifest:
+            return json.load(manifest), True
+    except (OSError, ValueError):
+        pass
+    widths = {}
+    for variant in VARIANTS:
+        try:
+            with default_storage.open(variant_name(name, variant, 'jpg'), 'rb') as file:
+                widths[variant] = Image.open(file).width
+        except OSError:
+            continue
+    return widths, False
+
+
+def remember_variants(name):
+    """Cache the processed variants of ``name``, e.g. once processing finished"""
+    widths, complete = _stored_widths(name)
+    get_cache().set(_widths_key(name), widths, None if complete else UNPROCESSED_TIMEOUT)
+    return widths
+
+
+def processed_widths(name):
+    """
+    ``{variant: width in pixels}`` of the processed variants of the original at
+    ``name``; empty until it is processed. Portrait and small originals give
+    variants narrower than their ``VARIANTS`` bound.
+    """
+    widths = get_cache().get(_widths_key(name))
+    if widths is None:
+        widths = remember_variants(name)
+    return widths
+
+
+def delete_variants(name):
+    """Remove every variant of the original at ``name``, e.g. once it was replaced"""
+    targets = [variant_name(name, variant, extension) for variant in VARIANTS for extension in FORMATS]
+    for target in [*targets, manifest_name(name)]:
+        if default_storage.exists(target):
+            default_storage.delete(target)
+    get_cache().delete(_widths_key(name))
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        workers = getattr(settings, 'IMAGE_PROCESSING_WORKERS', 2)
+        if getattr(settings, 'IMAGE_PROCESSING_MODE', 'thread') == 'process':
+            _executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='images')
+    return _executor
+
+
+def _log_failure(name):
+    def callback(future):
+        if future.exception() is not None:
+            logger.error('Processing image %s failed', name, exc_info=future.exception())
+    return callback
+
+
+def schedule_processing(name, variants=tuple(VARIANTS), on_done=None):
+    """
+    Process ``name`` in the background once the current transaction commits.
+
+    Once the variants are written, the scheduling process caches them for
+    ``processed_widths`` and calls ``on_done`` without arguments (e.g. to
+    invalidate cached pages).
+    """
+    def finished():
+        remember_variants(name)
+        if on_done is not None:
+            on_done()
+
+    def submit():
+        if getattr(settings, 'IMAGE_PROCESSING_MODE', 'thread') == 'sync':
+            process_image(name, variants)
+            finished()
+            return
+        future = get_executor().submit(process_image, name, variants)
+        future.add_done_callback(_log_failure(name))
+        future.add_done_callback(lambda f: f.exception() is None and finished())
+
+    transaction.on_commit(submit)
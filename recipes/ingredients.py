@@ -0,0 +1,266 @@
+"""
+"What can I cook with these?" search.
+
+Every recipe's parsed ingredient items are reduced to vocabulary names
+(``Ingredient``) and linked through ``RecipeIngredient``, the ingredient ->
+recipes inverted index kept in the database.
+
+``IngredientIndex`` loads that index into memory for the approved recipes.
+Each recipe gets a slot (newest first) and each ingredient's posting list is a
+bitmap over the slots, held in a Python int so that unions and intersections
+run word-at-a-time in C. Frequent ingredients keep their bitmap; rare ones keep
+an array of slots and get a bitmap on demand, which bounds memory at roughly
+one bit per slot per frequent ingredient plus four bytes per rare posting.
+
+A query adds up the bitmaps of the user's ingredients in bit-sliced counters
+(one bitmap per bit of "how many of my ingredients does the recipe use"), so
+ranking by coverage needs no per-recipe work except for the page returned.
+"""
+import threading
+import time
+from array import array
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from .cache import INGREDIENTS, get_generations, invalidate
+from .models import Ingredient, Recipe, RecipeIngredient
+from .parsing import normalize_ingredient
+
+# Ingredients in at least 1/DENSE_FRACTION of the recipes keep a ready-made bitmap
+DENSE_FRACTION = 32
+
+
+def ingredient_names(items):
+    """Distinct vocabulary names of a recipe's parsed ``ingredient_items``"""
+    return {name for name in (normalize_ingredient(item['item']) for item in items) if name}
+
+
+def link_ingredients(recipes):
+    """Replace the inverted index rows of ``recipes`` from their parsed ingredients"""
+    names = {recipe.pk: ingredient_names(recipe.ingredient_items) for recipe in recipes}
+    vocabulary = set().union(*names.values())
+    with transaction.atomic():
+        Ingredient.objects.bulk_create(
+            [Ingredient(name=name) for name in vocabulary], batch_size=500, ignore_conflicts=True
+        )
+        ids = dict(Ingredient.objects.filter(name__in=vocabulary).values_list('name', 'pk'))
+        RecipeIngredient.objects.filter(recipe_id__in=list(names)).delete()
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe_id=pk, ingredient_id=ids[name])
+            for pk, recipe_names in names.items()
+            for name in recipe_names
+        ], batch_size=1000)
+    invalidate(INGREDIENTS)
+
+
+def rebuild_ingredient_links(batch_size=1000):
+    """Relink every recipe and drop unused vocabulary; returns (recipes, ingredients)"""
+    recipes = Recipe.objects.only('pk', 'ingredient_items').order_by('pk')
+    batch = []
+    count = 0
+    for recipe in recipes.iterator(chunk_size=batch_size):
+        batch.append(recipe)
+        if len(batch) == batch_size:
+            link_ingredients(batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        link_ingredients(batch)
+        count += len(batch)
+    Ingredient.objects.filter(recipe_links__isnull=True).delete()
+    return count, Ingredient.objects.count()
+
+
+def bitmap(slots):
+    """Int bitmap with the bits of ``slots`` set"""
+    if not slots:
+        return 0
+    data = bytearray(max(slots) // 8 + 1)
+    for slot in slots:
+        data[slot >> 3] |= 1 << (slot & 7)
+    return int.from_bytes(data, 'little')
+
+
+def bit_positions(bits):
+    """Set bit positions of ``bits``, lowest first"""
+    while bits:
+        lowest = bits & -bits
+        yield lowest.bit_length() - 1
+        bits ^= lowest
+
+
+class IngredientIndex:
+    """Bitmaps of the approved recipes using each ingredient, and of the recipes by ingredient count"""
+
+    def __init__(self, recipe_ids, postings, names):
+        self.recipe_ids = recipe_ids
+        self.names = names  # vocabulary name -> ingredient id
+        self.dense = {}
+        self.sparse = {}
+        totals = defaultdict(int)
+        for ingredient_id, slots in postings.items():
+            if len(slots) * DENSE_FRACTION >= len(recipe_ids):
+                self.dense[ingredient_id] = bitmap(slots)
+            else:
+                self.sparse[ingredient_id] = array('I', sorted(slots))
+            for slot in slots:
+                totals[slot] += 1
+        by_total = defaultdict(list)
+        for slot, total in totals.items():
+            by_total[total].append(slot)
+        # Ingredient count -> bitmap of the recipes with that many ingredients
+        self.by_total = {total: bitmap(slots) for total, slots in by_total.items()}
+
+    @classmethod
+    def build(cls):
+        recipe_ids = list(Recipe.objects.approved().order_by('-created_at', '-id').values_list('pk', flat=True))
+        slots = {pk: slot for slot, pk in enumerate(recipe_ids)}
+        postings = defaultdict(list)
+        links = RecipeIngredient.objects.filter(recipe__status='approved').values_list('ingredient_id', 'recipe_id')
+        for ingredient_id, recipe_id in links.iterator(chunk_size=10000):
+            if recipe_id in slots:  # Approved after the first query
+                postings[ingredient_id].append(slots[recipe_id])
+        names = dict(Ingredient.objects.filter(pk__in=list(postings)).values_list('name', 'pk'))
+        return cls(recipe_ids, postings, names)
+
+    def __len__(self):
+        return len(self.recipe_ids)
+
+    def postings(self, ingredient_id):
+        if ingredient_id in self.dense:
+            return self.dense[ingredient_id]
+        return bitmap(self.sparse.get(ingredient_id, ()))
+
+    def resolve(self, names):
+        """Split the user's ingredient names into ``({name: ingredient id}, [unknown names])``"""
+        known, unknown = {}, []
+        for raw in names:
+            name = normalize_ingredient(raw)
+            if name in self.names:
+                known[name] = self.names[name]
+            elif raw.strip():
+                unknown.append(raw.strip())
+        return known, unknown
+
+    def search(self, ingredient_ids, offset=0, limit=20):
+        """
+        Rank the recipes using any of ``ingredient_ids`` by the share of their
+        ingredients covered, then by how many are covered, newest first.
+
+        Returns ``(total, [(recipe id, covered, ingredient count)])`` for the
+        requested slice.
+        """
+        ingredient_ids = set(ingredient_ids)
+        counters = []  # counters[i]: recipes whose covered count has bit i set
+        matching = 0
+        for ingredient_id in ingredient_ids:
+            carry = self.postings(ingredient_id)
+            matching |= carry
+            for i, plane in enumerate(counters):
+                if not carry:
+                    break
+                counters[i], carry = plane ^ carry, plane & carry
+            if carry:
+                counters.append(carry)
+
+        def covering(count):
+            """Bitmap of the matching recipes using exactly ``count`` of the ingredients"""
+            if count >> len(counters):
+                return 0
+            bits = matching
+            for i, plane in enumerate(counters):
+                bits &= plane if count >> i & 1 else ~plane
+            return bits
+
+        buckets = sorted(
+            ((covered, total) for total in self.by_total for covered in range(1, min(total, len(ingredient_ids)) + 1)),
+            key=lambda bucket: (-bucket[0] / bucket[1], -bucket[0]),
+        )
+        exact = {}
+        results = []
+        for covered, total in buckets:
+            if len(results) >= limit:
+                break
+            if covered not in exact:
+                exact[covered] = covering(covered)
+            bits = exact[covered] & self.by_total[total]
+            size = bits.bit_count()
+            if offset >= size:
+                offset -= size
+                continue
+            for position, slot in enumerate(bit_positions(bits)):
+                if position < offset:
+                    continue
+                results.append((self.recipe_ids[slot], covered, total))
+                if len(results) >= limit:
+                    break
+            offset = 0
+        return matching.bit_count(), results
+
+
+_index = None
+_index_generation = None
+_index_built_at = 0.0
+_index_lock = threading.Lock()
+
+
+def _rebuild(generation):
+    """Replace the index with a fresh build; called holding ``_index_lock``"""
+    global _index, _index_generation, _index_built_at
+    _index = IngredientIndex.build()
+    _index_generation = generation
+    _index_built_at = time.monotonic()
+
+
+def _rebuild_in_background(generation):
+    try:
+        _rebuild(generation)
+    finally:
+        _index_lock.release()
+        connections.close_all()
+
+
+def get_ingredient_index():
+    """
+    The process-wide index. Only the first call waits for it to be built; when
+    recipes changed and the current one is older than
+    ``INGREDIENT_INDEX_REFRESH_SECONDS``, it is rebuilt in a background thread
+    while searches use the current index.
+    """
+    generation, = get_generations(INGREDIENTS)
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _rebuild(generation)
+    elif (
+        generation != _index_generation
+        and time.monotonic() - _index_built_at >= getattr(settings, 'INGREDIENT_INDEX_REFRESH_SECONDS', 60)
+        and _index_lock.acquire(blocking=False)
+    ):
+        threading.Thread(target=_rebuild_in_background, args=(generation,), daemon=True).start()
+    return _index
+
+
+def what_can_i_cook(names, offset=0, limit=20):
+    """
+    Approved recipes ranked by how much of them ``names`` covers.
+
+    Returns ``(total, results, unknown)`` where each result is
+    ``(recipe, covered, ingredient count, [missing ingredient names])`` and
+    ``unknown`` lists the names not in the vocabulary.
+    """
+    index = get_ingredient_index()
+    known, unknown = index.resolve(names)
+    if not known:
+        return 0, [], unknown
+    total, ranked = index.search(list(known.values()), offset, limit)
+    page_ids = [pk for pk, _, _ in ranked]
+    recipes = Recipe.objects.for_listing().in_bulk(page_ids)
+    missing = defaultdict(list)
+    links = RecipeIngredient.objects.filter(recipe_id__in=page_ids).exclude(ingredient_id__in=known.values())
+    for recipe_id, name in links.order_by('ingredient__name').values_list('recipe_id', 'ingredient__name'):
+        missing[recipe_id].append(name)
+    results = [(recipes[pk], covered, count, missing[pk]) for pk, covered, count in ranked if pk in recipes]
+    return total, results, unknown
@@ -0,0 +1,100 @@
+import re
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from recipes.models import Category, Recipe
+
+# Tables that are read in full by design (the category strip lists every category)
+EXPECTED_SCANS = {'recipes_category', 'django_session'}
+
+SQLITE_SCAN = re.compile(r'^SCAN (\w+)\b(?! USING| VIRTUAL)')
+SQLITE_TEMP_SORT = re.compile(r'USE TEMP B-TREE FOR (ORDER BY|GROUP BY)')
+POSTGRES_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+DUMMY_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+class Command(BaseCommand):
+    help = 'Run EXPLAIN on the queries issued by each listing view and report full table scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fail-on-scan', action='store_true',
+                            help='Exit with an error if any unexpected full table scan is found')
+        parser.add_argument('--verbose-plans', action='store_true',
+                            help='Print the full plan of every query')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            raise CommandError(f'EXPLAIN parsing is not implemented for {connection.vendor}')
+
+        problems = 0
+        # Sessions created by force_login are rolled back together with everything else
+        with transaction.atomic(), override_settings(CACHES=DUMMY_CACHE):
+            for label, url, user in self.view_requests():
+                client = Client(HTTP_HOST='localhost')
+                if user is not None:
+                    client.force_login(user)
+                with CaptureQueriesContext(connection) as ctx:
+                    client.get(url)
+                problems += self.audit_view(label, url, ctx.captured_queries, options['verbose_plans'])
+            transaction.set_rollback(True)
+
+        if problems:
+            message = f'{problems} unexpected full table scan(s) found'
+            if options['fail_on_scan']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS('No unexpected full table scans'))
+
+    def view_requests(self):
+        """Yield (label, url, user) for the views to audit, using real ids where possible"""
+        author = User.objects.filter(recipes__isnull=False).first() or User.objects.first()
+        category = Category.objects.first()
+        recipe = Recipe.objects.approved().first()
+
+        yield 'home', reverse('home'), None
+        yield 'home (search)', reverse('home') + '?search=chicken', None
+        if category:
+            yield 'home (category)', reverse('home') + f'?category={category.pk}', None
+        yield 'home (cursor)', reverse('home') + '?cursor=', None
+        if author:
+            yield 'home (logged in)', reverse('home'), author
+            yield 'home (my recipes)', reverse('home') + '?user_filter=my_recipes', author
+            yield 'my_recipes', reverse('my_recipes'), author
+            yield 'user_profile', reverse('user_profile', args=[author.username]), None
+        if recipe:
+            yield 'recipe_detail', reverse('recipe_detail', args=[recipe.pk]), None
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                return [row[-1] for row in cursor.fetchall()]
+            cursor.execute(f'EXPLAIN {sql}')
+            return [row[0] for row in cursor.fetchall()]
+
+    def audit_view(self, label, url, queries, verbose):
+        self.stdout.write(self.style.MIGRATE_HEADING(f'{label}  {url}  ({len(queries)} queries)'))
+        problems = 0
+        for query in queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            plan = self.explain(sql)
+            for line in plan:
+                line = line.strip()
+                match = SQLITE_SCAN.match(line) or POSTGRES_SCAN.search(line)
+                if match and match.group(1) not in EXPECTED_SCANS:
+                    problems += 1
+                    self.stdout.write(self.style.ERROR(f'  full scan of {match.group(1)}: {sql[:160]}'))
+                elif SQLITE_TEMP_SORT.search(line):
+                    self.stdout.write(self.style.WARNING(f'  unindexed sort ({line}): {sql[:160]}'))
+            if verbose:
+                for line in plan:
+                    self.stdout.write(f'    {line}')
+        return problems
@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.urls import reverse
+from recipes.models import Recipe
+
+DUMMY_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+class Command(BaseCommand):
+    help = 'Compare the throughput and response size of the JSON API with the HTML pages carrying the same data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint')
+
+    def handle(self, *args, **options):
+        recipe = Recipe.objects.approved().order_by('-comment_count').first()
+        if recipe is None:
+            raise CommandError('Need at least one approved recipe; run seed_data or create_admin_recipes first')
+
+        pairs = [
+            ('listing', reverse('home'), reverse('api_recipe_list') + '?limit=9'),
+            ('recipe', reverse('recipe_detail', args=[recipe.pk]), reverse('api_recipe_detail', args=[recipe.pk])),
+            ('recipe card', reverse('recipe_detail', args=[recipe.pk]),
+             reverse('api_recipe_detail', args=[recipe.pk]) + '?fields=id,title,image,average_rating'),
+            ('comments', reverse('recipe_comments', args=[recipe.pk]),
+             reverse('api_recipe_comments', args=[recipe.pk]) + '?limit=10'),
+        ]
+        total = options['requests']
+        self.stdout.write(f'{total} anonymous requests per endpoint, page cache disabled')
+        self.stdout.write(
+            f'{"data":<13}{"html req/s":>12}{"api req/s":>11}{"speedup":>9}{"html KB":>10}{"api KB":>9}'
+        )
+        client = Client()
+        with override_settings(CACHES=DUMMY_CACHE):
+            for name, html_url, api_url in pairs:
+                html_rate, html_size = self.run(client, html_url, total)
+                api_rate, api_size = self.run(client, api_url, total)
+                self.stdout.write(
+                    f'{name:<13}{html_rate:>12.1f}{api_rate:>11.1f}{api_rate / html_rate:>8.2f}x'
+                    f'{html_size / 1024:>10.1f}{api_size / 1024:>9.1f}'
+                )
+
+    def run(self, client, url, total):
+        size = len(client.get(url).content)  # Warm up, and measure the body
+        start = time.perf_counter()
+        for _ in range(total):
+            client.get(url)
+        return total / (time.perf_counter() - start), size
@@ -0,0 +1,153 @@
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+from recipes.db import apply_sqlite_pragmas
+from recipes.models import Comment, Recipe
+
+
+def sqlite_sql(queryset):
+    """SQL and params of ``queryset`` in the sqlite3 module's placeholder style"""
+    sql, params = queryset.query.get_compiler('default').as_sql()
+    return sql.replace('%s', '?'), params
+
+
+class Command(BaseCommand):
+    help = ('Measure concurrent read/write throughput of the SQLite database with the development '
+            'profile (reconnect per request, rollback journal) and the production profile '
+            '(persistent connections, SQLITE_PRAGMAS)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=5, help='Duration of each run')
+        parser.add_argument('--readers', type=int, default=4, help='Threads issuing page reads')
+        parser.add_argument('--writers', type=int, default=2, help='Threads posting comments')
+
+    def handle(self, *args, **options):
+        database = connections['default'].settings_dict
+        if database['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('benchmark_database compares SQLite settings; the default database is not SQLite')
+        recipe_ids = list(Recipe.objects.approved().values_list('pk', flat=True)[:1000])
+        author_id = Recipe.objects.values_list('author_id', flat=True).first()
+        if not recipe_ids:
+            raise CommandError('Need approved recipes; run seed_data first')
+
+        # One "page view": the home listing, a recipe and its first comments
+        listing = sqlite_sql(Recipe.objects.approved().for_listing().order_by('-created_at')[:12])
+        detail_sql, _ = sqlite_sql(Recipe.objects.filter(pk=0).select_related('author', 'category'))
+        comments_sql, _ = sqlite_sql(
+            Comment.objects.filter(recipe_id=0).select_related('author').order_by('-created_at', '-id')[:11]
+        )
+        workload = {
+            'listing': listing,
+            'detail': detail_sql,
+            'comments': comments_sql,
+            'recipe_ids': recipe_ids,
+            'author_id': author_id,
+        }
+
+        pragmas = settings.SQLITE_PRAGMAS or settings.PRODUCTION_SQLITE_PRAGMAS
+        self.stdout.write(
+            f'{options["readers"]} reader(s), {options["writers"]} writer(s), {options["seconds"]}s per profile, '
+            f'on a copy of {database["NAME"]}'
+        )
+        self.stdout.write(f'{"profile":<14}{"reads/s":>10}{"writes/s":>10}{"read p99 ms":>13}{"locked":>8}')
+        for name, persistent, profile_pragmas in [('development', False, {}), ('production', True, pragmas)]:
+            result = self.run(database['NAME'], workload, persistent, profile_pragmas, options)
+            self.stdout.write(
+                f'{name:<14}{result["reads"]:>10.0f}{result["writes"]:>10.0f}'
+                f'{result["read_p99"]:>13.1f}{result["locked"]:>8}'
+            )
+        self.stdout.write(self.style.SUCCESS('Done'))
+
+    def run(self, source_path, workload, persistent, pragmas, options):
+        handle, path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        source = sqlite3.connect(source_path)
+        target = sqlite3.connect(path)
+        source.backup(target)
+        source.close()
+        target.close()
+
+        def connect():
+            # Django's default SQLite timeout is 5s; the production profile raises it
+            conn = sqlite3.connect(path, timeout=20 if persistent else 5, check_same_thread=False,
+                                   isolation_level=None)
+            apply_sqlite_pragmas(conn, pragmas)
+            return conn
+
+        deadline = time.perf_counter() + options['seconds']
+        lock = threading.Lock()
+        totals = {'reads': 0, 'writes': 0, 'locked': 0}
+        read_times = []
+
+        def reader():
+            conn = connect() if persistent else None
+            reads, times = 0, []
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                current = conn or connect()
+                pk = random.choice(workload['recipe_ids'])
+                current.execute(*workload['listing']).fetchall()
+                current.execute(workload['detail'], [pk]).fetchall()
+                current.execute(workload['comments'], [pk]).fetchall()
+                if not persistent:
+                    current.close()
+                times.append(time.perf_counter() - started)
+                reads += 1
+            with lock:
+                totals['reads'] += reads
+                read_times.extend(times)
+
+        def writer():
+            conn = connect() if persistent else None
+            writes = locked = 0
+            while time.perf_counter() < deadline:
+                current = conn or connect()
+                pk = random.choice(workload['recipe_ids'])
+                now = timezone.now().isoformat()
+                try:
+                    current.execute('BEGIN IMMEDIATE')
+                    current.execute(
+                        'INSERT INTO recipes_comment (recipe_id, author_id, content, created_at, updated_at) '
+                        'VALUES (?, ?, ?, ?, ?)',
+                        [pk, workload['author_id'], 'Benchmark comment', now, now],
+                    )
+                    current.execute('UPDATE recipes_recipe SET comment_count = comment_count + 1 WHERE id = ?', [pk])
+                    current.execute('COMMIT')
+                    writes += 1
+                except sqlite3.OperationalError:
+                    locked += 1
+                    if current.in_transaction:
+                        current.execute('ROLLBACK')
+                if not persistent:
+                    current.close()
+            with lock:
+                totals['writes'] += writes
+                totals['locked'] += locked
+
+        threads = [threading.Thread(target=reader) for _ in range(options['readers'])]
+        threads += [threading.Thread(target=writer) for _ in range(options['writers'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        for suffix in ('', '-wal', '-shm', '-journal'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        read_times.sort()
+        return {
+            'reads': totals['reads'] / elapsed,
+            'writes': totals['writes'] / elapsed,
+            'read_p99': read_times[int(len(read_times) * 0.99)] * 1000 if read_times else 0.0,
+            'locked': totals['locked'],
+        }
@@ -0,0 +1,92 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import ThreadSensitiveContext
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncRequestFactory, RequestFactory, override_settings
+from django.urls import reverse
+from recipes import async_views, views
+from recipes.models import Recipe
+
+DUMMY_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+class Command(BaseCommand):
+    help = 'Compare the throughput of the sync (WSGI) and async (ASGI) versions of the read-heavy views'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per view and mode')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Worker threads (sync) or in-flight tasks (async)')
+        parser.add_argument('--latency-ms', type=float, default=0,
+                            help='Sleep added to every query to emulate a database across the network')
+
+    def handle(self, *args, **options):
+        recipe = Recipe.objects.approved().select_related('author').first()
+        if recipe is None:
+            raise CommandError('Need at least one approved recipe; run seed_data or create_admin_recipes first')
+
+        targets = [
+            ('home', reverse('home'), {}),
+            ('recipe_detail', reverse('recipe_detail', args=[recipe.pk]), {'pk': recipe.pk}),
+            ('user_profile', reverse('user_profile', args=[recipe.author.username]),
+             {'username': recipe.author.username}),
+        ]
+        total, concurrency = options['requests'], options['concurrency']
+        latency = options['latency_ms'] / 1000
+
+        def add_latency(execute, sql, params, many, context):
+            time.sleep(latency)
+            return execute(sql, params, many, context)
+
+        def install_latency(sender, connection, **kwargs):
+            connection.execute_wrappers.append(add_latency)
+
+        if latency:
+            # Worker threads open their own connections, so hook every new one
+            connection_created.connect(install_latency)
+            connections.close_all()
+
+        self.stdout.write(
+            f'{total} anonymous requests per view, concurrency {concurrency}, '
+            f'{options["latency_ms"]}ms added per query, page cache disabled'
+        )
+        self.stdout.write(f'{"view":<16}{"wsgi req/s":>12}{"asgi req/s":>12}{"speedup":>10}')
+        with override_settings(CACHES=DUMMY_CACHE):
+            for name, url, kwargs in targets:
+                sync_rate = self.run_sync(getattr(views, name), url, kwargs, total, concurrency)
+                async_rate = asyncio.run(self.run_async(getattr(async_views, name), url, kwargs, total, concurrency))
+                self.stdout.write(f'{name:<16}{sync_rate:>12.1f}{async_rate:>12.1f}{async_rate / sync_rate:>9.2f}x')
+
+    def run_sync(self, view, url, kwargs, total, concurrency):
+        factory = RequestFactory()
+
+        def one(_):
+            request = factory.get(url)
+            request.user = AnonymousUser()
+            return view(request, **kwargs).status_code
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(one, range(total)))
+        return total / (time.perf_counter() - start)
+
+    async def run_async(self, view, url, kwargs, total, concurrency):
+        factory = AsyncRequestFactory()
+        limit = asyncio.Semaphore(concurrency)
+
+        async def one():
+            # Like ASGIHandler, give each request its own thread for thread-sensitive work
+            async with limit, ThreadSensitiveContext():
+                request = factory.get(url)
+                request.user = AnonymousUser()
+                return (await view(request, **kwargs)).status_code
+
+        start = time.perf_counter()
+        await asyncio.gather(*[one() for _ in range(total)])
+        return total / (time.perf_counter() - start)
@@ -0,0 +1,26 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recipes.recommendations import rebuild_recommendations, refresh_new_recommendations
+
+
+class Command(BaseCommand):
+    help = 'Precompute the "similar recipes" shown on recipe pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=getattr(settings, 'RECOMMENDATIONS_TOP_K', 6),
+                            help='Recommendations stored per recipe')
+        parser.add_argument('--new-only', action='store_true',
+                            help='Only handle approved recipes not handled before (and the lists '
+                                 'they now belong to); cheap enough to run every few minutes')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['new_only']:
+            recipes, rows = refresh_new_recommendations(options['top_k'])
+        else:
+            recipes, rows = rebuild_recommendations(options['top_k'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored {rows} recommendations for {recipes} recipe(s) in {time.perf_counter() - started:.1f}s'
+        ))
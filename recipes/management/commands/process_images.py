@@ -0,0 +1,54 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from recipes.cache import invalidate_recipes
+from recipes.images import AVATAR_VARIANTS, VARIANTS, process_image, remember_variants
+from recipes.models import Recipe, UserProfile
+
+
+class Command(BaseCommand):
+    help = 'Generate resized image variants for existing recipe images and avatars'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Regenerate variants that already exist')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Number of images processed in parallel')
+
+    def handle(self, *args, **options):
+        # (storage name, variants, recipe id whose cached pages show it)
+        jobs = [
+            (name, tuple(VARIANTS), pk)
+            for pk, name in Recipe.objects.exclude(image='').exclude(image=None).values_list('pk', 'image')
+        ]
+        jobs += [
+            (name, AVATAR_VARIANTS, None)
+            for name in UserProfile.objects.exclude(avatar='').exclude(avatar=None).values_list('avatar', flat=True)
+        ]
+
+        def run(job):
+            name, variants, recipe_id = job
+            try:
+                return name, recipe_id, process_image(name, variants, force=options['force']), None
+            except Exception as exc:  # Keep going; one bad upload must not stop the backfill
+                return name, recipe_id, 0, exc
+
+        processed = failed = 0
+        changed_recipes = []
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for name, recipe_id, written, error in executor.map(run, jobs):
+                if error is not None:
+                    failed += 1
+                    self.stderr.write(f'Failed: {name} ({error})')
+                elif written:
+                    remember_variants(name)
+                    processed += 1
+                    if recipe_id is not None:
+                        changed_recipes.append(recipe_id)
+                    self.stdout.write(f'Processed: {name}')
+
+        if changed_recipes:
+            invalidate_recipes(changed_recipes)
+        self.stdout.write(
+            self.style.SUCCESS(f'Processed {processed} image(s), {failed} failed, {len(jobs)} checked')
+        )
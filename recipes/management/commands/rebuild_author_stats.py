@@ -0,0 +1,20 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.models import AuthorStats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the materialized per-author recipe statistics for every user'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Authors recomputed per grouped query')
+
+    def handle(self, *args, **options):
+        user_ids = list(User.objects.order_by('pk').values_list('pk', flat=True))
+        batch_size = options['batch_size']
+        for start in range(0, len(user_ids), batch_size):
+            with transaction.atomic():
+                AuthorStats.objects.refresh(user_ids[start:start + batch_size])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt recipe statistics for {len(user_ids)} author(s)'))
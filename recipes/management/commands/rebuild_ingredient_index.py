@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from recipes.ingredients import rebuild_ingredient_links
+
+
+class Command(BaseCommand):
+    help = 'Relink every recipe to the normalized ingredient vocabulary used by the "what can I cook" search'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Recipes relinked per transaction')
+
+    def handle(self, *args, **options):
+        recipes, ingredients = rebuild_ingredient_links(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Linked {recipes} recipe(s) to a vocabulary of {ingredients} ingredient(s)'
+        ))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.models import Recipe
+from recipes.search import INDEXED_FIELDS, get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for all recipes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Number of recipes read from the database at a time')
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        rows = Recipe.objects.order_by().values_list('id', *INDEXED_FIELDS).iterator(
+            chunk_size=options['chunk_size']
+        )
+        with transaction.atomic():
+            indexed = backend.rebuild(rows)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Indexed {indexed} recipes with {type(backend).__name__}')
+        )
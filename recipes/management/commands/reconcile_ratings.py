@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from recipes.models import AuthorStats, Comment, Rating, Recipe, average_rating_expression
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized rating and comment counters on every recipe from their tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report how many recipes have drifted counters')
+
+    def handle(self, *args, **options):
+        ratings = Rating.objects.filter(recipe=OuterRef('pk')).order_by().values('recipe')
+        actual_sum = Coalesce(
+            Subquery(ratings.annotate(total=Sum('rating')).values('total'), output_field=IntegerField()), 0
+        )
+        actual_count = Coalesce(
+            Subquery(ratings.annotate(count=Count('id')).values('count'), output_field=IntegerField()), 0
+        )
+        comments = Comment.objects.filter(recipe=OuterRef('pk')).order_by().values('recipe')
+        actual_comments = Coalesce(
+            Subquery(comments.annotate(count=Count('id')).values('count'), output_field=IntegerField()), 0
+        )
+
+        drifted = Recipe.objects.annotate(
+            actual_sum=actual_sum, actual_count=actual_count, actual_comments=actual_comments
+        ).filter(
+            ~Q(rating_sum=F('actual_sum')) | ~Q(rating_count=F('actual_count'))
+            | ~Q(comment_count=F('actual_comments'))
+        )
+        drifted_ids = list(drifted.values_list('pk', flat=True))
+
+        if options['dry_run']:
+            self.stdout.write(f'{len(drifted_ids)} recipe(s) have drifted rating or comment counters')
+            return
+
+        with transaction.atomic():
+            for start in range(0, len(drifted_ids), 500):
+                batch = Recipe.objects.filter(pk__in=drifted_ids[start:start + 500])
+                batch.update(rating_sum=actual_sum, rating_count=actual_count, comment_count=actual_comments)
+                batch.update(average_rating=average_rating_expression())
+                # The author totals are built from these counters
+                AuthorStats.objects.refresh(batch.values_list('author', flat=True).distinct())
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Reconciled rating and comment counters on {len(drifted_ids)} recipe(s)')
+        )
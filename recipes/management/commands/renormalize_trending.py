@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from recipes.cache import LISTING, invalidate
+from recipes.trending import rebuild, renormalize
+
+
+class Command(BaseCommand):
+    help = ('Move the trending epoch to now and rescale the stored scores (run daily), '
+            'or recompute them from the ratings and comments with --rebuild')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recompute every score from the recent ratings and comments')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Scores written per UPDATE when rebuilding')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            count = rebuild(options['batch_size'])
+            # Rebuilt scores can reorder the trending listing
+            invalidate(LISTING)
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt the trending scores of {count} recipe(s)'))
+        else:
+            factor = renormalize()
+            self.stdout.write(self.style.SUCCESS(f'Rescaled the trending scores by {factor:.6g}'))
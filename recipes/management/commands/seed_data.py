@@ -0,0 +1,234 @@
+import itertools
+import multiprocessing
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+from recipes.cache import CATEGORIES, LISTING, invalidate
+from recipes.models import Category, Comment, Rating, Recipe
+
+ADJECTIVES = ['Classic', 'Spicy', 'Smoky', 'Creamy', 'Crispy', 'Rustic', 'Zesty', 'Golden', 'Hearty',
+              'Quick', 'Herbed', 'Roasted', 'Grilled', 'Honey', 'Garlic', 'Lemon', 'Tangy', 'Sweet']
+DISHES = ['Chicken Curry', 'Pasta Bake', 'Lentil Soup', 'Beef Stew', 'Veggie Tacos', 'Fried Rice',
+          'Banana Bread', 'Pancakes', 'Risotto', 'Salmon Bowl', 'Chocolate Cake', 'Falafel Wrap',
+          'Ramen', 'Shakshuka', 'Paella', 'Apple Pie', 'Pad Thai', 'Mushroom Pie', 'Chili', 'Gnocchi']
+INGREDIENTS = ['flour', 'sugar', 'butter', 'eggs', 'milk', 'olive oil', 'garlic', 'onion', 'tomatoes',
+               'chicken breast', 'rice', 'lentils', 'carrots', 'celery', 'potatoes', 'spinach', 'basil',
+               'parsley', 'lemon juice', 'soy sauce', 'ginger', 'cumin', 'paprika', 'chili flakes',
+               'black pepper', 'salt', 'honey', 'yogurt', 'cream', 'parmesan', 'mozzarella', 'chickpeas',
+               'coconut milk', 'bell pepper', 'mushrooms', 'beef stock', 'vanilla extract', 'cocoa powder']
+UNITS = ['g', 'kg', 'ml', 'cup', 'cups', 'tbsp', 'tsp', 'pinch', '']
+STEPS = ['Preheat the oven to {n}°C.', 'Chop the {i} finely.', 'Whisk the {i} with the {j}.',
+         'Simmer for {n} minutes, stirring occasionally.', 'Fold in the {i}.', 'Season with {i} to taste.',
+         'Bake for {n} minutes until golden.', 'Rest for {n} minutes before serving.']
+COMMENTS = ['Made this tonight, delicious!', 'Needed more salt for me.', 'Family favourite now.',
+            'Easy to follow, thanks.', 'I swapped the {i} for {j} and it worked great.',
+            'Took longer than stated.', 'Perfect for weekdays.', 'Will make again!']
+
+SEED_PASSWORD = 'seed-password'
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create keep the created_at/updated_at values we generate"""
+    fields = [f for model in models for f in model._meta.concrete_fields if getattr(f, 'auto_now_add', False)
+              or getattr(f, 'auto_now', False)]
+    saved = [(f, f.auto_now, f.auto_now_add) for f in fields]
+    for f in fields:
+        f.auto_now = f.auto_now_add = False
+    try:
+        yield
+    finally:
+        for f, auto_now, auto_now_add in saved:
+            f.auto_now, f.auto_now_add = auto_now, auto_now_add
+
+
+def zipf_weights(count, skew):
+    """Cumulative weights where item i is 1 / (i + 1) ** skew as popular as the first"""
+    return list(itertools.accumulate(1 / (rank + 1) ** skew for rank in range(count)))
+
+
+def fake_ingredients(rng, count):
+    lines = []
+    for item in rng.sample(INGREDIENTS, min(count, len(INGREDIENTS))):
+        unit = rng.choice(UNITS)
+        amount = rng.choice(['1', '2', '3', '1/2', '1/4', '100', '200', '250', '500'])
+        lines.append(f'{amount} {unit} {item}'.replace('  ', ' '))
+    while len(lines) < count:  # Long lists repeat ingredients for separate components
+        component = rng.choice(['sauce', 'topping', 'garnish'])
+        lines.append(f'{rng.randint(1, 5)} tbsp {rng.choice(INGREDIENTS)} (for the {component})')
+    return '\n'.join(lines)
+
+
+def fake_instructions(rng, count):
+    return '\n'.join(
+        rng.choice(STEPS).format(n=rng.randint(5, 200), i=rng.choice(INGREDIENTS), j=rng.choice(INGREDIENTS))
+        for _ in range(count)
+    )
+
+
+def seed_shard(options, shard, recipe_count, user_ids, category_ids):
+    """Create ``recipe_count`` recipes with their share of comments and ratings; returns row counts"""
+    rng = random.Random(options['seed'] + shard)
+    batch_size = options['batch_size']
+    now = timezone.now()
+    span = timedelta(days=options['days']).total_seconds()
+
+    recipes = []
+    for _ in range(recipe_count):
+        created = now - timedelta(seconds=rng.random() * span)
+        recipes.append(Recipe(
+            title=f'{rng.choice(ADJECTIVES)} {rng.choice(DISHES)}',
+            description=f'A {rng.choice(ADJECTIVES).lower()} take on a favourite, ready in no time.',
+            ingredients=fake_ingredients(rng, rng.randint(options['min_ingredients'], options['max_ingredients'])),
+            instructions=fake_instructions(rng, rng.randint(3, 12)),
+            prep_time=rng.randint(5, 60),
+            cook_time=rng.randint(0, 180),
+            servings=rng.randint(1, 12),
+            category_id=rng.choice(category_ids),
+            author_id=rng.choice(user_ids),
+            status='approved' if rng.random() < options['approved_ratio'] else rng.choice(['pending', 'rejected']),
+            created_at=created,
+            updated_at=created,
+        ))
+        recipes[-1].parse_text_fields()  # bulk_create skips Recipe.save
+        recipes[-1].total_time = recipes[-1].prep_time + recipes[-1].cook_time
+
+    with explicit_timestamps(Recipe, Comment, Rating):
+        for start in range(0, len(recipes), batch_size):
+            with transaction.atomic():
+                Recipe.objects.bulk_create(recipes[start:start + batch_size])
+
+        # Both follow the same skewed popularity: early recipes in the shard get most activity
+        cum_weights = zipf_weights(len(recipes), options['skew'])
+        share = recipe_count / max(options['recipes'], 1)
+        comments = write_in_batches(Comment, batch_size, (
+            Comment(recipe_id=recipe.pk, author_id=rng.choice(user_ids), created_at=recipe.created_at,
+                    updated_at=recipe.created_at,
+                    content=rng.choice(COMMENTS).format(i=rng.choice(INGREDIENTS), j=rng.choice(INGREDIENTS)))
+            for recipe in rng.choices(recipes, cum_weights=cum_weights, k=round(options['comments'] * share))
+        ))
+        ratings = write_in_batches(Rating, batch_size, generate_ratings(
+            rng, recipes, cum_weights, user_ids, round(options['ratings'] * share)
+        ))
+    return len(recipes), comments, ratings
+
+
+def generate_ratings(rng, recipes, cum_weights, user_ids, total):
+    """Yield unique (recipe, user) ratings, more of them for popular recipes"""
+    per_recipe = {}
+    for index in rng.choices(range(len(recipes)), cum_weights=cum_weights, k=total):
+        per_recipe[index] = per_recipe.get(index, 0) + 1
+    for index, count in per_recipe.items():
+        recipe = recipes[index]
+        for user_id in rng.sample(user_ids, min(count, len(user_ids))):
+            # Ratings lean positive, like real ones
+            yield Rating(recipe_id=recipe.pk, user_id=user_id, rating=rng.choices(range(1, 6), (1, 1, 3, 6, 5))[0],
+                         created_at=recipe.created_at, updated_at=recipe.created_at)
+
+
+def write_in_batches(model, batch_size, objects):
+    written = 0
+    iterator = iter(objects)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return written
+        with transaction.atomic():
+            model.objects.bulk_create(batch, ignore_conflicts=model is Rating)
+        written += len(batch)
+
+
+def _init_worker():
+    import django
+    django.setup()
+    # Never share the parent's database connection across processes
+    connections.close_all()
+
+
+def _run_shard(args):
+    return seed_shard(*args)
+
+
+class Command(BaseCommand):
+    help = 'Generate large volumes of realistic users, recipes, comments and ratings for performance testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=50000)
+        parser.add_argument('--ratings', type=int, default=100000,
+                            help='Upper bound; a recipe gets at most one rating per user')
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Zipf exponent of recipe popularity (0 = uniform)')
+        parser.add_argument('--min-ingredients', type=int, default=4)
+        parser.add_argument('--max-ingredients', type=int, default=14,
+                            help='Raise (e.g. 60) to exercise long ingredient lists')
+        parser.add_argument('--approved-ratio', type=float, default=0.9)
+        parser.add_argument('--days', type=int, default=730, help='Spread created_at over this many days')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Worker processes creating recipes in parallel (best on PostgreSQL)')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--skip-post-processing', action='store_true',
+                            help='Do not rebuild the search index and rating counters afterwards')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        category_ids = list(Category.objects.values_list('pk', flat=True))
+        if not category_ids:
+            call_command('create_categories', stdout=self.stdout)
+            category_ids = list(Category.objects.values_list('pk', flat=True))
+        if options['min_ingredients'] > options['max_ingredients']:
+            raise CommandError('--min-ingredients must not exceed --max-ingredients')
+
+        user_ids = self.create_users(options['users'], options['batch_size'])
+        if not user_ids:
+            raise CommandError('Need at least one user')
+        self.stdout.write(f'Users ready: {len(user_ids)} ({time.perf_counter() - started:.1f}s)')
+
+        workers = max(1, options['workers'])
+        shares = [options['recipes'] // workers + (1 if i < options['recipes'] % workers else 0) for i in range(workers)]
+        jobs = [(options, shard, count, user_ids, category_ids) for shard, count in enumerate(shares) if count]
+        if workers == 1:
+            results = [seed_shard(*job) for job in jobs]
+        else:
+            connections.close_all()
+            with multiprocessing.Pool(workers, initializer=_init_worker) as pool:
+                results = pool.map(_run_shard, jobs)
+
+        recipes, comments, ratings = (sum(column) for column in zip(*results)) if results else (0, 0, 0)
+        self.stdout.write(
+            f'Created {recipes} recipes, {comments} comments, {ratings} ratings '
+            f'({time.perf_counter() - started:.1f}s)'
+        )
+
+        if not options['skip_post_processing']:
+            # bulk_create bypasses the signals that maintain these
+            call_command('reconcile_ratings', stdout=self.stdout)
+            call_command('rebuild_search_index', stdout=self.stdout)
+            call_command('rebuild_author_stats', stdout=self.stdout)
+            call_command('rebuild_ingredient_index', stdout=self.stdout)
+            call_command('renormalize_trending', rebuild=True, stdout=self.stdout)
+        invalidate(LISTING, CATEGORIES)
+
+        self.stdout.write(self.style.SUCCESS(f'Seeding finished in {time.perf_counter() - started:.1f}s'))
+
+    def create_users(self, count, batch_size):
+        """Create ``count`` new seed users (all sharing one password) and return every seed user id"""
+        existing = User.objects.filter(username__startswith='seed_user_').count()
+        password = make_password(SEED_PASSWORD)
+        users = (
+            User(username=f'seed_user_{existing + i}', email=f'seed_user_{existing + i}@example.com',
+                 password=password)
+            for i in range(count)
+        )
+        write_in_batches(User, batch_size, users)
+        return list(User.objects.filter(username__startswith='seed_user_').values_list('pk', flat=True))
@@ -0,0 +1,36 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = ('Copy the SQLite primary database into every SQLite replica in DATABASE_REPLICAS '
+            '(local stand-in for replication)')
+
+    def handle(self, *args, **options):
+        primary = connections['default'].settings_dict
+        if primary['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('sync_replicas only copies SQLite databases; use real replication elsewhere')
+        replicas = [
+            alias for alias in settings.DATABASE_REPLICAS
+            if connections[alias].settings_dict['ENGINE'] == 'django.db.backends.sqlite3'
+        ]
+        if not replicas:
+            raise CommandError('No SQLite replicas configured; set DATABASE_REPLICAS to one or more file paths')
+
+        source = sqlite3.connect(primary['NAME'])
+        try:
+            for alias in replicas:
+                connections[alias].close()
+                target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+                try:
+                    # The backup API gives a consistent snapshot even while the primary is in use
+                    source.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write(f'Copied primary to {alias} ({connections[alias].settings_dict["NAME"]})')
+        finally:
+            source.close()
+        self.stdout.write(self.style.SUCCESS(f'Synced {len(replicas)} replica(s)'))
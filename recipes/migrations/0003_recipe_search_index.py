@@ -0,0 +1,52 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS recipes_recipe_fts "
+            "USING fts5(title, description, ingredients, tokenize='porter unicode61')"
+        )
+        schema_editor.execute(
+            "INSERT INTO recipes_recipe_fts (rowid, title, description, ingredients) "
+            "SELECT id, title, description, ingredients FROM recipes_recipe"
+        )
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE TABLE IF NOT EXISTS recipes_recipe_search ("
+            "recipe_id bigint PRIMARY KEY REFERENCES recipes_recipe (id) "
+            "ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+            "document tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS recipes_recipe_search_document_gin "
+            "ON recipes_recipe_search USING GIN (document)"
+        )
+        schema_editor.execute(
+            "INSERT INTO recipes_recipe_search (recipe_id, document) "
+            "SELECT id, "
+            "setweight(to_tsvector('english', title), 'A') || "
+            "setweight(to_tsvector('english', description), 'B') || "
+            "setweight(to_tsvector('english', ingredients), 'C') "
+            "FROM recipes_recipe"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS recipes_recipe_fts")
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute("DROP TABLE IF EXISTS recipes_recipe_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_userprofile'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
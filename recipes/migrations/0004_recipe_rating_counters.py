@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2025-11-24 06:12
+
+from django.db import migrations, models
+
+
+def populate_rating_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Rating = apps.get_model('recipes', 'Rating')
+    totals = Rating.objects.order_by().values('recipe').annotate(
+        total=models.Sum('rating'), count=models.Count('id')
+    )
+    recipes = []
+    for row in totals:
+        recipes.append(Recipe(
+            pk=row['recipe'],
+            rating_sum=row['total'],
+            rating_count=row['count'],
+            average_rating=round(row['total'] / row['count'], 2),
+        ))
+    Recipe.objects.bulk_update(recipes, ['rating_sum', 'rating_count', 'average_rating'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_recipe_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_rating_counters, migrations.RunPython.noop),
+    ]
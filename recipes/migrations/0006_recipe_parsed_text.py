@@ -0,0 +1,126 @@
+# Generated by Django 4.2.7 on 2025-11-24 07:15
+
+import re
+from fractions import Fraction
+
+from django.db import migrations, models
+
+# A frozen copy of recipes.parsing as this migration shipped with it, so the
+# backfill keeps producing the same data after the live parser changes
+
+UNICODE_FRACTIONS = {
+    '¼': '1/4', '½': '1/2', '¾': '3/4', '⅓': '1/3', '⅔': '2/3',
+    '⅛': '1/8', '⅜': '3/8', '⅝': '5/8', '⅞': '7/8',
+}
+
+# Spelling as written -> canonical unit
+UNITS = {
+    'g': 'g', 'gram': 'g', 'grams': 'g', 'gr': 'g',
+    'kg': 'kg', 'kilogram': 'kg', 'kilograms': 'kg',
+    'mg': 'mg',
+    'ml': 'ml', 'millilitre': 'ml', 'milliliter': 'ml', 'millilitres': 'ml', 'milliliters': 'ml',
+    'l': 'l', 'litre': 'l', 'liter': 'l', 'litres': 'l', 'liters': 'l',
+    'tsp': 'tsp', 'teaspoon': 'tsp', 'teaspoons': 'tsp',
+    'tbsp': 'tbsp', 'tbs': 'tbsp', 'tablespoon': 'tbsp', 'tablespoons': 'tbsp',
+    'cup': 'cup', 'cups': 'cup', 'c': 'cup',
+    'oz': 'oz', 'ounce': 'oz', 'ounces': 'oz',
+    'lb': 'lb', 'lbs': 'lb', 'pound': 'lb', 'pounds': 'lb',
+    'pinch': 'pinch', 'pinches': 'pinch', 'dash': 'dash', 'dashes': 'dash',
+    'clove': 'clove', 'cloves': 'clove', 'can': 'can', 'cans': 'can',
+    'slice': 'slice', 'slices': 'slice', 'bunch': 'bunch', 'bunches': 'bunch',
+    'handful': 'handful', 'handfuls': 'handful', 'piece': 'piece', 'pieces': 'piece',
+}
+
+_NUMBER = r'\d+/\d+|\d+(?:[.,]\d+)?(?:\s+\d+/\d+)?'
+# "2", "1 1/2", "1/2", "1.5", "2-3", "2 to 3"
+QUANTITY = re.compile(rf'^(?P<quantity>(?:{_NUMBER})(?:\s*(?:-|–|to)\s*(?:{_NUMBER}))?)\s*')
+# Bullets and numbering people paste in front of lines: "- ", "* ", "• ", "1. ", "2) "
+LIST_MARKER = re.compile(r'^\s*(?:[-*•·]+|\d+[.)])\s+')
+
+
+def clean_lines(text):
+    """Non-empty, stripped lines of ``text``"""
+    return [line.strip() for line in (text or '').splitlines() if line.strip()]
+
+
+def parse_amount(quantity):
+    """Numeric value of a quantity string (the lower bound of a range), or None"""
+    first = re.split(r'\s*(?:-|–|to)\s*', quantity)[0]
+    try:
+        return float(sum(Fraction(part.replace(',', '.')) for part in first.split()))
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def parse_ingredient(line):
+    """Split one ingredient line into quantity, canonical unit and item; the text is kept as written"""
+    text = line.strip()
+    rest = text
+    for symbol, fraction in UNICODE_FRACTIONS.items():
+        rest = rest.replace(symbol, f' {fraction}')
+    rest = LIST_MARKER.sub('', rest).strip()
+
+    quantity = None
+    match = QUANTITY.match(rest)
+    if match:
+        quantity = match.group('quantity')
+        rest = rest[match.end():]
+
+    unit = None
+    # "200g", "2 tbsp.", "1 cup of"; without a quantity "Cup noodles" is an item
+    unit_match = re.match(r'^([a-zA-Z]+)\.?(?:\s+|$)', rest) if quantity else None
+    if unit_match and unit_match.group(1).lower() in UNITS:
+        unit = UNITS[unit_match.group(1).lower()]
+        rest = rest[unit_match.end():]
+        rest = re.sub(r'^of\s+', '', rest, flags=re.IGNORECASE)
+
+    return {
+        'text': text,
+        'quantity': quantity,
+        'amount': parse_amount(quantity) if quantity else None,
+        'unit': unit,
+        'item': rest.strip() or text,
+    }
+
+
+def parse_ingredients(text):
+    return [parse_ingredient(line) for line in clean_lines(text)]
+
+
+def parse_instructions(text):
+    """One step per non-empty line, with any numbering the author typed removed"""
+    return [LIST_MARKER.sub('', line).strip() or line for line in clean_lines(text)]
+
+
+def parse_existing_recipes(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    batch = []
+    for recipe in Recipe.objects.only('ingredients', 'instructions').iterator(chunk_size=1000):
+        recipe.ingredient_items = parse_ingredients(recipe.ingredients)
+        recipe.instruction_steps = parse_instructions(recipe.instructions)
+        batch.append(recipe)
+        if len(batch) == 1000:
+            Recipe.objects.bulk_update(batch, ['ingredient_items', 'instruction_steps'])
+            batch = []
+    Recipe.objects.bulk_update(batch, ['ingredient_items', 'instruction_steps'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredient_items',
+            field=models.JSONField(default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='instruction_steps',
+            field=models.JSONField(default=list, editable=False),
+        ),
+        migrations.RunPython(parse_existing_recipes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2025-11-24 07:40
+
+from django.db import migrations, models
+
+
+def populate_comment_counts(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Comment = apps.get_model('recipes', 'Comment')
+    totals = Comment.objects.order_by().values('recipe').annotate(count=models.Count('id'))
+    recipes = [Recipe(pk=row['recipe'], comment_count=row['count']) for row in totals]
+    Recipe.objects.bulk_update(recipes, ['comment_count'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_parsed_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_comment_counts, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['recipe', '-created_at', '-id'], name='comment_recipe_created_idx'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.7 on 2025-11-24 08:05
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Avg, Count, Q, Sum
+import django.db.models.deletion
+
+
+def populate_author_stats(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Recipe = apps.get_model('recipes', 'Recipe')
+    AuthorStats = apps.get_model('recipes', 'AuthorStats')
+    approved = Q(status='approved')
+    rated = Q(average_rating__gt=0)
+    aggregates = {
+        'total_recipes': Count('id'),
+        'approved_recipes': Count('id', filter=approved),
+        'pending_recipes': Count('id', filter=Q(status='pending')),
+        'rejected_recipes': Count('id', filter=Q(status='rejected')),
+        'average_rating': Avg('average_rating', filter=rated),
+        'approved_average_rating': Avg('average_rating', filter=rated & approved),
+        'rating_count': Sum('rating_count'),
+        'comment_count': Sum('comment_count'),
+    }
+    # The aliases must not clash with Recipe fields (e.g. average_rating)
+    rows = Recipe.objects.order_by().values('author').annotate(
+        **{f'stat_{name}': aggregate for name, aggregate in aggregates.items()}
+    )
+    totals = {row['author']: {name: row[f'stat_{name}'] or 0 for name in aggregates} for row in rows}
+    AuthorStats.objects.bulk_create([
+        AuthorStats(user_id=pk, **totals.get(pk, {}))
+        for pk in User.objects.values_list('pk', flat=True).iterator()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0007_recipe_comment_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='recipe_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total_recipes', models.PositiveIntegerField(default=0)),
+                ('approved_recipes', models.PositiveIntegerField(default=0)),
+                ('pending_recipes', models.PositiveIntegerField(default=0)),
+                ('rejected_recipes', models.PositiveIntegerField(default=0)),
+                ('average_rating', models.DecimalField(decimal_places=2, default=0, max_digits=3)),
+                ('approved_average_rating', models.DecimalField(decimal_places=2, default=0, max_digits=3)),
+                ('rating_count', models.PositiveIntegerField(default=0)),
+                ('comment_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'author stats',
+            },
+        ),
+        migrations.RunPython(populate_author_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2025-11-24 08:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_author_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='recipes.recipe')),
+                ('recommended', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommended_in', to='recipes.recipe')),
+            ],
+            options={
+                'ordering': ['recipe', 'rank'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='reciperecommendation',
+            constraint=models.UniqueConstraint(fields=('recipe', 'rank'), name='unique_recommendation_rank'),
+        ),
+    ]
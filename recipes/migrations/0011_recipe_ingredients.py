@@ -0,0 +1,58 @@
+# Generated by Django 4.2.7 on 2025-11-24 09:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from recipes.parsing import normalize_ingredient
+
+
+def link_existing_recipes(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    names = {
+        pk: {name for name in (normalize_ingredient(item['item']) for item in items) if name}
+        for pk, items in Recipe.objects.values_list('pk', 'ingredient_items').iterator(chunk_size=1000)
+    }
+    Ingredient.objects.bulk_create(
+        [Ingredient(name=name) for name in sorted(set().union(*names.values()))], batch_size=500
+    )
+    ids = dict(Ingredient.objects.values_list('name', 'pk'))
+    RecipeIngredient.objects.bulk_create(
+        (RecipeIngredient(recipe_id=pk, ingredient_id=ids[name]) for pk, recipe_names in names.items()
+         for name in recipe_names),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Ingredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RecipeIngredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipe_links', to='recipes.ingredient')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ingredient_links', to='recipes.recipe')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='recipeingredient',
+            constraint=models.UniqueConstraint(fields=('ingredient', 'recipe'), name='unique_recipe_ingredient'),
+        ),
+        migrations.RunPython(link_existing_recipes, migrations.RunPython.noop),
+    ]
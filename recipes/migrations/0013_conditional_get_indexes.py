@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2025-11-24 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_moderation_log'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(fields=['recipe', '-updated_at'], name='rating_recipe_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(fields=['-updated_at'], name='rating_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-updated_at'], name='recipe_updated_idx'),
+        ),
+    ]
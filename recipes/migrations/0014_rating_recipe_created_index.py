@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2025-11-24 10:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_conditional_get_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(fields=['recipe', '-created_at', '-id'], name='rating_recipe_created_idx'),
+        ),
+    ]
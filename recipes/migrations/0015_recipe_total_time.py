@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2025-11-24 10:45
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_total_time(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.update(total_time=F('prep_time') + F('cook_time'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_rating_recipe_created_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='total_time',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_total_time, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['status', 'total_time'], name='recipe_status_total_time_idx'),
+        ),
+    ]
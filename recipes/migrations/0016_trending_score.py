@@ -0,0 +1,64 @@
+# Generated by Django 4.2.7 on 2025-11-24 11:00
+
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def score_existing_activity(apps, schema_editor):
+    """Start the epoch now and score the ratings and comments of the last 20 half-lives"""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Rating = apps.get_model('recipes', 'Rating')
+    Comment = apps.get_model('recipes', 'Comment')
+    TrendingEpoch = apps.get_model('recipes', 'TrendingEpoch')
+    now = time.time()
+    half_life = getattr(settings, 'TRENDING_HALF_LIFE_HOURS', 48) * 3600
+    since = datetime.fromtimestamp(now - 20 * half_life, tz=timezone.utc)
+    scores = defaultdict(float)
+    for recipe_id, rating, created_at in Rating.objects.filter(created_at__gte=since).values_list(
+        'recipe_id', 'rating', 'created_at'
+    ).iterator(chunk_size=10000):
+        scores[recipe_id] += 2.0 * rating / 5 * 2 ** ((created_at.timestamp() - now) / half_life)
+    for recipe_id, created_at in Comment.objects.filter(created_at__gte=since).values_list(
+        'recipe_id', 'created_at'
+    ).iterator(chunk_size=10000):
+        scores[recipe_id] += 2 ** ((created_at.timestamp() - now) / half_life)
+    TrendingEpoch.objects.create(pk=1, epoch=now)
+    Recipe.objects.bulk_update(
+        [Recipe(pk=pk, trending_score=score) for pk, score in scores.items()], ['trending_score'], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_recipe_total_time'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingEpoch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('epoch', models.FloatField(help_text='Unix time')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.RunPython(score_existing_activity, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['-created_at'], name='comment_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['status', '-trending_score', '-created_at'], name='recipe_status_trending_idx'),
+        ),
+    ]
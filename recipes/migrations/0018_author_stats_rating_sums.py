@@ -0,0 +1,63 @@
+# Generated by Django 4.2.7 on 2025-11-24 11:30
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def sum_rated_recipes(apps, schema_editor):
+    """Fill the sums and counts the stored averages are kept incrementally from"""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    AuthorStats = apps.get_model('recipes', 'AuthorStats')
+    rated = Q(average_rating__gt=0)
+    approved = rated & Q(status='approved')
+    rows = Recipe.objects.order_by().values('author').annotate(
+        stat_rated=Count('id', filter=rated),
+        stat_rated_sum=Sum('average_rating', filter=rated),
+        stat_approved=Count('id', filter=approved),
+        stat_approved_sum=Sum('average_rating', filter=approved),
+    )
+    totals = {row['author']: row for row in rows.iterator()}
+    batch = []
+    for stats in AuthorStats.objects.iterator(chunk_size=1000):
+        row = totals.get(stats.user_id)
+        if row is None:
+            continue
+        stats.rated_recipes = row['stat_rated']
+        stats.rating_average_sum = row['stat_rated_sum'] or 0
+        stats.approved_rated_recipes = row['stat_approved']
+        stats.approved_rating_average_sum = row['stat_approved_sum'] or 0
+        batch.append(stats)
+    AuthorStats.objects.bulk_update(batch, [
+        'rated_recipes', 'rating_average_sum', 'approved_rated_recipes', 'approved_rating_average_sum',
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0017_recipe_view_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authorstats',
+            name='approved_rated_recipes',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='authorstats',
+            name='approved_rating_average_sum',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='authorstats',
+            name='rated_recipes',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='authorstats',
+            name='rating_average_sum',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(sum_rated_recipes, migrations.RunPython.noop),
+    ]
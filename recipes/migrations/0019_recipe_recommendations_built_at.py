@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2025-11-24 11:40
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def mark_recipes_with_recommendations(apps, schema_editor):
+    """Recipes that already have a list were handled by an earlier build"""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.filter(recommendations__isnull=False).update(recommendations_built_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0018_author_stats_rating_sums'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='recommendations_built_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(mark_recipes_with_recommendations, migrations.RunPython.noop),
+    ]
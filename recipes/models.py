@@ -1,7 +1,15 @@
-from django.db import models
+from collections import defaultdict
+
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db.models import Case, Count, DecimalField, F, FloatField, Q, Sum, Value, When
+from django.db.models.functions import Cast, Greatest, Round
+from django.db.models.lookups import GreaterThan
 from django.urls import reverse
+from django.utils import timezone
+
+from .parsing import parse_ingredients, parse_instructions
 
 
 class UserProfile(models.Model):
@@ -29,12 +37,20 @@ class UserProfile(models.Model):
         return f"{self.user.username}'s Profile"
 
 
+class CategoryQuerySet(models.QuerySet):
+    def with_recipe_counts(self):
+        """Annotate each category with ``recipe_count`` in the same query"""
+        return self.annotate(recipe_count=Count('recipes'))
+
+
 class Category(models.Model):
     """Recipe categories"""
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = CategoryQuerySet.as_manager()
+
     class Meta:
         verbose_name_plural = "Categories"
         ordering = ['name']
@@ -43,6 +59,55 @@ class Category(models.Model):
         return self.name
 
 
+def average_rating_expression():
+    """SQL expression deriving ``average_rating`` from the stored rating counters"""
+    return Case(
+        When(rating_count__gt=0, then=Round(Cast(F('rating_sum'), FloatField()) / F('rating_count'), 2)),
+        default=Value(0),
+        output_field=DecimalField(max_digits=3, decimal_places=2),
+    )
+
+
+class RecipeQuerySet(models.QuerySet):
+    def approved(self):
+        return self.filter(status='approved')
+
+    def visible_to(self, user):
+        """Approved recipes plus, for a logged in user, their own recipes in any status"""
+        if user.is_authenticated:
+            return self.filter(Q(status='approved') | Q(author=user))
+        return self.approved()
+
+    def recommended_for(self, recipe_id):
+        """The stored recommendations of a recipe, best first, in one indexed query"""
+        return self.approved().filter(recommended_in__recipe_id=recipe_id).order_by('recommended_in__rank')
+
+    def for_listing(self):
+        """Join the author and category so recipe cards render without extra queries"""
+        # Cards never show the (potentially long) ingredients and instructions
+        return self.select_related('author', 'category').defer(*Recipe.LONG_TEXT_FIELDS)
+
+    def author_stats(self):
+        """``(author id, recipe_author_stats(...))`` of each recipe, as stored"""
+        rows = self.values_list('author', 'status', 'rating_count', 'comment_count', 'average_rating')
+        return [(author_id, recipe_author_stats(*fields)) for author_id, *fields in rows]
+
+    def apply_rating_change(self, sum_delta, count_delta):
+        """
+        Atomically adjust the rating counters and average in SQL, without
+        reading ratings, and move the authors' stats with them
+        """
+        with transaction.atomic():
+            before = self.select_for_update().author_stats()
+            self.update(
+                rating_sum=F('rating_sum') + sum_delta,
+                rating_count=F('rating_count') + count_delta,
+            )
+            # The first UPDATE holds the row lock, so this sees the new counters
+            self.update(average_rating=average_rating_expression())
+            AuthorStats.objects.apply_changes(removed=before, added=self.author_stats())
+
+
 class Recipe(models.Model):
     """Recipe model"""
     STATUS_CHOICES = [
@@ -55,9 +120,16 @@ class Recipe(models.Model):
     description = models.TextField()
     ingredients = models.TextField(help_text="List ingredients, one per line")
     instructions = models.TextField(help_text="Step-by-step cooking instructions")
+    # Parsed from the two fields above on save (see recipes.parsing)
+    ingredient_items = models.JSONField(default=list, editable=False)
+    instruction_steps = models.JSONField(default=list, editable=False)
     prep_time = models.PositiveIntegerField(help_text="Preparation time in minutes")
     cook_time = models.PositiveIntegerField(help_text="Cooking time in minutes")
     servings = models.PositiveIntegerField()
+    # prep_time + cook_time, kept by save() so time ranges can use an index
+    total_time = models.PositiveIntegerField(default=0, editable=False)
+    # Time-decayed activity, relative to TrendingEpoch (see recipes.trending)
+    trending_score = models.FloatField(default=0, editable=False)
     image = models.ImageField(upload_to='recipe_images/', blank=True, null=True)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='recipes')
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recipes')
@@ -65,9 +137,38 @@ class Recipe(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     average_rating = models.DecimalField(max_digits=3, decimal_places=2, default=0.00)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    # Page views, written in batches by recipes.counters
+    view_count = models.PositiveIntegerField(default=0, editable=False)
+    # When build_recommendations last computed this recipe's neighbours (it may have none)
+    recommendations_built_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = RecipeQuerySet.as_manager()
+
+    LONG_TEXT_FIELDS = ('ingredients', 'instructions', 'ingredient_items', 'instruction_steps')
+    # Written by queryset updates only (rating, comment, view and trending counters, the
+    # recommendations timestamp), never by save()
+    MAINTAINED_FIELDS = (
+        'rating_sum', 'rating_count', 'average_rating', 'comment_count', 'view_count', 'trending_score',
+        'recommendations_built_at',
+    )
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Listings filter on status and/or author, optionally category, newest first
+            models.Index(fields=['status', '-created_at'], name='recipe_status_created_idx'),
+            models.Index(fields=['author', '-created_at'], name='recipe_author_created_idx'),
+            models.Index(fields=['category', 'status', '-created_at'], name='recipe_cat_status_created_idx'),
+            # Last-Modified of the listings (recipes.conditional)
+            models.Index(fields=['-updated_at'], name='recipe_updated_idx'),
+            # Total time ranges of the home facets (recipes.facets)
+            models.Index(fields=['status', 'total_time'], name='recipe_status_total_time_idx'),
+            # Trending listing (home ?sort=trending)
+            models.Index(fields=['status', '-trending_score', '-created_at'], name='recipe_status_trending_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -75,13 +176,37 @@ class Recipe(models.Model):
     def get_absolute_url(self):
         return reverse('recipe_detail', kwargs={'pk': self.pk})
 
+    def parse_text_fields(self):
+        """Refresh ``ingredient_items`` and ``instruction_steps`` from the text fields"""
+        self.ingredient_items = parse_ingredients(self.ingredients)
+        self.instruction_steps = parse_instructions(self.instructions)
+
+    def save(self, *args, **kwargs):
+        self.total_time = self.prep_time + self.cook_time
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            self.parse_text_fields()
+            if not self._state.adding and not kwargs.get('force_insert'):
+                # A full save of a loaded recipe would write back values moved since it was read
+                kwargs['update_fields'] = [
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key and field.name not in self.MAINTAINED_FIELDS
+                ]
+        else:
+            if {'ingredients', 'instructions'} & set(update_fields):
+                self.parse_text_fields()
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'ingredient_items', 'instruction_steps'}
+            if {'prep_time', 'cook_time'} & set(update_fields):
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'total_time'}
+        super().save(*args, **kwargs)
+
     def calculate_average_rating(self):
-        """Calculate and update average rating"""
-        ratings = self.ratings.all()
-        if ratings.exists():
-            avg = sum(rating.rating for rating in ratings) / ratings.count()
-            self.average_rating = round(avg, 2)
-            self.save(update_fields=['average_rating'])
+        """Recompute the rating counters and average from the Rating table"""
+        totals = self.ratings.aggregate(total=models.Sum('rating'), count=Count('id'))
+        self.rating_sum = totals['total'] or 0
+        self.rating_count = totals['count']
+        self.average_rating = round(self.rating_sum / self.rating_count, 2) if self.rating_count else 0
+        self.save(update_fields=['rating_sum', 'rating_count', 'average_rating'])
         return self.average_rating
 
 
@@ -95,6 +220,12 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Comment pages are keyset-paged per recipe on (created_at, id), newest first
+            models.Index(fields=['recipe', '-created_at', '-id'], name='comment_recipe_created_idx'),
+            # Latest comment of all recipes (recipes.conditional); comments move the trending listing
+            models.Index(fields=['-created_at'], name='comment_created_idx'),
+        ]
 
     def __str__(self):
         return f"Comment by {self.author.username} on {self.recipe.title}"
@@ -114,10 +245,258 @@ class Rating(models.Model):
     class Meta:
         unique_together = ['recipe', 'user']  # One rating per user per recipe
         ordering = ['-created_at']
+        indexes = [
+            # Latest rating change of one recipe, and of all recipes (recipes.conditional)
+            models.Index(fields=['recipe', '-updated_at'], name='rating_recipe_updated_idx'),
+            models.Index(fields=['-updated_at'], name='rating_updated_idx'),
+            # Keyset pages of a recipe's ratings in the API
+            models.Index(fields=['recipe', '-created_at', '-id'], name='rating_recipe_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} rated {self.recipe.title} {self.rating}/5"
 
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        self.recipe.calculate_average_rating()
\ No newline at end of file
+        with transaction.atomic():
+            previous = None
+            if self.pk:
+                previous = Rating.objects.select_for_update().filter(pk=self.pk).values_list(
+                    'rating', flat=True
+                ).first()
+            super().save(*args, **kwargs)
+            recipe = Recipe.objects.filter(pk=self.recipe_id)
+            if previous is None:
+                recipe.apply_rating_change(self.rating, 1)
+            elif previous != self.rating:
+                recipe.apply_rating_change(self.rating - previous, 0)
+
+
+class TrendingEpoch(models.Model):
+    """
+    The single row holding the time that stored trending scores are relative to.
+
+    An event at time ``t`` adds ``weight * 2 ** ((t - epoch) / half-life)`` to
+    its recipe's ``trending_score``; see ``recipes.trending``.
+    """
+    epoch = models.FloatField(help_text='Unix time')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Trending epoch {self.epoch}'
+
+
+class RecipeRecommendation(models.Model):
+    """A precomputed similar recipe, built offline by ``build_recommendations``"""
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='recommendations')
+    recommended = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='recommended_in')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ['recipe', 'rank']
+        constraints = [
+            # Also the index recipe_detail reads a recipe's list through
+            models.UniqueConstraint(fields=['recipe', 'rank'], name='unique_recommendation_rank'),
+        ]
+
+    def __str__(self):
+        return f"{self.recipe_id} -> {self.recommended_id} ({self.score:.3f})"
+
+
+class ModerationLog(models.Model):
+    """One recipe status transition, written in bulk by ``moderation.transition``"""
+    # The entry outlives the recipe, keeping its title
+    recipe = models.ForeignKey(Recipe, on_delete=models.SET_NULL, null=True, related_name='moderation_log')
+    recipe_title = models.CharField(max_length=200)
+    moderator = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='moderation_actions')
+    from_status = models.CharField(max_length=10, choices=Recipe.STATUS_CHOICES)
+    to_status = models.CharField(max_length=10, choices=Recipe.STATUS_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['recipe', '-created_at'], name='modlog_recipe_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.recipe_title}: {self.from_status} -> {self.to_status}"
+
+
+class Ingredient(models.Model):
+    """An entry of the normalized ingredient vocabulary (see ``parsing.normalize_ingredient``)"""
+    name = models.CharField(max_length=100, unique=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
+class RecipeIngredient(models.Model):
+    """One posting of the ingredient -> recipes inverted index"""
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='ingredient_links')
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE, related_name='recipe_links')
+
+    class Meta:
+        constraints = [
+            # Ingredient first: this is the posting list of each ingredient
+            models.UniqueConstraint(fields=['ingredient', 'recipe'], name='unique_recipe_ingredient'),
+        ]
+
+    def __str__(self):
+        return f"{self.recipe_id} uses {self.ingredient_id}"
+
+
+def author_stats_aggregates():
+    """Per-author totals of their recipes, all computed by one grouped query"""
+    approved = Q(status='approved')
+    rated = Q(average_rating__gt=0)
+    return {
+        'total_recipes': Count('id'),
+        'approved_recipes': Count('id', filter=approved),
+        'pending_recipes': Count('id', filter=Q(status='pending')),
+        'rejected_recipes': Count('id', filter=Q(status='rejected')),
+        'rated_recipes': Count('id', filter=rated),
+        'rating_average_sum': Sum('average_rating', filter=rated),
+        'approved_rated_recipes': Count('id', filter=rated & approved),
+        'approved_rating_average_sum': Sum('average_rating', filter=rated & approved),
+        'rating_count': Sum('rating_count'),
+        'comment_count': Sum('comment_count'),
+    }
+
+
+def author_stats_rows(recipes):
+    """``{author id: {stats field: value}}`` for the authors of ``recipes``"""
+    aggregates = author_stats_aggregates()
+    # The aliases must not clash with Recipe fields (e.g. average_rating)
+    rows = recipes.order_by().values('author').annotate(
+        **{f'stat_{name}': aggregate for name, aggregate in aggregates.items()}
+    )
+    return {row['author']: {name: row[f'stat_{name}'] or 0 for name in aggregates} for row in rows}
+
+
+def recipe_author_stats(status, rating_count, comment_count, average_rating):
+    """What one recipe adds to each of its author's totals (see ``author_stats_aggregates``)"""
+    rated = average_rating > 0
+    approved = status == 'approved'
+    return {
+        'total_recipes': 1,
+        f'{status}_recipes': 1,
+        'rated_recipes': int(rated),
+        'rating_average_sum': average_rating if rated else 0,
+        'approved_rated_recipes': int(rated and approved),
+        'approved_rating_average_sum': average_rating if rated and approved else 0,
+        'rating_count': rating_count,
+        'comment_count': comment_count,
+    }
+
+
+# Average field -> (sum field, count field) it is derived from
+AUTHOR_AVERAGES = {
+    'average_rating': ('rating_average_sum', 'rated_recipes'),
+    'approved_average_rating': ('approved_rating_average_sum', 'approved_rated_recipes'),
+}
+
+
+def author_average_expressions(deltas=None):
+    """SQL deriving the averages from the sums and counts, as they are once ``deltas`` are added"""
+    deltas = deltas or {}
+    expressions = {}
+    for average, (total, count) in AUTHOR_AVERAGES.items():
+        total = Cast(F(total), FloatField()) + float(deltas.get(total, 0))
+        count = F(count) + deltas.get(count, 0)
+        expressions[average] = Case(
+            When(GreaterThan(count, 0), then=Round(total / count, 2)),
+            default=Value(0),
+            output_field=DecimalField(max_digits=3, decimal_places=2),
+        )
+    return expressions
+
+
+class AuthorStatsQuerySet(models.QuerySet):
+    def refresh(self, author_ids):
+        """Recompute the stats rows of ``author_ids`` from their recipes with a single grouped query"""
+        author_ids = set(User.objects.filter(pk__in=list(author_ids)).values_list('pk', flat=True))
+        if not author_ids:
+            return []
+        totals = author_stats_rows(Recipe.objects.filter(author__in=author_ids))
+        stats = [AuthorStats(user_id=author_id, **totals.get(author_id, {})) for author_id in author_ids]
+        with transaction.atomic():
+            stats = self.bulk_create(
+                stats, update_conflicts=True, unique_fields=['user'],
+                update_fields=[*author_stats_aggregates(), 'updated_at'],
+            )
+            self.filter(user__in=author_ids).update(**author_average_expressions())
+        return stats
+
+    def apply_changes(self, removed=(), added=()):
+        """
+        Take the totals of ``removed`` recipes out of their authors' rows and add
+        those of ``added`` ones, both ``(author id, recipe_author_stats(...))``,
+        with one UPDATE per author. Rows that don't exist yet are left to
+        ``AuthorStats.for_author`` to build.
+        """
+        deltas = defaultdict(lambda: defaultdict(int))
+        for sign, recipes in ((-1, removed), (1, added)):
+            for author_id, totals in recipes:
+                for name, value in totals.items():
+                    deltas[author_id][name] += sign * value
+        for author_id, delta in deltas.items():
+            delta = {name: value for name, value in delta.items() if value}
+            if not delta:
+                continue
+            updates = {}
+            for name, value in delta.items():
+                updates[name] = F(name) + value
+                if value < 0:
+                    # A drifted row bottoms out at zero instead of failing the write; rebuild_author_stats repairs it
+                    updates[name] = Greatest(updates[name], Value(0), output_field=self.model._meta.get_field(name))
+            if {field for fields in AUTHOR_AVERAGES.values() for field in fields} & set(delta):
+                updates.update(author_average_expressions(delta))
+            self.filter(user_id=author_id).update(**updates, updated_at=timezone.now())
+
+
+class AuthorStats(models.Model):
+    """
+    Materialized per-author totals shown on my_recipes and user_profile.
+
+    Every change to an author's recipes, their ratings or comments adds its
+    difference to the row (see ``apply_changes`` and ``recipes.signals``), so
+    keeping it current costs one UPDATE however many recipes the author has.
+    The averages are kept as sums and counts of the rated recipes' averages.
+    ``rebuild_author_stats`` recomputes every row with ``refresh``.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='recipe_stats')
+    total_recipes = models.PositiveIntegerField(default=0)
+    approved_recipes = models.PositiveIntegerField(default=0)
+    pending_recipes = models.PositiveIntegerField(default=0)
+    rejected_recipes = models.PositiveIntegerField(default=0)
+    # Mean of the author's rated recipes' averages; the second only counts approved recipes
+    average_rating = models.DecimalField(max_digits=3, decimal_places=2, default=0)
+    approved_average_rating = models.DecimalField(max_digits=3, decimal_places=2, default=0)
+    rated_recipes = models.PositiveIntegerField(default=0)
+    rating_average_sum = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    approved_rated_recipes = models.PositiveIntegerField(default=0)
+    approved_rating_average_sum = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = AuthorStatsQuerySet.as_manager()
+
+    class Meta:
+        verbose_name_plural = 'author stats'
+
+    def __str__(self):
+        return f"{self.user.username}'s recipe stats"
+
+    @classmethod
+    def for_author(cls, user):
+        """The author's stats row, computed on first use"""
+        stats = cls.objects.filter(user=user).first()
+        if stats is None:
+            cls.objects.refresh([user.pk])
+            stats = cls.objects.get(user=user)
+        return stats
@@ -0,0 +1,59 @@
+"""
+Recipe moderation.
+
+``transition`` moves recipes between statuses in batches of
+``MODERATION_BATCH_SIZE``. Each batch is one transaction that updates the rows,
+writes their ``ModerationLog`` entries with a single ``bulk_create`` and, once
+committed, sends one ``recipes_changed`` signal for the whole batch (with the
+recipes' previous statuses), which the receivers in ``recipes.signals`` turn
+into cache and ingredient index refreshes and author stats updates.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ModerationLog, Recipe
+from .pagination import CursorPaginator
+from .signals import recipes_changed
+
+
+def pending_queue(cursor=None, per_page=25):
+    """A keyset page of the recipes awaiting review, newest first"""
+    recipes = Recipe.objects.filter(status='pending').for_listing()
+    return CursorPaginator(recipes, per_page).get_page(cursor)
+
+
+def transition(recipe_ids, status, moderator=None, batch_size=None):
+    """
+    Move ``recipe_ids`` to ``status``, skipping those already in it.
+    Returns how many recipes changed.
+    """
+    batch_size = batch_size or getattr(settings, 'MODERATION_BATCH_SIZE', 500)
+    recipe_ids = list(recipe_ids)
+    changed = 0
+    for start in range(0, len(recipe_ids), batch_size):
+        with transaction.atomic():
+            rows = list(
+                Recipe.objects.select_for_update()
+                .filter(pk__in=recipe_ids[start:start + batch_size])
+                .exclude(status=status)
+                .values_list('pk', 'title', 'status')
+            )
+            if not rows:
+                continue
+            batch_ids = [pk for pk, _, _ in rows]
+            # update() skips auto_now
+            Recipe.objects.filter(pk__in=batch_ids).update(status=status, updated_at=timezone.now())
+            ModerationLog.objects.bulk_create([
+                ModerationLog(recipe_id=pk, recipe_title=title, moderator=moderator,
+                              from_status=previous, to_status=status)
+                for pk, title, previous in rows
+            ])
+            previous_statuses = {pk: previous for pk, _, previous in rows}
+            transaction.on_commit(
+                lambda batch_ids=batch_ids, previous_statuses=previous_statuses: recipes_changed.send(
+                    sender=Recipe, recipe_ids=batch_ids, status=status, previous_statuses=previous_statuses,
+                )
+            )
+        changed += len(rows)
+    return changed
@@ -0,0 +1,213 @@
+"""
+Pagination for recipe listings.
+
+``CursorPaginator`` pages on ``(created_at, id)`` with opaque next/previous
+tokens, so deep pages cost the same as the first one. Its ``count`` and that of
+``EstimatedCountPaginator`` come from ``estimate_count``, which avoids a full
+COUNT(*) scan on large tables; both then set ``count_is_estimate``.
+"""
+import base64
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connection
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+def estimate_count(queryset):
+    """
+    Count ``queryset`` without scanning more than ``PAGINATION_COUNT_LIMIT`` rows.
+
+    Returns ``(count, is_estimate)``. PostgreSQL answers large results from the
+    planner's row estimate; other databases stop counting at the limit.
+    """
+    limit = getattr(settings, 'PAGINATION_COUNT_LIMIT', 10000)
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.order_by().values('pk').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        estimate = int(plan[0]['Plan']['Plan Rows'])
+        if estimate > limit:
+            return estimate, True
+    count = queryset.order_by()[:limit + 1].count()
+    if count > limit:
+        return limit, True
+    return count, False
+
+
+class EstimatedPage(Page):
+    """A page whose ``has_next`` comes from fetching one row past it, not from the total"""
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Django's Paginator with the total taken from ``estimate_count``.
+
+    An estimated total can't say where the last page is, so page numbers are
+    then not clamped to it: a page exists while it has rows, and templates
+    show "more than N" without a link to the last page.
+    """
+
+    count_is_estimate = False
+
+    @cached_property
+    def count(self):
+        count, self.count_is_estimate = estimate_count(self.object_list)
+        return count
+
+    def validate_number(self, number):
+        self.count  # Sets count_is_estimate
+        if not self.count_is_estimate:
+            return super().validate_number(number)
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.count_is_estimate:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage('That page contains no results')
+        return EstimatedPage(rows[:self.per_page], number, self, len(rows) > self.per_page)
+
+    def get_page(self, number):
+        try:
+            return super().get_page(number)
+        except EmptyPage:
+            # Past the end of an estimated total, where there is no known last page
+            return self.page(1)
+
+
+def encode_cursor(row, direction):
+    """Cursor token after/before ``row``: a model instance, or a ``values()`` dict with created_at and id"""
+    created_at, pk = (row['created_at'], row['id']) if isinstance(row, dict) else (row.created_at, row.pk)
+    payload = {'c': created_at.isoformat(), 'i': pk, 'd': direction}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Return ``(created_at, id, direction)``, or None for a missing or malformed token"""
+    if not token:
+        return None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        direction = payload['d'] if payload['d'] in ('next', 'prev') else 'next'
+        return datetime.fromisoformat(payload['c']), int(payload['i']), direction
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+class CursorPage:
+    """One page of a CursorPaginator; mirrors the parts of Page the templates use"""
+
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        return encode_cursor(self.object_list[-1], 'next') if self._has_next else None
+
+    @property
+    def previous_cursor(self):
+        return encode_cursor(self.object_list[0], 'prev') if self._has_previous else None
+
+
+class CursorPaginator:
+    """Keyset pagination over ``(created_at, id)``, newest first"""
+
+    count_is_estimate = False
+
+    def __init__(self, object_list, per_page):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+
+    @cached_property
+    def count(self):
+        count, self.count_is_estimate = estimate_count(self.object_list)
+        return count
+
+    def get_page(self, token):
+        cursor = decode_cursor(token)
+        queryset = self.object_list
+        if cursor is None:
+            rows = list(queryset.order_by('-created_at', '-id')[:self.per_page + 1])
+            return CursorPage(rows[:self.per_page], self, len(rows) > self.per_page, False)
+
+        created_at, pk, direction = cursor
+        if direction == 'next':
+            rows = list(queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+            ).order_by('-created_at', '-id')[:self.per_page + 1])
+            return CursorPage(rows[:self.per_page], self, len(rows) > self.per_page, True)
+
+        rows = list(queryset.filter(
+            Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+        ).order_by('created_at', 'id')[:self.per_page + 1])
+        page_rows = rows[:self.per_page]
+        page_rows.reverse()
+        return CursorPage(page_rows, self, True, len(rows) > self.per_page)
+
+
+def paginate(request, queryset, per_page, ordered_by_date=True, count=None):
+    """
+    Return the page of ``queryset`` requested by ``request``.
+
+    A ``cursor`` parameter, or ``PAGINATION_MODE = 'cursor'``, selects keyset
+    paging; results in another order (e.g. search relevance) always use page
+    numbers. Pass ``count`` when the number of rows is already known to skip
+    the COUNT query.
+    """
+    mode = getattr(settings, 'PAGINATION_MODE', 'page')
+    if ordered_by_date and ('cursor' in request.GET or mode == 'cursor'):
+        paginator, token = CursorPaginator(queryset, per_page), request.GET.get('cursor')
+    else:
+        paginator_class = EstimatedCountPaginator if getattr(settings, 'PAGINATION_ESTIMATE_COUNT', False) else Paginator
+        paginator, token = paginator_class(queryset, per_page), request.GET.get('page')
+    if count is not None:
+        paginator.count = count  # Fills the cached_property
+    return paginator.get_page(token)
@@ -0,0 +1,128 @@
+"""
+Parsing of the free-text ingredient and instruction fields.
+
+Recipes store the parsed form next to the text (``Recipe.ingredient_items`` and
+``Recipe.instruction_steps``), so pages render from ready-made lists instead of
+splitting and stripping the text on every view.
+"""
+import re
+from fractions import Fraction
+
+UNICODE_FRACTIONS = {
+    '¼': '1/4', '½': '1/2', '¾': '3/4', '⅓': '1/3', '⅔': '2/3',
+    '⅛': '1/8', '⅜': '3/8', '⅝': '5/8', '⅞': '7/8',
+}
+
+# Spelling as written -> canonical unit
+UNITS = {
+    'g': 'g', 'gram': 'g', 'grams': 'g', 'gr': 'g',
+    'kg': 'kg', 'kilogram': 'kg', 'kilograms': 'kg',
+    'mg': 'mg',
+    'ml': 'ml', 'millilitre': 'ml', 'milliliter': 'ml', 'millilitres': 'ml', 'milliliters': 'ml',
+    'l': 'l', 'litre': 'l', 'liter': 'l', 'litres': 'l', 'liters': 'l',
+    'tsp': 'tsp', 'teaspoon': 'tsp', 'teaspoons': 'tsp',
+    'tbsp': 'tbsp', 'tbs': 'tbsp', 'tablespoon': 'tbsp', 'tablespoons': 'tbsp',
+    'cup': 'cup', 'cups': 'cup', 'c': 'cup',
+    'oz': 'oz', 'ounce': 'oz', 'ounces': 'oz',
+    'lb': 'lb', 'lbs': 'lb', 'pound': 'lb', 'pounds': 'lb',
+    'pinch': 'pinch', 'pinches': 'pinch', 'dash': 'dash', 'dashes': 'dash',
+    'clove': 'clove', 'cloves': 'clove', 'can': 'can', 'cans': 'can',
+    'slice': 'slice', 'slices': 'slice', 'bunch': 'bunch', 'bunches': 'bunch',
+    'handful': 'handful', 'handfuls': 'handful', 'piece': 'piece', 'pieces': 'piece',
+}
+
+_NUMBER = r'\d+/\d+|\d+(?:[.,]\d+)?(?:\s+\d+/\d+)?'
+# "2", "1 1/2", "1/2", "1.5", "2-3", "2 to 3"
+QUANTITY = re.compile(rf'^(?P<quantity>(?:{_NUMBER})(?:\s*(?:-|–|to)\s*(?:{_NUMBER}))?)\s*')
+# Bullets and numbering people paste in front of lines: "- ", "* ", "• ", "1. ", "2) "
+LIST_MARKER = re.compile(r'^\s*(?:[-*•·]+|\d+[.)])\s+')
+
+
+def clean_lines(text):
+    """Non-empty, stripped lines of ``text``"""
+    return [line.strip() for line in (text or '').splitlines() if line.strip()]
+
+
+def parse_amount(quantity):
+    """Numeric value of a quantity string (the lower bound of a range), or None"""
+    first = re.split(r'\s*(?:-|–|to)\s*', quantity)[0]
+    try:
+        return float(sum(Fraction(part.replace(',', '.')) for part in first.split()))
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def parse_ingredient(line):
+    """Split one ingredient line into quantity, canonical unit and item; the text is kept as written"""
+    text = line.strip()
+    rest = text
+    for symbol, fraction in UNICODE_FRACTIONS.items():
+        rest = rest.replace(symbol, f' {fraction}')
+    rest = LIST_MARKER.sub('', rest).strip()
+
+    quantity = None
+    match = QUANTITY.match(rest)
+    if match:
+        quantity = match.group('quantity')
+        rest = rest[match.end():]
+
+    unit = None
+    # "200g", "2 tbsp.", "1 cup of"; without a quantity "Cup noodles" is an item
+    unit_match = re.match(r'^([a-zA-Z]+)\.?(?:\s+|$)', rest) if quantity else None
+    if unit_match and unit_match.group(1).lower() in UNITS:
+        unit = UNITS[unit_match.group(1).lower()]
+        rest = rest[unit_match.end():]
+        rest = re.sub(r'^of\s+', '', rest, flags=re.IGNORECASE)
+
+    return {
+        'text': text,
+        'quantity': quantity,
+        'amount': parse_amount(quantity) if quantity else None,
+        'unit': unit,
+        'item': rest.strip() or text,
+    }
+
+
+# Preparation and size words that do not change what the ingredient is
+DESCRIPTORS = {
+    'fresh', 'freshly', 'chopped', 'diced', 'sliced', 'minced', 'grated', 'shredded', 'crushed',
+    'ground', 'peeled', 'cubed', 'melted', 'softened', 'large', 'small', 'medium', 'ripe',
+    'boneless', 'skinless', 'finely', 'roughly', 'thinly', 'cooked', 'uncooked', 'dried', 'frozen',
+    'of', 'a', 'an', 'the', 'some', 'about', 'extra', 'virgin',
+}
+# Words ending in "s" that are not plurals
+SINGULAR_S = {'asparagus', 'couscous', 'hummus', 'molasses', 'swiss', 'lemongrass', 'citrus', 'bass'}
+
+
+def singularize(word):
+    if word in SINGULAR_S or word.endswith(('ss', 'us')) or len(word) < 4:
+        return word
+    if word.endswith('ies'):
+        return word[:-3] + 'y'
+    if word.endswith(('oes', 'ches', 'shes', 'xes')):
+        return word[:-2]
+    if word.endswith('s'):
+        return word[:-1]
+    return word
+
+
+def normalize_ingredient(item):
+    """
+    Vocabulary name of a parsed ingredient item: lowercase, singular, without
+    notes or preparation words ("Tomatoes, diced (for the sauce)" -> "tomato").
+    Returns '' when nothing is left.
+    """
+    name = re.sub(r'\(.*?\)', ' ', item.lower())
+    # "garlic, minced" / "pancetta or guanciale" / "salt to taste": keep the first part
+    name = re.split(r',|;|\bor\b|\bto taste\b|\bfor\b', name)[0]
+    words = [singularize(word) for word in re.findall(r'[a-z]+', name) if word not in DESCRIPTORS]
+    return ' '.join(words)[:100]
+
+
+def parse_ingredients(text):
+    return [parse_ingredient(line) for line in clean_lines(text)]
+
+
+def parse_instructions(text):
+    """One step per non-empty line, with any numbering the author typed removed"""
+    return [LIST_MARKER.sub('', line).strip() or line for line in clean_lines(text)]
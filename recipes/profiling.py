@@ -0,0 +1,219 @@
+"""
+Opt-in request profiling (``PROFILING_ENABLED``).
+
+``ProfilingMiddleware`` records, per resolved URL name, the wall time, time
+spent in SQL, the number of queries, duplicated queries (same SQL and params)
+and template render time of every request. The last ``PROFILING_WINDOW``
+samples of each view are kept in memory, per process, and summarized as
+percentiles by ``profiling_stats``. Each response carries the numbers in a
+``Server-Timing`` header, which browser dev tools display.
+
+Requests can also be profiled with cProfile: a ``PROFILING_CPROFILE_SAMPLE_RATE``
+fraction of sync requests runs under the profiler and the dump is kept in
+``PROFILING_CPROFILE_DIR`` when the request took longer than
+``PROFILING_CPROFILE_THRESHOLD_MS``.
+"""
+import cProfile
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger(__name__)
+
+PERCENTILES = (50, 90, 99)
+METRICS = ('wall_ms', 'db_ms', 'queries', 'duplicate_queries', 'template_ms')
+
+# Stats of the request being handled; copied into sync_to_async threads, so
+# queries run by ``async_views.concurrently`` are attributed to the request too
+_current = ContextVar('profiling_request', default=None)
+_samples = {}
+_samples_lock = threading.Lock()
+
+
+class RequestStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.queries = Counter()
+
+    def add_query(self, sql, params, duration):
+        with self.lock:
+            self.db_time += duration
+            self.queries[(sql, repr(params))] += 1
+
+    def add_template(self, duration):
+        with self.lock:
+            self.template_time += duration
+
+    def sample(self, wall_time):
+        query_count = sum(self.queries.values())
+        return {
+            'wall_ms': wall_time * 1000,
+            'db_ms': self.db_time * 1000,
+            'queries': query_count,
+            'duplicate_queries': query_count - len(self.queries),
+            'template_ms': self.template_time * 1000,
+        }
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper timing every query of a profiled request"""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add_query(sql, params, time.perf_counter() - start)
+
+
+def install_query_wrapper(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class ProfiledTemplate(Template):
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            # Includes queries run lazily by the template; they also count as DB time
+            stats.add_template(time.perf_counter() - start)
+
+
+class ProfiledDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing top-level renders for the profiler"""
+
+    def from_string(self, template_code):
+        return ProfiledTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return ProfiledTemplate(template.template, self)
+
+
+def record_sample(view_name, sample):
+    window = getattr(settings, 'PROFILING_WINDOW', 500)
+    with _samples_lock:
+        _samples.setdefault(view_name, deque(maxlen=window)).append(sample)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def profiling_stats():
+    """Percentiles of each metric per view name, over each view's recent requests"""
+    with _samples_lock:
+        snapshot = {name: list(samples) for name, samples in _samples.items()}
+    stats = {}
+    for name, samples in sorted(snapshot.items()):
+        summary = {'requests': len(samples)}
+        for metric in METRICS:
+            values = sorted(sample[metric] for sample in samples)
+            summary[metric] = {f'p{pct}': round(percentile(values, pct), 2) for pct in PERCENTILES}
+        stats[name] = summary
+    return stats
+
+
+def reset_profiling_stats():
+    with _samples_lock:
+        _samples.clear()
+
+
+def server_timing(sample):
+    return ', '.join([
+        f'total;dur={sample["wall_ms"]:.1f}',
+        f'db;dur={sample["db_ms"]:.1f};desc="{sample["queries"]} queries, '
+        f'{sample["duplicate_queries"]} duplicates"',
+        f'tpl;dur={sample["template_ms"]:.1f}',
+    ])
+
+
+class ProfilingMiddleware:
+    """Collects per-view timing and query statistics; see the module docstring"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        connection_created.connect(install_query_wrapper, dispatch_uid='recipes.profiling')
+        for connection in connections.all(initialized_only=True):
+            install_query_wrapper(connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        profiler = self.start_profiler()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            wall_time = time.perf_counter() - start
+            if profiler is not None:
+                profiler.disable()
+            _current.reset(token)
+        self.finish(request, response, stats.sample(wall_time), profiler)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            wall_time = time.perf_counter() - start
+            _current.reset(token)
+        # cProfile only sees one thread, which is of little use for async views
+        self.finish(request, response, stats.sample(wall_time), None)
+        return response
+
+    def start_profiler(self):
+        if random.random() >= getattr(settings, 'PROFILING_CPROFILE_SAMPLE_RATE', 0):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # Another profiler is already active in this thread
+            return None
+        return profiler
+
+    def finish(self, request, response, sample, profiler):
+        match = request.resolver_match
+        view_name = match.view_name if match is not None else '<unresolved>'
+        record_sample(view_name, sample)
+        response['Server-Timing'] = server_timing(sample)
+        threshold = getattr(settings, 'PROFILING_CPROFILE_THRESHOLD_MS', 500)
+        if profiler is not None and sample['wall_ms'] >= threshold:
+            self.dump_profile(profiler, view_name, sample)
+
+    def dump_profile(self, profiler, view_name, sample):
+        directory = getattr(settings, 'PROFILING_CPROFILE_DIR', None) or os.path.join(settings.BASE_DIR, 'profiles')
+        os.makedirs(directory, exist_ok=True)
+        filename = f'{view_name.replace(":", "-")}-{time.strftime("%Y%m%d-%H%M%S")}-{sample["wall_ms"]:.0f}ms.prof'
+        path = os.path.join(directory, filename)
+        profiler.dump_stats(path)
+        logger.info('Saved profile of a %.0f ms %s request to %s', sample['wall_ms'], view_name, path)
@@ -0,0 +1,247 @@
+"""
+Precomputed "similar recipes".
+
+``RecommendationIndex`` holds two sparse vector spaces over the approved
+recipes and scores neighbours as a weighted sum of two cosine similarities:
+
+* content: TF-IDF over title words, parsed ingredient items and the category;
+* ratings: each recipe's mean-centred ratings by user (adjusted cosine), shrunk
+  towards zero when few users rated both recipes.
+
+Vectors are dicts and neighbours are found through inverted indexes
+(term -> recipes, user -> recipes), so only recipes sharing a term or a rater
+are ever compared. Each posting list keeps only its ``POSTINGS_PER_KEY``
+heaviest entries ("champion lists"), which bounds the work per recipe on large
+catalogues at the cost of approximate scores for weak matches.
+The ``build_recommendations`` command stores the top neighbours of each recipe
+in ``RecipeRecommendation``; pages only read them. ``Recipe.recommendations_built_at``
+marks the recipes handled so far, including those with no neighbours, so
+``--new-only`` only looks at recipes approved since.
+"""
+import heapq
+import math
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from .models import Rating, Recipe, RecipeRecommendation
+from .search import tokenize
+
+STOP_WORDS = {
+    'a', 'an', 'and', 'or', 'of', 'the', 'to', 'for', 'with', 'in', 'on', 'into', 'at', 'by',
+    'fresh', 'large', 'small', 'medium', 'chopped', 'diced', 'sliced', 'minced', 'finely',
+    'optional', 'taste', 'plus', 'more', 'about', 'cut', 'pieces', 'whole',
+}
+# How much one occurrence in each field counts towards a term's frequency
+FIELD_WEIGHTS = {'title': 2.0, 'ingredients': 1.0, 'category': 1.5}
+# Terms in more than this share of recipes say little and make posting lists long
+MAX_DOCUMENT_FREQUENCY = 0.5
+MAX_TERMS_PER_RECIPE = 25
+MAX_RATERS_PER_RECIPE = 100
+POSTINGS_PER_KEY = 200
+# Pairs rated by n common users keep n / (n + RATING_SHRINKAGE) of their similarity
+RATING_SHRINKAGE = 5
+# Only a user's most recent ratings are used, so a few power raters cannot dominate
+MAX_RATINGS_PER_USER = 500
+
+
+def recipe_terms(title, category_id, ingredient_items):
+    """Weighted term frequencies of one recipe"""
+    counts = Counter()
+    for token in tokenize(title):
+        if token not in STOP_WORDS:
+            counts[token] += FIELD_WEIGHTS['title']
+    for ingredient in ingredient_items:
+        for token in tokenize(ingredient['item']):
+            if token not in STOP_WORDS and not token.isdigit():
+                counts[token] += FIELD_WEIGHTS['ingredients']
+    if category_id is not None:
+        counts[f'category:{category_id}'] += FIELD_WEIGHTS['category']
+    return counts
+
+
+def strongest(vector, limit):
+    """The ``limit`` entries of ``vector`` with the largest absolute weight"""
+    if len(vector) <= limit:
+        return vector
+    return dict(heapq.nlargest(limit, vector.items(), key=lambda item: abs(item[1])))
+
+
+def normalize(vector):
+    norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+    return {key: weight / norm for key, weight in vector.items()} if norm else {}
+
+
+def tfidf_vectors(documents):
+    """L2-normalized TF-IDF vectors of ``{id: Counter of terms}``, keeping each recipe's strongest terms"""
+    count = len(documents)
+    document_frequency = Counter(term for terms in documents.values() for term in terms)
+    # Never prune on small catalogues, where the posting lists are short anyway
+    cutoff = max(MAX_DOCUMENT_FREQUENCY * count, 50)
+    vectors = {}
+    for pk, terms in documents.items():
+        weights = {
+            term: (1 + math.log(frequency)) * (math.log((1 + count) / (1 + document_frequency[term])) + 1)
+            for term, frequency in terms.items()
+            if document_frequency[term] <= cutoff
+        }
+        vectors[pk] = normalize(strongest(weights, MAX_TERMS_PER_RECIPE))
+    return vectors
+
+
+def rating_vectors(ratings, recipe_ids):
+    """Normalized vectors of mean-centred ratings, by user, of each recipe in ``recipe_ids``"""
+    by_user = defaultdict(list)
+    for user_id, recipe_id, rating in ratings:
+        if recipe_id in recipe_ids and len(by_user[user_id]) < MAX_RATINGS_PER_USER:
+            by_user[user_id].append((recipe_id, rating))
+
+    vectors = defaultdict(dict)
+    for user_id, user_ratings in by_user.items():
+        if len(user_ratings) < 2:  # A single rating says nothing about similarity
+            continue
+        mean = sum(rating for _, rating in user_ratings) / len(user_ratings)
+        for recipe_id, rating in user_ratings:
+            if rating != mean:
+                vectors[recipe_id][user_id] = rating - mean
+    return {pk: normalize(strongest(vector, MAX_RATERS_PER_RECIPE)) for pk, vector in vectors.items()}
+
+
+def inverted_index(vectors):
+    """``{key: [(id, weight)]}``, each list cut down to its heaviest ``POSTINGS_PER_KEY`` entries"""
+    postings = defaultdict(list)
+    for pk, vector in vectors.items():
+        for key, weight in vector.items():
+            postings[key].append((pk, weight))
+    for key, entries in postings.items():
+        if len(entries) > POSTINGS_PER_KEY:
+            postings[key] = heapq.nlargest(POSTINGS_PER_KEY, entries, key=lambda entry: abs(entry[1]))
+    return postings
+
+
+class RecommendationIndex:
+    """Content and rating vectors of every approved recipe, with their inverted indexes"""
+
+    def __init__(self, documents, ratings, rating_weight):
+        self.content = tfidf_vectors(documents)
+        self.ratings = rating_vectors(ratings, documents.keys())
+        self.content_postings = inverted_index(self.content)
+        self.rating_postings = inverted_index(self.ratings)
+        self.rating_weight = rating_weight
+
+    @classmethod
+    def build(cls):
+        recipes = Recipe.objects.approved().values_list('pk', 'title', 'category_id', 'ingredient_items')
+        documents = {pk: recipe_terms(title, category_id, items) for pk, title, category_id, items in recipes.iterator()}
+        ratings = Rating.objects.filter(recipe__status='approved').order_by('user', '-created_at').values_list(
+            'user_id', 'recipe_id', 'rating'
+        )
+        rating_weight = getattr(settings, 'RECOMMENDATIONS_RATING_WEIGHT', 0.3)
+        return cls(documents, ratings.iterator(), rating_weight)
+
+    def __contains__(self, pk):
+        return pk in self.content
+
+    def scores(self, pk):
+        """Similarity of ``pk`` to every recipe sharing a term or a rater with it"""
+        content = defaultdict(float)
+        for term, weight in self.content.get(pk, {}).items():
+            for other, other_weight in self.content_postings[term]:
+                content[other] += weight * other_weight
+
+        rating = defaultdict(float)
+        common_raters = Counter()
+        for user_id, weight in self.ratings.get(pk, {}).items():
+            for other, other_weight in self.rating_postings[user_id]:
+                rating[other] += weight * other_weight
+                common_raters[other] += 1
+
+        scores = {other: (1 - self.rating_weight) * similarity for other, similarity in content.items()}
+        for other, similarity in rating.items():
+            shrunk = similarity * common_raters[other] / (common_raters[other] + RATING_SHRINKAGE)
+            scores[other] = scores.get(other, 0.0) + self.rating_weight * shrunk
+        scores.pop(pk, None)
+        return scores
+
+    def neighbours(self, pk, top_k):
+        """The ``top_k`` most similar recipes as ``[(id, score)]``, best first"""
+        scores = self.scores(pk)
+        return heapq.nlargest(top_k, ((other, score) for other, score in scores.items() if score > 0),
+                              key=lambda item: item[1])
+
+
+def store_recommendations(index, recipe_ids, top_k):
+    """Replace the stored recommendations of ``recipe_ids``; returns how many rows were written"""
+    rows = [
+        RecipeRecommendation(recipe_id=pk, recommended_id=other, score=score, rank=rank)
+        for pk in recipe_ids
+        for rank, (other, score) in enumerate(index.neighbours(pk, top_k), start=1)
+    ]
+    with transaction.atomic():
+        for start in range(0, len(recipe_ids), 500):
+            RecipeRecommendation.objects.filter(recipe_id__in=recipe_ids[start:start + 500]).delete()
+        RecipeRecommendation.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def rebuild_recommendations(top_k, batch_size=1000):
+    """Recompute the recommendations of every approved recipe; returns (recipes, rows)"""
+    index = RecommendationIndex.build()
+    recipe_ids = sorted(index.content)
+    written = 0
+    with transaction.atomic():
+        # Recipes that are no longer approved keep no recommendations either
+        RecipeRecommendation.objects.exclude(recipe_id__in=Recipe.objects.approved().values('pk')).delete()
+        for start in range(0, len(recipe_ids), batch_size):
+            written += store_recommendations(index, recipe_ids[start:start + batch_size], top_k)
+        mark_built(recipe_ids)
+    return len(recipe_ids), written
+
+
+def mark_built(recipe_ids):
+    now = timezone.now()
+    for start in range(0, len(recipe_ids), 500):
+        Recipe.objects.filter(pk__in=recipe_ids[start:start + 500]).update(recommendations_built_at=now)
+
+
+def refresh_new_recommendations(top_k):
+    """
+    Recommend for approved recipes not handled yet, and slot them into the
+    lists of existing recipes they now beat. Returns (recipes, rows).
+    """
+    new_ids = list(
+        Recipe.objects.approved().filter(recommendations_built_at__isnull=True).values_list('pk', flat=True)
+    )
+    if not new_ids:
+        return 0, 0
+    index = RecommendationIndex.build()
+    new_ids = [pk for pk in new_ids if pk in index]
+    new = set(new_ids)
+
+    # Similarity is (up to the champion-list cut) symmetric, so a new recipe enters
+    # another recipe's list when it scores above that list's weakest entry
+    candidates = {}
+    for pk in new_ids:
+        for other, score in index.scores(pk).items():
+            if score > 0:
+                candidates[other] = max(score, candidates.get(other, 0.0))
+    lists = {
+        row['recipe']: row
+        for row in RecipeRecommendation.objects.filter(recipe_id__in=list(candidates)).order_by().values(
+            'recipe'
+        ).annotate(weakest=Min('score'), size=Count('id'))
+    }
+    affected = [
+        other for other, score in candidates.items()
+        if other not in new and (
+            other not in lists or lists[other]['size'] < top_k or score > lists[other]['weakest']
+        )
+    ]
+    recipe_ids = new_ids + affected
+    with transaction.atomic():
+        written = store_recommendations(index, recipe_ids, top_k)
+        mark_built(new_ids)
+    return len(recipe_ids), written
@@ -0,0 +1,124 @@
+"""
+Read-replica routing (``DATABASE_REPLICAS``).
+
+``ReplicaRoutingMiddleware`` decides per request whether reads may go to a
+replica: only GET/HEAD requests to the views in ``REPLICA_VIEWS`` qualify, and
+only when the client has not written recently. Any other method sets a cookie
+that pins the client to the primary for ``REPLICA_STICKINESS_SECONDS``, which
+covers the redirect after a POST and the replica catching up. A request that
+writes itself reads from the primary from then on.
+
+``ReplicaRouter`` applies the decision: all writes go to the primary, reads
+go to the request's replica when allowed. A page read from a replica may lag
+the cache generations it would be stored under, so ``cache_anonymous_page``
+only stores pages rendered from the primary (``read_from_replica``), and
+``cached_value`` only values built there.
+"""
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.urls import Resolver404, resolve
+
+PIN_COOKIE = 'primary_pinned'
+
+_state = ContextVar('replica_routing', default=None)
+
+
+class RoutingState:
+    def __init__(self, replica):
+        self.replica = replica  # None: read from the primary
+        self.wrote = False
+        self.read_replica = False
+
+
+def replica_aliases():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def read_from_replica():
+    """True when the current request has read from a replica"""
+    state = _state.get()
+    return state is not None and state.read_replica
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is not None and state.replica and not state.wrote:
+            state.read_replica = True
+            return state.replica
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        # Also for instances that were read from a replica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        if db in replica_aliases():
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """Chooses the database reads of each request use; see the module docstring"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RoutingState(self.choose_replica(request))
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(request, response, state)
+
+    async def __acall__(self, request):
+        state = RoutingState(self.choose_replica(request))
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(request, response, state)
+
+    def choose_replica(self, request):
+        replicas = replica_aliases()
+        if not replicas or request.method not in ('GET', 'HEAD') or PIN_COOKIE in request.COOKIES:
+            return None
+        try:
+            url_name = resolve(request.path_info).url_name
+        except Resolver404:
+            return None
+        if url_name not in getattr(settings, 'REPLICA_VIEWS', ()):
+            return None
+        return random.choice(replicas)
+
+    def finish(self, request, response, state):
+        if replica_aliases() and (state.wrote or request.method not in ('GET', 'HEAD', 'OPTIONS')):
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=getattr(settings, 'REPLICA_STICKINESS_SECONDS', 5),
+                httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,152 @@
+"""
+Full-text search for recipes.
+
+SQLite deployments use an FTS5 virtual table and PostgreSQL deployments use a
+side table holding a weighted tsvector with a GIN index. Both are kept in sync
+by the signal handlers in ``recipes.signals`` and can be rebuilt with the
+``rebuild_search_index`` management command.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+SQLITE_TABLE = 'recipes_recipe_fts'
+POSTGRES_TABLE = 'recipes_recipe_search'
+
+# Columns copied into the index, in the order the backends expect them
+INDEXED_FIELDS = ('title', 'description', 'ingredients')
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(query):
+    """Split a user supplied query into plain word tokens"""
+    return TOKEN_RE.findall(query.lower())
+
+
+class SimpleSearchBackend:
+    """Fallback for databases without a native full-text engine"""
+
+    def search(self, queryset, query):
+        for token in tokenize(query):
+            queryset = queryset.filter(
+                Q(title__icontains=token) |
+                Q(description__icontains=token) |
+                Q(ingredients__icontains=token)
+            )
+        return queryset
+
+    def index_recipe(self, recipe):
+        pass
+
+    def remove_recipe(self, recipe_id):
+        pass
+
+    def rebuild(self, rows):
+        return 0
+
+
+class FullTextSearchBackend(SimpleSearchBackend):
+    """Shared logic for index-backed backends: join the index table into the recipe query"""
+
+    def search(self, queryset, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset
+        # The match, the queryset's own filters and the ranking run in one
+        # statement, so every visible match is found and counted
+        return queryset.extra(
+            tables=[self.table],
+            where=[self.match_sql, self.join_sql],
+            params=[self.match_param(tokens)],
+            select={'search_rank': self.rank_sql},
+            select_params=self.rank_params(tokens),
+        ).order_by('search_rank', '-created_at')
+
+    def rebuild(self, rows):
+        """Replace the whole index with ``rows`` of (id, title, description, ingredients)"""
+        count = 0
+        with connection.cursor() as cursor:
+            cursor.execute(self.clear_sql)
+            batch = []
+            for row in rows:
+                batch.append(tuple(row))
+                if len(batch) >= 1000:
+                    cursor.executemany(self.insert_sql, batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                cursor.executemany(self.insert_sql, batch)
+                count += len(batch)
+        return count
+
+    def index_recipe(self, recipe):
+        with connection.cursor() as cursor:
+            cursor.execute(self.delete_sql, [recipe.pk])
+            cursor.execute(self.insert_sql, [recipe.pk] + [getattr(recipe, f) for f in INDEXED_FIELDS])
+
+    def remove_recipe(self, recipe_id):
+        with connection.cursor() as cursor:
+            cursor.execute(self.delete_sql, [recipe_id])
+
+
+class SQLiteSearchBackend(FullTextSearchBackend):
+    """FTS5 with porter stemming, ranked by weighted bm25 (title > description > ingredients)"""
+
+    table = SQLITE_TABLE
+    match_sql = f'{SQLITE_TABLE} MATCH %s'
+    # The unary + keeps SQLite from driving the join from recipes_recipe and
+    # re-running the MATCH for every recipe; the index is scanned once instead
+    join_sql = f'recipes_recipe.id = +{SQLITE_TABLE}.rowid'
+    # bm25 is lower for better matches
+    rank_sql = f'bm25({SQLITE_TABLE}, 10.0, 3.0, 1.0)'
+    insert_sql = f'INSERT INTO {SQLITE_TABLE} (rowid, title, description, ingredients) VALUES (%s, %s, %s, %s)'
+    delete_sql = f'DELETE FROM {SQLITE_TABLE} WHERE rowid = %s'
+    clear_sql = f'DELETE FROM {SQLITE_TABLE}'
+
+    def match_param(self, tokens):
+        # Quote every token so user input can never be parsed as FTS5 syntax,
+        # and prefix-match it so partial words behave like the old icontains
+        return ' '.join('"%s"*' % token.replace('"', '""') for token in tokens)
+
+    def rank_params(self, tokens):
+        return []
+
+
+class PostgresSearchBackend(FullTextSearchBackend):
+    """Weighted tsvector side table with a GIN index, ranked by ts_rank"""
+
+    table = POSTGRES_TABLE
+    match_sql = f"{POSTGRES_TABLE}.document @@ to_tsquery('english', %s)"
+    join_sql = f'{POSTGRES_TABLE}.recipe_id = recipes_recipe.id'
+    # Negated so that, as with bm25, lower ranks come first
+    rank_sql = f"-ts_rank({POSTGRES_TABLE}.document, to_tsquery('english', %s))"
+    insert_sql = (
+        f'INSERT INTO {POSTGRES_TABLE} (recipe_id, document) VALUES (%s, '
+        "setweight(to_tsvector('english', %s), 'A') || "
+        "setweight(to_tsvector('english', %s), 'B') || "
+        "setweight(to_tsvector('english', %s), 'C'))"
+    )
+    delete_sql = f'DELETE FROM {POSTGRES_TABLE} WHERE recipe_id = %s'
+    clear_sql = f'TRUNCATE {POSTGRES_TABLE}'
+
+    def match_param(self, tokens):
+        return ' & '.join('%s:*' % token for token in tokens)
+
+    def rank_params(self, tokens):
+        return [self.match_param(tokens)]
+
+
+def get_search_backend():
+    """Return the search backend matching the default database"""
+    if connection.vendor == 'sqlite':
+        return SQLiteSearchBackend()
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    return SimpleSearchBackend()
+
+
+def search_recipes(queryset, query):
+    """Filter ``queryset`` down to recipes matching ``query``, best matches first"""
+    return get_search_backend().search(queryset, query)
@@ -0,0 +1,210 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from .cache import CATEGORIES, INGREDIENTS, LISTING, SUGGESTIONS, invalidate, invalidate_recipes, recipe_scope
+from .images import AVATAR_VARIANTS, delete_variants, has_variants, schedule_processing
+from .ingredients import link_ingredients
+from .models import AuthorStats, Category, Comment, Rating, Recipe, UserProfile, recipe_author_stats
+from .search import INDEXED_FIELDS, get_search_backend
+from .trending import event_weight, record_event
+
+# Sent once per batch of recipes changed in bulk (e.g. by moderation), with
+# ``recipe_ids``, the new ``status`` and ``previous_statuses`` ({recipe id:
+# status}); bulk updates bypass post_save
+recipes_changed = Signal()
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search_index(sender, instance, update_fields=None, **kwargs):
+    """Re-index a recipe whenever one of its searchable fields may have changed"""
+    if update_fields is not None and not set(update_fields) & set(INDEXED_FIELDS):
+        return
+    get_search_backend().index_recipe(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe_from_search_index(sender, instance, **kwargs):
+    """Drop a deleted recipe from the search index"""
+    get_search_backend().remove_recipe(instance.pk)
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_ingredients(sender, instance, update_fields=None, **kwargs):
+    """Relink a recipe's ingredients when they change; a status change alone only refreshes the index"""
+    if update_fields is None or 'ingredients' in update_fields:
+        link_ingredients([instance])
+    elif 'status' in update_fields:
+        invalidate(INGREDIENTS)
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe_from_ingredient_index(sender, instance, **kwargs):
+    """The links go with the recipe; the in-process indexes still have to drop it"""
+    invalidate(INGREDIENTS, SUGGESTIONS)
+
+
+@receiver(post_delete, sender=Rating)
+def remove_rating_from_recipe_totals(sender, instance, **kwargs):
+    """Take a deleted rating back out of its recipe's counters"""
+    Recipe.objects.filter(pk=instance.recipe_id).apply_rating_change(-instance.rating, -1)
+
+
+@receiver(post_save, sender=Comment)
+def add_comment_to_recipe_count(sender, instance, created, **kwargs):
+    """Keep the recipe's stored comment count in step, so pages never COUNT comments"""
+    if created:
+        Recipe.objects.filter(pk=instance.recipe_id).update(comment_count=F('comment_count') + 1)
+
+
+@receiver(post_delete, sender=Comment)
+def remove_comment_from_recipe_count(sender, instance, **kwargs):
+    Recipe.objects.filter(pk=instance.recipe_id, comment_count__gt=0).update(comment_count=F('comment_count') - 1)
+
+
+@receiver(post_save, sender=Rating)
+@receiver(post_save, sender=Comment)
+def add_to_trending_score(sender, instance, created, **kwargs):
+    """New ratings and comments move their recipe up the trending listing"""
+    if created:
+        record_event(instance.recipe_id, event_weight(instance))
+
+
+# Recipe fields the author stats are built from; rating changes move them in Recipe.apply_rating_change
+AUTHOR_STATS_FIELDS = {'author', 'status', 'rating_count', 'comment_count', 'average_rating'}
+
+
+@receiver(post_save, sender=User)
+def create_author_stats(sender, instance, created, **kwargs):
+    if created:
+        AuthorStats.objects.get_or_create(user=instance)
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_stored_author_stats(sender, instance, update_fields=None, **kwargs):
+    """Note what a changed recipe added to its author's stats before the save"""
+    if instance._state.adding or (update_fields is not None and not AUTHOR_STATS_FIELDS & set(update_fields)):
+        return
+    instance._stored_author_stats = Recipe.objects.filter(pk=instance.pk).author_stats()
+
+
+@receiver(post_save, sender=Recipe)
+def update_author_stats(sender, instance, created, **kwargs):
+    """Add a new recipe to its author's stats, or replace what a changed one added (e.g. in another status)"""
+    if created:
+        added = recipe_author_stats(instance.status, instance.rating_count, instance.comment_count, instance.average_rating)
+        AuthorStats.objects.apply_changes(added=[(instance.author_id, added)])
+        return
+    removed = instance.__dict__.pop('_stored_author_stats', None)
+    if removed is not None:
+        # save() leaves the stored counters alone, so the instance's copies may be stale
+        AuthorStats.objects.apply_changes(removed=removed, added=Recipe.objects.filter(pk=instance.pk).author_stats())
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe_from_author_stats(sender, instance, **kwargs):
+    # The recipe's ratings and comments were deleted (and taken out of the stats) before it
+    AuthorStats.objects.apply_changes(removed=[(instance.author_id, recipe_author_stats(instance.status, 0, 0, 0))])
+
+
+@receiver(post_save, sender=Comment)
+def add_comment_to_author_stats(sender, instance, created, **kwargs):
+    if created:
+        AuthorStats.objects.filter(user__recipes=instance.recipe_id).update(
+            comment_count=F('comment_count') + 1, updated_at=timezone.now()
+        )
+
+
+@receiver(post_delete, sender=Comment)
+def remove_comment_from_author_stats(sender, instance, **kwargs):
+    AuthorStats.objects.filter(user__recipes=instance.recipe_id, comment_count__gt=0).update(
+        comment_count=F('comment_count') - 1, updated_at=timezone.now()
+    )
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+@receiver([post_save, post_delete], sender=Rating)
+def invalidate_recipe_pages(sender, instance, **kwargs):
+    """Recipes and ratings show up on listings and on the recipe's own page"""
+    recipe_id = instance.pk if sender is Recipe else instance.recipe_id
+    invalidate_recipes([recipe_id])
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def invalidate_comment_pages(sender, instance, **kwargs):
+    """Comments appear on the recipe's own page and change its comment count and trending rank on listings"""
+    invalidate_recipes([instance.recipe_id])
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category_pages(sender, instance, **kwargs):
+    """Category names and counts appear on listings, every recipe page and the search suggestions"""
+    invalidate(LISTING, CATEGORIES, SUGGESTIONS)
+
+
+IMAGE_FIELDS = {Recipe: 'image', UserProfile: 'avatar'}
+
+
+@receiver(pre_save, sender=Recipe)
+@receiver(pre_save, sender=UserProfile)
+def remember_stored_image(sender, instance, update_fields=None, **kwargs):
+    """Note the image an update may replace, so its variants can be removed after the save"""
+    field = IMAGE_FIELDS[sender]
+    if instance.pk is None or (update_fields is not None and field not in update_fields):
+        return
+    instance._stored_image = sender.objects.filter(pk=instance.pk).values_list(field, flat=True).first()
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=UserProfile)
+def delete_replaced_image_variants(sender, instance, **kwargs):
+    stored = instance.__dict__.pop('_stored_image', None)
+    if stored and stored != getattr(instance, IMAGE_FIELDS[sender]).name:
+        transaction.on_commit(lambda: delete_variants(stored))
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=UserProfile)
+def delete_image_variants(sender, instance, **kwargs):
+    image = getattr(instance, IMAGE_FIELDS[sender])
+    if image:
+        transaction.on_commit(lambda: delete_variants(image.name))
+
+
+@receiver(post_save, sender=Recipe)
+def process_recipe_image(sender, instance, update_fields=None, **kwargs):
+    """Build the image variants of a newly uploaded recipe image in the background"""
+    if not instance.image or (update_fields is not None and 'image' not in update_fields):
+        return
+    if not has_variants(instance.image.name):
+        schedule_processing(instance.image.name, on_done=lambda: invalidate_recipes([instance.pk]))
+
+
+@receiver(post_save, sender=UserProfile)
+def process_avatar(sender, instance, **kwargs):
+    """Build the thumbnail of a newly uploaded avatar in the background"""
+    if instance.avatar and not has_variants(instance.avatar.name, AVATAR_VARIANTS):
+        schedule_processing(instance.avatar.name, AVATAR_VARIANTS)
+
+
+@receiver(recipes_changed)
+def invalidate_changed_recipes(sender, recipe_ids, **kwargs):
+    """A batch of status changes affects listings, the recipes' pages and the ingredient index"""
+    invalidate_recipes(recipe_ids)
+    invalidate(INGREDIENTS)
+
+
+@receiver(recipes_changed)
+def update_changed_author_stats(sender, recipe_ids, status, previous_statuses, **kwargs):
+    """Move each recipe's part of its author's stats from its previous status to the new one"""
+    rows = Recipe.objects.filter(pk__in=recipe_ids).values_list(
+        'pk', 'author', 'rating_count', 'comment_count', 'average_rating'
+    )
+    removed, added = [], []
+    for pk, author_id, *counters in rows:
+        removed.append((author_id, recipe_author_stats(previous_statuses[pk], *counters)))
+        added.append((author_id, recipe_author_stats(status, *counters)))
+    AuthorStats.objects.apply_changes(removed=removed, added=added)
@@ -0,0 +1,218 @@
+"""
+Search-as-you-type suggestions for the search box.
+
+``SuggestionIndex`` keeps, in process memory, a sorted array of search terms
+with a parallel array of the entry each term belongs to: approved recipe
+titles, ingredient names and category names. A title is indexed from the
+start of each of its first words ("Lemon Chicken Pasta" also as "chicken
+pasta" and "pasta"), so a prefix query is two ``bisect`` calls and a scan of
+the matching range, ranked by popularity. No query touches the database.
+
+Memory is bounded: only the ``SUGGESTION_INDEX_MAX_RECIPES`` most popular
+recipes and the ``MAX_INGREDIENTS`` most used ingredients are indexed, with
+at most ``MAX_TERM_WORDS`` terms of ``TERM_LENGTH`` characters per entry.
+
+Every process catches up with the database at most once per
+``SUGGESTION_INDEX_REFRESH_SECONDS`` after the listings changed: one indexed
+query for the recipes updated since the last catch-up adds newly approved
+recipes (and their new ingredient and category names), renames edited ones and
+drops rejected ones. Updates run in a background thread on a copy that then
+replaces the index, so lookups never wait for them. Deleted recipes and
+changed categories bump the ``SUGGESTIONS`` scope and trigger a full rebuild,
+as does the index outgrowing its bound or turning ``REBUILD_SECONDS`` old
+(which also brings the popularity ranking up to date).
+"""
+import heapq
+import re
+import threading
+import time
+from bisect import bisect_left, bisect_right
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count, Max, Q
+
+from .cache import LISTING, SUGGESTIONS, get_generations
+from .models import Category, Recipe, RecipeIngredient
+
+RECIPE = 'recipe'
+INGREDIENT = 'ingredient'
+CATEGORY = 'category'
+
+MIN_PREFIX_LENGTH = 2
+MAX_INGREDIENTS = 5000
+MAX_TERM_WORDS = 5
+TERM_LENGTH = 32
+REBUILD_SECONDS = 60 * 60
+
+NON_WORD = re.compile(r'[\W_]+')
+
+
+def normalize(text):
+    return NON_WORD.sub(' ', text.casefold()).strip()
+
+
+def index_terms(label):
+    """The terms ``label`` is found under: its normalized text from the start of each of its first words"""
+    words = normalize(label).split()
+    return {' '.join(words[start:])[:TERM_LENGTH] for start in range(min(len(words), MAX_TERM_WORDS))}
+
+
+class SuggestionIndex:
+    """Sorted search terms of recipe titles, ingredient names and category names"""
+
+    def __init__(self, entries, last_updated=None):
+        self.entries = entries  # (kind, id) -> (label, popularity)
+        self.last_updated = last_updated  # Newest recipe updated_at seen
+        pairs = sorted((term, ref) for ref, (label, _) in entries.items() for term in index_terms(label))
+        self.terms = [term for term, _ in pairs]
+        self.refs = [ref for _, ref in pairs]
+        self.recipe_count = sum(1 for kind, _ in entries if kind == RECIPE)
+
+    @classmethod
+    def build(cls, max_recipes):
+        last_updated = Recipe.objects.aggregate(last=Max('updated_at'))['last']
+        entries = {}
+        recipes = Recipe.objects.approved().order_by('-rating_count', '-comment_count', '-created_at')[:max_recipes]
+        for pk, title, ratings, comments in recipes.values_list('pk', 'title', 'rating_count', 'comment_count'):
+            entries[RECIPE, pk] = (title, ratings + comments)
+        links = RecipeIngredient.objects.filter(recipe__status='approved').values('ingredient_id')
+        ingredients = links.annotate(uses=Count('id')).order_by('-uses')[:MAX_INGREDIENTS]
+        for pk, name, uses in ingredients.values_list('ingredient_id', 'ingredient__name', 'uses'):
+            entries[INGREDIENT, pk] = (name, uses)
+        categories = Category.objects.annotate(uses=Count('recipes', filter=Q(recipes__status='approved')))
+        for pk, name, uses in categories.values_list('pk', 'name', 'uses'):
+            entries[CATEGORY, pk] = (name, uses)
+        return cls(entries, last_updated)
+
+    def copy(self):
+        index = SuggestionIndex.__new__(SuggestionIndex)
+        index.__dict__.update(self.__dict__)
+        index.entries, index.terms, index.refs = dict(self.entries), list(self.terms), list(self.refs)
+        return index
+
+    def add(self, kind, pk, label, popularity):
+        ref = (kind, pk)
+        if ref in self.entries:
+            self.remove(kind, pk)
+        self.entries[ref] = (label, popularity)
+        self.recipe_count += kind == RECIPE
+        for term in index_terms(label):
+            position = bisect_right(self.terms, term)
+            self.terms.insert(position, term)
+            self.refs.insert(position, ref)
+
+    def remove(self, kind, pk):
+        ref = (kind, pk)
+        entry = self.entries.pop(ref, None)
+        if entry is None:
+            return
+        self.recipe_count -= kind == RECIPE
+        for term in index_terms(entry[0]):
+            position = bisect_left(self.terms, term)
+            while position < len(self.terms) and self.terms[position] == term:
+                if self.refs[position] == ref:
+                    del self.terms[position], self.refs[position]
+                    break
+                position += 1
+
+    def catch_up(self):
+        """Apply the recipes updated since the last catch-up, as described in the module docstring"""
+        recipes = Recipe.objects.all()
+        if self.last_updated is not None:
+            recipes = recipes.filter(updated_at__gte=self.last_updated)
+        approved = []
+        for pk, title, status, ratings, comments, category_id, category_name, updated_at in recipes.values_list(
+            'pk', 'title', 'status', 'rating_count', 'comment_count', 'category_id', 'category__name', 'updated_at',
+        ):
+            self.last_updated = max(self.last_updated or updated_at, updated_at)
+            if status != 'approved':
+                self.remove(RECIPE, pk)
+                continue
+            self.add(RECIPE, pk, title, ratings + comments)
+            approved.append(pk)
+            if category_id is not None and (CATEGORY, category_id) not in self.entries:
+                self.add(CATEGORY, category_id, category_name, 1)
+        if approved:
+            links = RecipeIngredient.objects.filter(recipe_id__in=approved)
+            for pk, name in links.values_list('ingredient_id', 'ingredient__name').distinct():
+                if (INGREDIENT, pk) not in self.entries:
+                    self.add(INGREDIENT, pk, name, 1)
+
+    def suggest(self, prefix, limit=5):
+        """The ``limit`` most popular entries of each kind with a term starting with ``prefix``"""
+        prefix = normalize(prefix)[:TERM_LENGTH]
+        if len(prefix) < MIN_PREFIX_LENGTH:
+            return {RECIPE: [], INGREDIENT: [], CATEGORY: []}
+        start = bisect_left(self.terms, prefix)
+        end = bisect_left(self.terms, prefix + '\U0010ffff', start)
+        matches = {RECIPE: set(), INGREDIENT: set(), CATEGORY: set()}
+        for kind, pk in self.refs[start:end]:
+            matches[kind].add(pk)
+        return {
+            kind: [
+                (pk, self.entries[kind, pk][0])
+                for pk in heapq.nlargest(limit, found, key=lambda pk: (self.entries[kind, pk][1], pk))
+            ]
+            for kind, found in matches.items()
+        }
+
+
+_index = None
+_index_generations = None
+_index_built_at = 0.0
+_index_checked_at = 0.0
+_index_lock = threading.Lock()
+
+
+def _refresh(generations):
+    """Catch the index up with the database, or rebuild it; called holding ``_index_lock``"""
+    global _index, _index_generations, _index_built_at, _index_checked_at
+    max_recipes = getattr(settings, 'SUGGESTION_INDEX_MAX_RECIPES', 20000)
+    now = time.monotonic()
+    if (
+        _index is None
+        or generations[1] != _index_generations[1]
+        or now - _index_built_at >= REBUILD_SECONDS
+        or _index.recipe_count > max_recipes * 1.1
+    ):
+        _index = SuggestionIndex.build(max_recipes)
+        _index_built_at = now
+    else:
+        index = _index.copy()
+        index.catch_up()
+        _index = index
+    _index_generations = generations
+    _index_checked_at = now
+
+
+def _refresh_in_background(generations):
+    try:
+        _refresh(generations)
+    finally:
+        _index_lock.release()
+        connections.close_all()
+
+
+def get_suggestion_index():
+    """
+    The process-wide index. Only the first call waits for it to be built;
+    later refreshes run in a background thread while lookups use the current
+    index.
+    """
+    generations = get_generations(LISTING, SUGGESTIONS)
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _refresh(generations)
+    elif (
+        generations != _index_generations
+        and time.monotonic() - _index_checked_at >= getattr(settings, 'SUGGESTION_INDEX_REFRESH_SECONDS', 5)
+        and _index_lock.acquire(blocking=False)
+    ):
+        threading.Thread(target=_refresh_in_background, args=(generations,), daemon=True).start()
+    return _index
+
+
+def suggest(prefix, limit=5):
+    return get_suggestion_index().suggest(prefix, limit)
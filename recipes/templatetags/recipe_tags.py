@@ -0,0 +1,68 @@
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from recipes.images import SIZES, VARIANTS, processed_widths, versioned_url
+
+register = template.Library()
+
+
+@register.filter
+def owned_by(recipe, user):
+    """True when ``user`` is the author of ``recipe``"""
+    return user.is_authenticated and recipe.author_id == user.pk
+
+
+@register.simple_tag(takes_context=True)
+def query_with(context, **params):
+    """The current query string with ``params`` set and any page/cursor dropped"""
+    query = context['request'].GET.copy()
+    query.pop('page', None)
+    query.pop('cursor', None)
+    for key, value in params.items():
+        if value is not None:
+            query[key] = value
+    return query.urlencode()
+
+
+def _srcset(name, widths, extension):
+    """Candidates with their real widths; variants no wider than a smaller one are left out"""
+    candidates = {}
+    for variant, width in widths.items():
+        candidates.setdefault(width, f'{versioned_url(name, variant, extension)} {width}w')
+    return ', '.join(candidates.values())
+
+
+@register.simple_tag
+def responsive_image(image, variant='card', **attrs):
+    """
+    A <picture> with WebP and JPEG srcsets built from the processed variants of
+    ``image``, up to ``variant``. Falls back to the original until they exist.
+    """
+    if not image:
+        return ''
+    attrs.setdefault('loading', 'lazy')
+    processed = processed_widths(image.name)
+    if variant not in processed:
+        return format_html('<img src="{}"{}>', image.url, flatatt(attrs))
+    widths = {
+        name: processed[name] for name, size in VARIANTS.items() if size <= VARIANTS[variant] and name in processed
+    }
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}"{}></picture>',
+        _srcset(image.name, widths, 'webp'), SIZES[variant],
+        versioned_url(image.name, variant, 'jpg'),
+        _srcset(image.name, widths, 'jpg'), SIZES[variant],
+        flatatt(attrs),
+    )
+
+
+@register.filter
+def variant_url(image, variant):
+    """URL of one JPEG variant of ``image``, or of the original until it is processed"""
+    if not image:
+        return ''
+    if variant in processed_widths(image.name):
+        return versioned_url(image.name, variant, 'jpg')
+    return image.url
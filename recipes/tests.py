@@ -0,0 +1,976 @@
+import re
+import tempfile
+import threading
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connection, connections
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.template import Context, Template
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import async_views, suggestions
+from .cache import INGREDIENTS, LISTING, SUGGESTIONS, get_generations, recipe_scope
+from .counters import ViewCounter, get_view_counter
+from .facets import FACETS, apply_facets, facet_counts
+from .images import FORMATS, VARIANTS, has_variants, manifest_name, schedule_processing, variant_name
+from .ingredients import IngredientIndex
+from .models import AuthorStats, Category, Comment, ModerationLog, Rating, Recipe, RecipeRecommendation
+from .moderation import transition
+from .pagination import CursorPaginator, EstimatedCountPaginator
+from .parsing import normalize_ingredient, parse_ingredient, parse_ingredients, parse_instructions
+from .recommendations import RecommendationIndex, rebuild_recommendations, refresh_new_recommendations
+from .routers import PIN_COOKIE
+from .search import search_recipes
+from .signals import recipes_changed
+from .views import COMMENTS_PER_PAGE
+
+
+def recipe_fields(**fields):
+    values = {
+        'title': 'Lemon Chicken',
+        'description': 'A quick weeknight dinner',
+        'ingredients': '2 chicken breasts\n1 lemon\n1 tbsp olive oil',
+        'instructions': '1. Season the chicken\n2. Fry until golden',
+        'prep_time': 10,
+        'cook_time': 20,
+        'servings': 2,
+    }
+    values.update(fields)
+    return values
+
+
+# A second database standing in for a replica that has not caught up: unlike
+# a DATABASE_REPLICAS entry it is no test mirror, so it stays empty. Registered
+# on import, before the test runner creates the test databases
+REPLICA = 'replica_test'
+connections.settings.setdefault(REPLICA, {
+    **connections.settings[DEFAULT_DB_ALIAS], 'NAME': ':memory:',
+    'TEST': {**connections.settings[DEFAULT_DB_ALIAS]['TEST'], 'NAME': None, 'MIRROR': None, 'MIGRATE': False},
+})
+
+
+def make_recipe(author, category=None, status='approved', **fields):
+    return Recipe.objects.create(author=author, category=category, status=status, **recipe_fields(**fields))
+
+
+# The manifest storage needs collectstatic; the tests only render the pages
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class ListingQueryCountTests(TestCase):
+    """Listing pages run the same number of queries however many recipes they show"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='secret')
+        cls.readers = [User.objects.create_user(f'reader{number}', password='secret') for number in range(8)]
+        cls.categories = [Category.objects.create(name=name) for name in ('Dinner', 'Dessert', 'Soup')]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.author)
+
+    def tearDown(self):
+        # Views counted by recipe_detail are not flushed into the test database
+        get_view_counter().pending.clear()
+
+    def add_recipes(self, count):
+        for number in range(count):
+            category = self.categories[number % len(self.categories)]
+            make_recipe(self.author, category, title=f'Recipe {number}', status=('approved', 'pending')[number % 2])
+
+    def assert_constant_queries(self, url, grow, queries):
+        for count in (2, 6):
+            # Run the commit hooks (e.g. image variant clean-up) as a real commit would
+            with self.captureOnCommitCallbacks(execute=True):
+                grow(count)
+            cache.clear()
+            with self.assertNumQueries(queries):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_home(self):
+        self.assert_constant_queries(reverse('home'), self.add_recipes, 5)
+
+    def test_my_recipes(self):
+        self.assert_constant_queries(reverse('my_recipes'), self.add_recipes, 4)
+
+    def test_recipe_detail(self):
+        recipe = make_recipe(self.author, self.categories[0])
+        readers = iter(self.readers)
+
+        def add_activity(count):
+            for _ in range(count):
+                reader = next(readers)
+                Comment.objects.create(recipe=recipe, author=reader, content='Lovely')
+                Rating.objects.create(recipe=recipe, user=reader, rating=4)
+
+        self.assert_constant_queries(reverse('recipe_detail', args=[recipe.pk]), add_activity, 8)
+
+
+class CommentPageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='secret')
+        cls.recipe = make_recipe(cls.author)
+        comments = [
+            Comment.objects.create(recipe=cls.recipe, author=cls.author, content=f'Comment {number}')
+            for number in range(COMMENTS_PER_PAGE * 2 + 3)
+        ]
+        # Pairs of comments share a timestamp, so the id has to break the ties
+        start = timezone.now()
+        for number, comment in enumerate(comments):
+            Comment.objects.filter(pk=comment.pk).update(created_at=start + timedelta(minutes=number // 2))
+
+    def setUp(self):
+        cache.clear()
+
+    def load_all(self, recipe):
+        contents, cursor = [], None
+        while True:
+            url = reverse('recipe_comments', args=[recipe.pk])
+            data = self.client.get(url, {'cursor': cursor} if cursor else {}).json()
+            self.assertLessEqual(len(data['comments']), COMMENTS_PER_PAGE)
+            contents += [comment['content'] for comment in data['comments']]
+            cursor = data['next_cursor']
+            if cursor is None:
+                return contents
+
+    def test_load_more_returns_every_comment_once_newest_first(self):
+        expected = list(
+            Comment.objects.filter(recipe=self.recipe).order_by('-created_at', '-id').values_list('content', flat=True)
+        )
+        self.assertEqual(self.load_all(self.recipe), expected)
+
+    def test_hidden_recipes_comments_are_for_staff_only(self):
+        hidden = make_recipe(self.author, status='pending')
+        Comment.objects.create(recipe=hidden, author=self.author, content='Draft note')
+        self.assertEqual(self.client.get(reverse('recipe_comments', args=[hidden.pk])).status_code, 404)
+
+        self.client.force_login(User.objects.create_user('staff', password='secret', is_staff=True))
+        self.assertEqual(self.load_all(hidden), ['Draft note'])
+
+    def test_stored_comment_count_follows_comments(self):
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.comment_count, COMMENTS_PER_PAGE * 2 + 3)
+        Comment.objects.filter(recipe=self.recipe).first().delete()
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.comment_count, COMMENTS_PER_PAGE * 2 + 2)
+
+
+class RecipeSaveTests(TestCase):
+    def test_full_save_keeps_counters_moved_since_the_recipe_was_read(self):
+        author = User.objects.create_user('author', password='secret')
+        recipe = make_recipe(author)
+        Rating.objects.create(recipe=recipe, user=author, rating=4)
+        Comment.objects.create(recipe=recipe, author=author, content='Lovely')
+        Recipe.objects.filter(pk=recipe.pk).update(view_count=7, trending_score=1.5)
+
+        recipe.title = 'Lemon Chicken Traybake'
+        recipe.prep_time = 15
+        recipe.save()
+
+        stored = Recipe.objects.get(pk=recipe.pk)
+        self.assertEqual((stored.title, stored.total_time), ('Lemon Chicken Traybake', 35))
+        self.assertEqual(
+            (stored.rating_sum, stored.rating_count, stored.average_rating, stored.comment_count),
+            (4, 1, Decimal('4.00'), 1),
+        )
+        self.assertEqual((stored.view_count, stored.trending_score), (7, 1.5))
+
+
+class IngredientIndexTests(SimpleTestCase):
+    # Recipe id -> ingredient ids, newest recipe first
+    RECIPES = {10: {1, 2}, 11: {1, 2, 3}, 12: {1}, 13: {3, 4}, 14: {1, 2, 3, 4}}
+
+    def build(self):
+        slots = {pk: slot for slot, pk in enumerate(self.RECIPES)}
+        postings = defaultdict(list)
+        for pk, ingredient_ids in self.RECIPES.items():
+            for ingredient_id in ingredient_ids:
+                postings[ingredient_id].append(slots[pk])
+        return IngredientIndex(list(self.RECIPES), postings, {'egg': 1, 'flour': 2, 'milk': 3, 'tomato': 4})
+
+    def test_ranks_by_share_covered_then_count_then_newest(self):
+        # Every posting list a bitmap, then most of them arrays
+        for dense_fraction in (32, 1):
+            with self.subTest(dense_fraction=dense_fraction), \
+                    mock.patch('recipes.ingredients.DENSE_FRACTION', dense_fraction):
+                total, results = self.build().search([1, 2])
+                self.assertEqual(total, 4)
+                self.assertEqual(results, [(10, 2, 2), (12, 1, 1), (11, 2, 3), (14, 2, 4)])
+
+    def test_pages_continue_across_buckets(self):
+        index = self.build()
+        _, everything = index.search([1, 3], limit=20)
+        pages = [index.search([1, 3], offset, 2)[1] for offset in range(0, len(everything) + 2, 2)]
+        self.assertEqual([result for page in pages for result in page], everything)
+        self.assertEqual(pages[-1], [])
+
+    def test_unknown_and_empty_ingredients(self):
+        index = self.build()
+        self.assertEqual(
+            index.resolve(['Eggs', ' Saffron ', '', 'fresh tomatoes']), ({'egg': 1, 'tomato': 4}, ['Saffron'])
+        )
+        self.assertEqual(index.search([]), (0, []))
+        self.assertEqual(index.search([99]), (0, []))
+
+
+class CookWithTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author', password='secret')
+        cls.omelette = make_recipe(author, title='Omelette', ingredients='3 eggs\n1 tbsp butter')
+        cls.pancakes = make_recipe(author, title='Pancakes', ingredients='2 eggs\n200g flour\n300ml milk')
+        make_recipe(author, status='pending', title='Custard', ingredients='4 eggs\n500ml milk')
+
+    def setUp(self):
+        self.enterContext(mock.patch('recipes.ingredients._index', None))
+
+    def test_ranked_results_list_missing_and_unknown_ingredients(self):
+        data = self.client.get(reverse('cook_with'), {'ingredients': 'eggs, milk,saffron,'}).json()
+        self.assertEqual(data['total'], 2)
+        self.assertEqual(data['unknown_ingredients'], ['saffron'])
+        self.assertEqual(
+            [(recipe['title'], recipe['matched'], recipe['missing']) for recipe in data['recipes']],
+            [('Pancakes', 2, ['flour']), ('Omelette', 1, ['butter'])],
+        )
+        self.assertIsNone(data['next_offset'])
+
+    def test_no_known_ingredients_match_nothing(self):
+        for params in ({}, {'ingredients': 'saffron'}):
+            with self.subTest(params=params):
+                data = self.client.get(reverse('cook_with'), params).json()
+                self.assertEqual((data['total'], data['recipes']), (0, []))
+
+
+class SuggestionTests(TestCase):
+    """The in-process suggestion index follows moderation and deletions"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='secret')
+        cls.stew = make_recipe(cls.author, title='Saffron Stew', ingredients='1 pinch saffron\n2 onions')
+        cls.risotto = make_recipe(cls.author, status='pending', title='Saffron Risotto')
+
+    def setUp(self):
+        cache.clear()
+        self.enterContext(mock.patch.multiple(
+            'recipes.suggestions', _index=None, _index_generations=None, _index_built_at=0.0, _index_checked_at=0.0,
+        ))
+
+    def refresh(self):
+        """Run the refresh ``get_suggestion_index`` starts in a background thread"""
+        with suggestions._index_lock:
+            suggestions._refresh(get_generations(LISTING, SUGGESTIONS))
+
+    def suggested_recipes(self, prefix):
+        return [title for _, title in suggestions.suggest(prefix)[suggestions.RECIPE]]
+
+    def test_titles_ingredients_and_categories_are_suggested_by_word_prefix(self):
+        Category.objects.create(name='Stews')
+        found = suggestions.suggest('ST')
+        self.assertEqual([title for _, title in found[suggestions.RECIPE]], ['Saffron Stew'])
+        self.assertEqual([name for _, name in found[suggestions.CATEGORY]], ['Stews'])
+        self.assertEqual([name for _, name in suggestions.suggest('saf')[suggestions.INGREDIENT]], ['saffron'])
+        self.assertEqual(self.suggested_recipes('s'), [])
+
+    def test_a_newly_approved_recipe_is_caught_up(self):
+        self.assertEqual(self.suggested_recipes('saffron'), ['Saffron Stew'])
+        built_at = suggestions._index_built_at
+        with self.captureOnCommitCallbacks(execute=True):
+            transition([self.risotto.pk], 'approved')
+        self.refresh()
+        self.assertEqual(suggestions._index_built_at, built_at)
+        self.assertCountEqual(self.suggested_recipes('saffron'), ['Saffron Stew', 'Saffron Risotto'])
+
+    def test_a_rejected_recipe_is_dropped(self):
+        self.assertEqual(self.suggested_recipes('stew'), ['Saffron Stew'])
+        with self.captureOnCommitCallbacks(execute=True):
+            transition([self.stew.pk], 'rejected')
+        self.refresh()
+        self.assertEqual(self.suggested_recipes('stew'), [])
+
+    def test_a_deleted_recipe_is_dropped_by_a_rebuild(self):
+        self.assertEqual(self.suggested_recipes('stew'), ['Saffron Stew'])
+        built_at = suggestions._index_built_at
+        with self.captureOnCommitCallbacks(execute=True):
+            self.stew.delete()
+        self.refresh()
+        self.assertGreater(suggestions._index_built_at, built_at)
+        self.assertEqual(self.suggested_recipes('stew'), [])
+
+
+class ParsingTests(SimpleTestCase):
+    def test_ingredient_lines_split_into_quantity_unit_and_item(self):
+        cases = [
+            # line, quantity, amount, unit, item
+            ('2 cups flour', '2', 2.0, 'cup', 'flour'),
+            ('2-3 cups of flour', '2-3', 2.0, 'cup', 'flour'),
+            ('2 to 3 large carrots', '2 to 3', 2.0, None, 'large carrots'),
+            ('Cup noodles', None, None, None, 'Cup noodles'),
+            ('Salt to taste', None, None, None, 'Salt to taste'),
+            ('1 1/2 tsp salt', '1 1/2', 1.5, 'tsp', 'salt'),
+            ('½ cup sugar', '1/2', 0.5, 'cup', 'sugar'),
+            ('1½ cups milk', '1 1/2', 1.5, 'cup', 'milk'),
+            ('1,5 l water', '1,5', 1.5, 'l', 'water'),
+            ('200g butter', '200', 200.0, 'g', 'butter'),
+            ('2 tbsp. olive oil', '2', 2.0, 'tbsp', 'olive oil'),
+            ('3 Cups Rice', '3', 3.0, 'cup', 'Rice'),
+            ('- 3 eggs', '3', 3.0, None, 'eggs'),
+            ('1. 2 cloves garlic, minced', '2', 2.0, 'clove', 'garlic, minced'),
+            ('• pinch of salt', None, None, None, 'pinch of salt'),
+            # Nothing left after the unit: the item falls back to the line
+            ('10 oz', '10', 10.0, 'oz', '10 oz'),
+        ]
+        for line, quantity, amount, unit, item in cases:
+            with self.subTest(line=line):
+                self.assertEqual(
+                    parse_ingredient(line),
+                    {'text': line, 'quantity': quantity, 'amount': amount, 'unit': unit, 'item': item},
+                )
+
+    def test_ingredients_and_instructions_skip_blank_lines_and_list_markers(self):
+        self.assertEqual(
+            [item['item'] for item in parse_ingredients('  2 eggs \n\n\n1 cup milk\n')], ['eggs', 'milk']
+        )
+        self.assertEqual(
+            parse_instructions('1. Boil water\n\n2) Add pasta\n- Drain\nStir well'),
+            ['Boil water', 'Add pasta', 'Drain', 'Stir well'],
+        )
+
+    def test_vocabulary_names_drop_notes_and_preparation(self):
+        cases = [
+            ('Tomatoes, diced (for the sauce)', 'tomato'),
+            ('fresh cherries', 'cherry'),
+            ('pancetta or guanciale', 'pancetta'),
+            ('asparagus', 'asparagus'),
+            ('(optional)', ''),
+        ]
+        for item, name in cases:
+            with self.subTest(item=item):
+                self.assertEqual(normalize_ingredient(item), name)
+
+
+class SearchTests(TestCase):
+    """Full-text search over the index kept by the recipe signals"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='secret')
+
+    def search(self, query):
+        return list(search_recipes(Recipe.objects.approved().order_by('-created_at'), query))
+
+    def test_ranks_title_matches_above_description_and_ingredient_matches(self):
+        in_ingredients = make_recipe(self.author, title='Weeknight Stir Fry', ingredients='200 g tofu\n1 lime')
+        in_description = make_recipe(self.author, title='Green Curry', description='Tofu simmered in coconut milk')
+        in_title = make_recipe(self.author, title='Crispy Tofu Bowl')
+        make_recipe(self.author, title='Beef Stew')
+
+        self.assertEqual(self.search('tofu'), [in_title, in_description, in_ingredients])
+
+    def test_matches_word_prefixes_and_every_token(self):
+        both = make_recipe(self.author, title='Lemon Chicken Pasta')
+        make_recipe(self.author, title='Lemon Tart', ingredients='3 lemons\n200 g sugar')
+
+        self.assertEqual(self.search('lem chick'), [both])
+
+    def test_hidden_matches_take_no_results(self):
+        # More pending matches than the old ranked-id limit; bulk_create skips the index signals
+        Recipe.objects.bulk_create([
+            Recipe(author=self.author, status='pending', **recipe_fields(title='Tofu Scramble')) for _ in range(600)
+        ])
+        call_command('rebuild_search_index', stdout=StringIO())
+        approved = make_recipe(self.author, title='Tofu Scramble')
+
+        results = search_recipes(Recipe.objects.approved(), 'tofu')
+        self.assertEqual(list(results), [approved])
+        self.assertEqual(results.count(), 1)
+        self.assertEqual(search_recipes(Recipe.objects.all(), 'tofu').count(), 601)
+
+    def test_index_follows_edits(self):
+        recipe = make_recipe(self.author, title='Tomato Soup')
+        recipe.title = 'Pumpkin Soup'
+        recipe.save()
+
+        self.assertEqual(self.search('tomato'), [])
+        self.assertEqual(self.search('pumpkin'), [recipe])
+
+
+class PaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author', password='secret')
+        cls.recipes = [make_recipe(author, title=f'Recipe {number}') for number in range(20)]
+        # Pairs of recipes share a timestamp, so the id has to break the ties
+        start = timezone.now()
+        for number, recipe in enumerate(cls.recipes):
+            Recipe.objects.filter(pk=recipe.pk).update(created_at=start + timedelta(minutes=number // 2))
+
+    def newest_first(self):
+        return list(Recipe.objects.order_by('-created_at', '-id'))
+
+    def test_cursor_pages_cover_every_row_once_in_both_directions(self):
+        paginator = CursorPaginator(Recipe.objects.all(), 3)
+        pages = [paginator.get_page(None)]
+        while pages[-1].has_next():
+            pages.append(paginator.get_page(pages[-1].next_cursor))
+        self.assertEqual([recipe for page in pages for recipe in page], self.newest_first())
+        self.assertFalse(pages[0].has_previous())
+
+        back = [pages[-1]]
+        while back[-1].has_previous():
+            back.append(paginator.get_page(back[-1].previous_cursor))
+        self.assertEqual([list(page) for page in reversed(back)], [list(page) for page in pages])
+
+    def test_malformed_cursor_starts_from_the_newest(self):
+        page = CursorPaginator(Recipe.objects.all(), 3).get_page('not-a-cursor')
+        self.assertEqual(list(page), self.newest_first()[:3])
+
+    @override_settings(PAGINATION_COUNT_LIMIT=5)
+    def test_estimated_count_keeps_every_page_reachable(self):
+        paginator = EstimatedCountPaginator(Recipe.objects.order_by('-created_at', '-id'), 3)
+        self.assertEqual(paginator.count, 5)
+        self.assertTrue(paginator.count_is_estimate)
+
+        last = paginator.get_page(7)
+        self.assertEqual(last.number, 7)
+        self.assertEqual(list(last), self.newest_first()[18:])
+        self.assertFalse(last.has_next())
+        self.assertTrue(paginator.get_page(6).has_next())
+        # Past the rows there is no page to clamp to
+        self.assertEqual(paginator.get_page(8).number, 1)
+
+    @override_settings(PAGINATION_COUNT_LIMIT=50)
+    def test_exact_count_pages_like_django(self):
+        paginator = EstimatedCountPaginator(Recipe.objects.order_by('-created_at', '-id'), 3)
+        self.assertEqual(paginator.count, 20)
+        self.assertFalse(paginator.count_is_estimate)
+        self.assertEqual(paginator.get_page(99).number, 7)
+
+
+class FacetCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author', password='secret')
+        cls.categories = [Category.objects.create(name=name) for name in ('Dinner', 'Dessert')]
+        # Values on and around the option boundaries
+        times = [(5, 5), (5, 10), (10, 19), (15, 15), (30, 30), (0, 119), (60, 60), (100, 100)]
+        servings = [1, 2, 3, 4, 5, 8, 9, 12]
+        ratings = ['0', '0.99', '1.00', '2.50', '3.00', '3.99', '4.00', '5.00']
+        for number in range(24):
+            prep, cook = times[number % len(times)]
+            recipe = make_recipe(
+                author, cls.categories[number % 3 % 2] if number % 3 else None,
+                title=f'Recipe {number}', prep_time=prep, cook_time=cook,
+                servings=servings[number * 3 % len(servings)],
+            )
+            Recipe.objects.filter(pk=recipe.pk).update(average_rating=Decimal(ratings[number * 5 % len(ratings)]))
+        make_recipe(author, cls.categories[0], status='pending', title='Hidden')
+
+    def assert_counts_match_queries(self, category_id, selected):
+        recipes = Recipe.objects.approved()
+        counts = facet_counts(recipes, category_id, selected)
+        in_category = recipes.filter(category_id=category_id) if category_id else recipes
+
+        self.assertEqual(counts.total, apply_facets(in_category, selected).count())
+        for category in self.categories:
+            self.assertEqual(
+                counts.categories().get(category.pk, 0),
+                apply_facets(recipes.filter(category=category), selected).count(),
+            )
+        for facet, options in counts.facets():
+            others = {name: option for name, option in selected.items() if name != facet.name}
+            for key, _, count, _ in options:
+                chosen = apply_facets(in_category, {**others, facet.name: facet.option(key)})
+                self.assertEqual(count, chosen.count(), (facet.name, key, selected))
+
+    def test_counts_match_count_queries(self):
+        selections = [
+            {},
+            {'time': FACETS[0].option('15-30')},
+            {'rating': FACETS[1].option('4'), 'servings': FACETS[2].option('3-4')},
+            {name: facet.options[-1] for name, facet in zip(['time', 'rating', 'servings'], FACETS)},
+        ]
+        for category_id in (None, self.categories[0].pk, self.categories[1].pk):
+            for selected in selections:
+                self.assert_counts_match_queries(category_id, selected)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='secret')
+        cls.recipe = make_recipe(cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_home_revalidation_runs_no_queries(self):
+        etag = self.client.get(reverse('home'))['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_home_etag_changes_with_the_listing(self):
+        etag = self.client.get(reverse('home'))['ETag']
+        Comment.objects.create(recipe=self.recipe, author=self.author, content='Lovely')
+        response = self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class ApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='secret')
+        cls.recipes = [make_recipe(cls.author, title=f'Recipe {number}') for number in range(7)]
+        start = timezone.now()
+        for number, recipe in enumerate(cls.recipes):
+            Recipe.objects.filter(pk=recipe.pk).update(created_at=start + timedelta(minutes=number // 2))
+        cls.hidden = make_recipe(cls.author, status='pending', title='Hidden')
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, name, *args, **params):
+        return self.client.get(reverse(name, args=args), params)
+
+    def test_fields_select_the_returned_keys(self):
+        data = self.get('api_recipe_list', fields='id,title,average_rating').json()
+        self.assertEqual(set(data['results'][0]), {'id', 'title', 'average_rating'})
+        detail = self.get('api_recipe_detail', self.recipes[0].pk, fields='title').json()
+        self.assertEqual(detail, {'title': 'Recipe 0'})
+
+        response = self.get('api_recipe_list', fields='title,secret')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('secret', response.json()['error'])
+
+    def test_ids_fetch_a_batch_in_the_order_given(self):
+        ids = [self.recipes[3].pk, self.hidden.pk, self.recipes[1].pk, 999999]
+        data = self.get('api_recipe_list', ids=','.join(map(str, ids)), fields='title').json()
+        self.assertEqual(data['results'], [{'title': 'Recipe 3'}, {'title': 'Recipe 1'}])
+        self.assertEqual(data['missing'], [self.hidden.pk, 999999])
+
+        self.assertEqual(self.get('api_recipe_list', ids='1,x').status_code, 400)
+        self.assertEqual(self.get('api_recipe_list', ids=','.join(['1'] * 101)).status_code, 400)
+
+    def test_cursors_page_through_every_approved_recipe_once(self):
+        titles, cursor = [], None
+        while True:
+            params = {'fields': 'title', 'limit': 3, **({'cursor': cursor} if cursor else {})}
+            data = self.get('api_recipe_list', **params).json()
+            titles += [row['title'] for row in data['results']]
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+        newest_first = Recipe.objects.approved().order_by('-created_at', '-id').values_list('title', flat=True)
+        self.assertEqual(titles, list(newest_first))
+
+        self.assertEqual(self.get('api_recipe_list', limit='many').status_code, 400)
+
+    def test_hidden_recipes_and_their_children_are_not_found(self):
+        Comment.objects.create(recipe=self.hidden, author=self.author, content='Draft note')
+        self.assertEqual(self.get('api_recipe_detail', self.hidden.pk).status_code, 404)
+        self.assertEqual(self.get('api_recipe_comments', self.hidden.pk).status_code, 404)
+
+        Comment.objects.create(recipe=self.recipes[0], author=self.author, content='Lovely')
+        data = self.get('api_recipe_comments', self.recipes[0].pk, fields='author,content').json()
+        self.assertEqual(data['results'], [{'author': 'author', 'content': 'Lovely'}])
+
+
+@override_settings(IMAGE_PROCESSING_MODE='sync')
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        self.author = User.objects.create_user('author', password='secret')
+        cache.clear()
+
+    def upload(self, size, name='photo.jpg'):
+        buffer = BytesIO()
+        Image.new('RGB', size, 'orange').save(buffer, 'JPEG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+    def make_recipe_with_image(self, size):
+        with self.captureOnCommitCallbacks(execute=True):
+            return make_recipe(self.author, image=self.upload(size))
+
+    def srcset(self, recipe, variant):
+        html = Template('{% load recipe_tags %}{% responsive_image recipe.image variant %}').render(
+            Context({'recipe': recipe, 'variant': variant})
+        )
+        return re.search(r'<img [^>]*srcset="([^"]*)"', html).group(1)
+
+    def test_srcset_advertises_the_real_widths_of_portrait_variants(self):
+        recipe = self.make_recipe_with_image((600, 1200))
+        widths = re.findall(r' (\d+)w', self.srcset(recipe, 'detail'))
+        self.assertEqual(widths, ['160', '320', '600'])
+
+    def test_small_originals_list_one_candidate_per_width(self):
+        recipe = self.make_recipe_with_image((200, 100))
+        self.assertEqual(re.findall(r' (\d+)w', self.srcset(recipe, 'detail')), ['200'])
+
+    def test_replacing_an_image_deletes_the_old_variants(self):
+        recipe = self.make_recipe_with_image((800, 600))
+        old = recipe.image.name
+        self.assertTrue(has_variants(old, tuple(VARIANTS)))
+
+        recipe.image = self.upload((800, 600), name='new.jpg')
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.save()
+
+        self.assertFalse(any(
+            default_storage.exists(variant_name(old, variant, extension))
+            for variant in VARIANTS for extension in FORMATS
+        ))
+        self.assertFalse(default_storage.exists(manifest_name(old)))
+        self.assertTrue(has_variants(recipe.image.name, tuple(VARIANTS)))
+
+    def test_rendering_processed_images_reads_no_storage(self):
+        recipes = [self.make_recipe_with_image((800, 600)) for _ in range(3)]
+        storage = mock.Mock(wraps=default_storage)
+        with mock.patch('recipes.images.default_storage', storage):
+            for recipe in recipes:
+                self.srcset(recipe, 'card')
+        self.assertEqual((storage.open.call_count, storage.exists.call_count), (0, 0))
+
+    def test_unprocessed_images_are_looked_up_once(self):
+        with mock.patch('recipes.signals.schedule_processing'):
+            recipe = make_recipe(self.author, image=self.upload((800, 600)))
+        html = Template('{% load recipe_tags %}{% responsive_image recipe.image %}')
+        self.assertNotIn('srcset', html.render(Context({'recipe': recipe})))
+
+        storage = mock.Mock(wraps=default_storage)
+        with mock.patch('recipes.images.default_storage', storage):
+            html.render(Context({'recipe': recipe}))
+        self.assertEqual((storage.open.call_count, storage.exists.call_count), (0, 0))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            schedule_processing(recipe.image.name)
+        self.assertEqual(re.findall(r' (\d+)w', self.srcset(recipe, 'card')), ['320', '640'])
+
+
+class RecommendationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='secret')
+        cls.curries = [
+            make_recipe(cls.author, title=f'{kind} Chicken Curry', ingredients='2 chicken thighs\n1 tbsp curry paste')
+            for kind in ('Green', 'Red', 'Yellow')
+        ]
+        cls.cake = make_recipe(cls.author, title='Lemon Drizzle Cake', ingredients='200g sugar\n2 lemons')
+        rebuild_recommendations(top_k=1)
+
+    def stored(self, recipe):
+        return list(RecipeRecommendation.objects.filter(recipe=recipe).values_list('recommended_id', flat=True))
+
+    def test_rebuild_marks_every_recipe_including_those_without_neighbours(self):
+        self.assertIn(self.stored(self.curries[0])[0], [curry.pk for curry in self.curries[1:]])
+        self.assertEqual(self.stored(self.cake), [])
+        self.assertFalse(Recipe.objects.filter(recommendations_built_at__isnull=True).exists())
+
+    def test_new_only_handles_each_new_recipe_once(self):
+        pie = make_recipe(self.author, title='Lemon Meringue Pie', ingredients='2 lemons\n3 eggs')
+        loner = make_recipe(self.author, title='Plain Toast', ingredients='1 slice bread')
+
+        recipes, _ = refresh_new_recommendations(top_k=1)
+        self.assertEqual(self.stored(pie), [self.cake.pk])
+        self.assertEqual(self.stored(loner), [])
+        # The cake had no list, so the pie enters it
+        self.assertEqual(self.stored(self.cake), [pie.pk])
+        self.assertEqual(recipes, 3)
+
+        with mock.patch.object(RecommendationIndex, 'build') as build:
+            self.assertEqual(refresh_new_recommendations(top_k=1), (0, 0))
+        build.assert_not_called()
+
+    def test_new_only_keeps_better_existing_lists(self):
+        before = {curry.pk: self.stored(curry) for curry in self.curries}
+        make_recipe(self.author, title='Chicken Soup', ingredients='1 chicken thigh\n1 carrot')
+        refresh_new_recommendations(top_k=1)
+        self.assertEqual({curry.pk: self.stored(curry) for curry in self.curries}, before)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class ModerationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='secret')
+        cls.staff = User.objects.create_user('moderator', password='secret', is_staff=True)
+        cls.pending = [make_recipe(cls.author, status='pending', title=f'Pending {number}') for number in range(4)]
+        cls.approved = make_recipe(cls.author, title='Already approved')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_transition_moves_batches_and_logs_each_change(self):
+        sent = []
+
+        def receiver(sender, recipe_ids, status, previous_statuses, **kwargs):
+            sent.append((sorted(recipe_ids), status, previous_statuses))
+
+        recipes_changed.connect(receiver)
+        self.addCleanup(recipes_changed.disconnect, receiver)
+        ids = [recipe.pk for recipe in [*self.pending, self.approved]]
+        with self.captureOnCommitCallbacks(execute=True):
+            changed = transition(ids, 'approved', self.staff, batch_size=2)
+
+        self.assertEqual(changed, 4)
+        self.assertEqual(set(Recipe.objects.filter(pk__in=ids).values_list('status', flat=True)), {'approved'})
+        log = ModerationLog.objects.order_by('recipe_id')
+        self.assertEqual(
+            list(log.values_list('recipe_id', 'moderator', 'from_status', 'to_status')),
+            [(recipe.pk, self.staff.pk, 'pending', 'approved') for recipe in self.pending],
+        )
+        # One signal per batch; the batch holding only the approved recipe changes nothing
+        self.assertEqual(
+            [(recipe_ids, status) for recipe_ids, status, _ in sent], [(ids[:2], 'approved'), (ids[2:4], 'approved')]
+        )
+        self.assertEqual({previous for *_, statuses in sent for previous in statuses.values()}, {'pending'})
+
+    def test_bulk_change_updates_author_stats_and_invalidates_pages(self):
+        ids = [recipe.pk for recipe in self.pending[:3]]
+        scopes = [LISTING, INGREDIENTS, *[recipe_scope(pk) for pk in ids]]
+        before = get_generations(*scopes)
+        with self.captureOnCommitCallbacks(execute=True):
+            transition(ids, 'rejected', self.staff)
+
+        self.assertTrue(all(new > old for new, old in zip(get_generations(*scopes), before)))
+        stats = AuthorStats.objects.get(user=self.author)
+        self.assertEqual(
+            (stats.total_recipes, stats.approved_recipes, stats.pending_recipes, stats.rejected_recipes), (5, 1, 1, 3)
+        )
+
+    def test_queue_actions_are_for_staff_only(self):
+        url = reverse('moderation_queue')
+        data = {'action': 'approve', 'recipes': [self.pending[0].pk]}
+        self.client.force_login(self.author)
+        self.assertEqual(self.client.post(url, data).status_code, 302)
+        self.assertEqual(Recipe.objects.get(pk=self.pending[0].pk).status, 'pending')
+
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertRedirects(self.client.post(url, data), url, fetch_redirect_response=False)
+        self.assertEqual(Recipe.objects.get(pk=self.pending[0].pk).status, 'approved')
+
+
+class AuthorStatsTests(TestCase):
+    """The incrementally maintained rows match a full recomputation"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='secret')
+        cls.readers = [User.objects.create_user(f'reader{number}', password='secret') for number in range(4)]
+
+    def stored_stats(self):
+        stats = AuthorStats.objects.get(user=self.author)
+        return {field.name: getattr(stats, field.name) for field in AuthorStats._meta.fields
+                if field.name not in ('user', 'updated_at')}
+
+    def assert_matches_rebuild(self):
+        stored = self.stored_stats()
+        AuthorStats.objects.refresh([self.author.pk])
+        self.assertEqual(stored, self.stored_stats())
+        return stored
+
+    def test_recipe_rating_comment_and_moderation_changes(self):
+        soup = make_recipe(self.author, title='Soup')
+        stew = make_recipe(self.author, title='Stew', status='pending')
+        make_recipe(self.author, title='Salad', status='rejected')
+        for reader, stars in zip(self.readers, (5, 4, 2)):
+            Rating.objects.create(recipe=soup, user=reader, rating=stars)
+        rating = Rating.objects.create(recipe=stew, user=self.readers[0], rating=3)
+        rating.rating = 1
+        rating.save()
+        Comment.objects.create(recipe=soup, author=self.readers[1], content='Lovely')
+        Comment.objects.create(recipe=stew, author=self.readers[2], content='Too salty')
+        stats = self.assert_matches_rebuild()
+        self.assertEqual((stats['total_recipes'], stats['rating_count'], stats['comment_count']), (3, 4, 2))
+        self.assertEqual(stats['average_rating'], Decimal('2.34'))
+        self.assertEqual(stats['approved_average_rating'], Decimal('3.67'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            transition([stew.pk], 'approved')
+        self.assertEqual(self.assert_matches_rebuild()['approved_average_rating'], Decimal('2.34'))
+
+        # A stale instance: its counters predate the ratings and comments
+        soup.status = 'rejected'
+        soup.save()
+        rating.delete()
+        self.assert_matches_rebuild()
+
+        soup.delete()
+        stats = self.assert_matches_rebuild()
+        self.assertEqual((stats['total_recipes'], stats['rating_count'], stats['comment_count']), (2, 0, 1))
+
+    def test_rating_cost_does_not_grow_with_the_authors_recipes(self):
+        def rating_queries():
+            recipe = make_recipe(self.author)
+            with CaptureQueriesContext(connection) as queries:
+                Rating.objects.create(recipe=recipe, user=self.readers[0], rating=4)
+            return len(queries)
+
+        few = rating_queries()
+        for number in range(20):
+            make_recipe(self.author, title=f'Recipe {number}')
+        self.assertEqual(rating_queries(), few)
+        self.assert_matches_rebuild()
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class ViewCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author', password='secret')
+        cls.recipes = [make_recipe(author, title=f'Recipe {number}') for number in range(5)]
+
+    def setUp(self):
+        cache.clear()
+        # No flushing thread: the tests flush by hand
+        self.counter = ViewCounter()
+        self.counter.thread = mock.Mock()
+
+    def tearDown(self):
+        get_view_counter().pending.clear()
+
+    def stored_counts(self):
+        return list(Recipe.objects.order_by('pk').values_list('view_count', flat=True))
+
+    def test_flush_adds_the_pending_views_in_batched_updates(self):
+        for number, recipe in enumerate(self.recipes):
+            self.counter.add(recipe.pk, number + 1)
+        self.counter.add(self.recipes[0].pk)
+        with mock.patch('recipes.counters.FLUSH_BATCH_SIZE', 2), CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.counter.flush(), 5)
+        self.assertEqual(sum(query['sql'].startswith('UPDATE') for query in queries), 3)
+        self.assertEqual(self.stored_counts(), [2, 2, 3, 4, 5])
+        self.assertEqual(self.counter.pending_total, 0)
+        self.assertEqual(self.counter.flush(), 0)
+
+    def test_failed_flush_keeps_the_views_pending(self):
+        self.counter.add(self.recipes[0].pk, 3)
+        with mock.patch('django.db.models.query.QuerySet.update', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.counter.flush()
+        self.counter.add(self.recipes[0].pk)
+        self.assertEqual(self.counter.pending_total, 4)
+        self.counter.flush()
+        self.assertEqual(self.stored_counts()[0], 4)
+
+    @override_settings(VIEW_COUNT_FLUSH_THRESHOLD=3)
+    def test_threshold_wakes_the_flushing_thread(self):
+        self.counter.add(self.recipes[0].pk, 2)
+        self.assertFalse(self.counter.wake.is_set())
+        self.counter.add(self.recipes[1].pk)
+        self.assertTrue(self.counter.wake.is_set())
+
+    def test_flushed_counts_keep_the_recipe_page_etag(self):
+        url = reverse('recipe_detail', args=[self.recipes[0].pk])
+        etag = self.client.get(url)['ETag']
+        get_view_counter().flush()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class AsyncViewTests(TransactionTestCase):
+    """The async views' worker threads query through their own connections"""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author', password='secret')
+        self.recipe = make_recipe(self.author, title='Threaded Stew')
+        Comment.objects.create(recipe=self.recipe, author=self.author, content='Worth the wait')
+
+    def tearDown(self):
+        get_view_counter().pending.clear()
+
+    def get(self, view, path, **kwargs):
+        request = AsyncRequestFactory().get(path)
+        request.user = AnonymousUser()
+        request.session = SessionStore()
+        request._messages = FallbackStorage(request)
+        return async_to_sync(view)(request, **kwargs)
+
+    def test_pages_render_data_queried_on_worker_threads(self):
+        response = self.get(async_views.recipe_detail, f'/recipe/{self.recipe.pk}/', pk=self.recipe.pk)
+        self.assertContains(response, 'Threaded Stew')
+        self.assertContains(response, 'Worth the wait')
+        self.assertContains(self.get(async_views.home, '/'), 'Threaded Stew')
+
+    def test_workers_check_their_connections_before_and_after_each_job(self):
+        checked = []
+        close_if_unusable_or_obsolete = BaseDatabaseWrapper.close_if_unusable_or_obsolete
+
+        def check(connection):
+            checked.append(threading.get_ident())
+            close_if_unusable_or_obsolete(connection)
+
+        with mock.patch.object(BaseDatabaseWrapper, 'close_if_unusable_or_obsolete', check):
+            (count, worker), = async_to_sync(async_views.concurrently)(
+                lambda: (Recipe.objects.count(), threading.get_ident())
+            )
+        self.assertEqual(count, 1)
+        self.assertEqual(checked, [worker, worker])
+
+
+@override_settings(
+    STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage',
+    DATABASE_REPLICAS=[REPLICA],
+    DATABASE_ROUTERS=['recipes.routers.ReplicaRouter'],
+    MIDDLEWARE=[*settings.MIDDLEWARE, 'recipes.routers.ReplicaRoutingMiddleware'],
+)
+class ReplicaRoutingTests(TransactionTestCase):
+    """Reads follow the replica routing, with the test replica lagging behind the primary"""
+    databases = {DEFAULT_DB_ALIAS, REPLICA}
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author', password='secret')
+        self.recipe = make_recipe(self.author, title='Replicated Soup')
+
+    def tearDown(self):
+        get_view_counter().pending.clear()
+
+    def test_replica_views_read_from_the_replica(self):
+        self.assertEqual(self.client.get(reverse('recipe_detail', args=[self.recipe.pk])).status_code, 404)
+        self.assertNotContains(self.client.get(reverse('home')), 'Replicated Soup')
+
+    def test_other_requests_read_from_the_primary(self):
+        self.assertContains(self.client.get(reverse('api_recipe_detail', args=[self.recipe.pk])), 'Replicated Soup')
+        with self.settings(DATABASE_REPLICAS=[]):
+            self.assertContains(self.client.get(reverse('recipe_detail', args=[self.recipe.pk])), 'Replicated Soup')
+
+    def test_a_write_pins_the_client_to_the_primary(self):
+        url = reverse('recipe_detail', args=[self.recipe.pk])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        response = self.client.post(reverse('login'), {'username': 'author', 'password': 'wrong'})
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertContains(self.client.get(url), 'Replicated Soup')
+
+    def test_pages_and_values_read_from_a_replica_are_not_cached(self):
+        self.assertNotContains(self.client.get(reverse('home')), 'Replicated Soup')
+        # The primary's render is what later visitors get from the cache, pinned or not
+        self.client.cookies[PIN_COOKIE] = '1'
+        self.assertContains(self.client.get(reverse('home')), 'Replicated Soup')
+        self.client.cookies.pop(PIN_COOKIE)
+        self.assertContains(self.client.get(reverse('home')), 'Replicated Soup')
@@ -0,0 +1,113 @@
+"""
+Trending recipes: a time-decayed activity score per recipe.
+
+Each new rating or comment adds its weight to the recipe's stored
+``trending_score``, decayed with a half-life of ``TRENDING_HALF_LIFE_HOURS``.
+Instead of decaying every score as time passes, an event at time ``t`` is
+stored with weight ``2 ** ((t - epoch) / half-life)``: newer events count
+exponentially more, which orders recipes exactly as decayed scores would, so
+recording an event is one UPDATE of one row (under a shared lock on the epoch
+row where the database has one) and the home listing's
+``?sort=trending`` is a scan of the ``(status, trending_score)`` index.
+
+The stored values grow by a factor of two per half-life, so
+``renormalize_trending`` (run daily) moves the epoch to the present and
+rescales all scores in one UPDATE, which leaves their order unchanged.
+``renormalize_trending --rebuild`` recomputes the scores from the ratings and
+comments tables.
+"""
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, FloatField, Subquery, Value
+from django.db.models.functions import Coalesce, Power
+
+from .models import Comment, Rating, Recipe, TrendingEpoch
+
+COMMENT_WEIGHT = 1.0
+# A five-star rating; lower ratings count proportionally less
+RATING_WEIGHT = 2.0
+# Events older than this many half-lives add under a millionth of their weight
+REBUILD_HALF_LIVES = 20
+# Databases with ``SELECT ... FOR SHARE``; renormalize and rebuild lock the epoch row exclusively
+SHARE_LOCK_VENDORS = ('postgresql', 'mysql')
+
+
+def half_life():
+    """The half-life in seconds"""
+    return getattr(settings, 'TRENDING_HALF_LIFE_HOURS', 48) * 3600
+
+
+def event_weight(instance):
+    """Undecayed weight of a new ``Rating`` or ``Comment``"""
+    if isinstance(instance, Rating):
+        return RATING_WEIGHT * instance.rating / 5
+    return COMMENT_WEIGHT
+
+
+def get_epoch():
+    """The current epoch, creating the row on first use"""
+    return TrendingEpoch.objects.get_or_create(pk=1, defaults={'epoch': time.time()})[0].epoch
+
+
+def record_event(recipe_id, weight, at=None):
+    """Add an event of ``weight`` at Unix time ``at`` (default now) to a recipe's score"""
+    at = at or time.time()
+    with transaction.atomic():
+        if connection.vendor in SHARE_LOCK_VENDORS:
+            # Wait for a renormalisation in progress and hold off the next one until this
+            # commits; a shared lock, so concurrent events don't queue behind each other.
+            # SQLite has no row locks; there the UPDATE below reads the epoch under the write lock
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'SELECT 1 FROM {connection.ops.quote_name(TrendingEpoch._meta.db_table)} WHERE id = 1 FOR SHARE'
+                )
+        # The migration creates the epoch row; without one the event counts as if at the epoch
+        epoch = Coalesce(
+            Subquery(TrendingEpoch.objects.filter(pk=1).values('epoch')), Value(at), output_field=FloatField(),
+        )
+        boost = weight * Power(2, (Value(at) - epoch) / half_life())
+        Recipe.objects.filter(pk=recipe_id).update(trending_score=F('trending_score') + boost)
+
+
+def renormalize(now=None):
+    """Move the epoch to ``now`` and rescale every score to it; returns the scale factor"""
+    now = now or time.time()
+    with transaction.atomic():
+        get_epoch()
+        state = TrendingEpoch.objects.select_for_update().get(pk=1)
+        factor = 2 ** ((state.epoch - now) / half_life())
+        Recipe.objects.exclude(trending_score=0).update(trending_score=F('trending_score') * factor)
+        # Scores decayed to nothing are cleared so the UPDATE above stays small
+        Recipe.objects.filter(trending_score__gt=0, trending_score__lt=1e-9).update(trending_score=0)
+        state.epoch = now
+        state.save(update_fields=['epoch', 'updated_at'])
+    return factor
+
+
+def rebuild(batch_size=1000, now=None):
+    """Recompute every score from the recent ratings and comments, relative to a new epoch at ``now``"""
+    now = now or time.time()
+    scores = defaultdict(float)
+
+    def add(recipe_id, weight, created_at):
+        scores[recipe_id] += weight * 2 ** ((created_at.timestamp() - now) / half_life())
+
+    since = datetime.fromtimestamp(now - REBUILD_HALF_LIVES * half_life(), tz=timezone.utc)
+    ratings = Rating.objects.filter(created_at__gte=since).values_list('recipe_id', 'rating', 'created_at')
+    for recipe_id, rating, created_at in ratings.iterator(chunk_size=10000):
+        add(recipe_id, RATING_WEIGHT * rating / 5, created_at)
+    comments = Comment.objects.filter(created_at__gte=since).values_list('recipe_id', 'created_at')
+    for recipe_id, created_at in comments.iterator(chunk_size=10000):
+        add(recipe_id, COMMENT_WEIGHT, created_at)
+
+    with transaction.atomic():
+        get_epoch()
+        TrendingEpoch.objects.select_for_update().filter(pk=1).update(epoch=now)
+        Recipe.objects.exclude(trending_score=0).update(trending_score=0)
+        recipes = [Recipe(pk=pk, trending_score=score) for pk, score in scores.items()]
+        Recipe.objects.bulk_update(recipes, ['trending_score'], batch_size=batch_size)
+    return len(recipes)
@@ -1,16 +1,34 @@
+from django.conf import settings
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from . import views
+from . import api, views
+
+# Read-heavy pages have async versions for ASGI deployments
+if settings.ASYNC_VIEWS:
+    from . import async_views as read_views
+else:
+    read_views = views
 
 urlpatterns = [
-    path('', views.home, name='home'),
-    path('recipe/<int:pk>/', views.recipe_detail, name='recipe_detail'),
+    path('', read_views.home, name='home'),
+    path('recipe/<int:pk>/', read_views.recipe_detail, name='recipe_detail'),
+    path('recipe/<int:pk>/comments/', views.recipe_comments, name='recipe_comments'),
+    path('cook-with/', views.cook_with, name='cook_with'),
+    path('suggestions/', views.suggestions, name='suggestions'),
     path('submit/', views.submit_recipe, name='submit_recipe'),
     path('my-recipes/', views.my_recipes, name='my_recipes'),
-    path('user/<str:username>/', views.user_profile, name='user_profile'),
+    path('user/<str:username>/', read_views.user_profile, name='user_profile'),
     path('settings/', views.settings, name='settings'),
     path('register/', views.register, name='register'),
     path('login/', auth_views.LoginView.as_view(template_name='recipes/login.html'), name='login'),
     path('logout/', views.logout_view, name='logout'),
+    path('moderation/', views.moderation_queue, name='moderation_queue'),
+    path('api/recipes/', api.recipe_list, name='api_recipe_list'),
+    path('api/recipes/<int:pk>/', api.recipe_detail, name='api_recipe_detail'),
+    path('api/recipes/<int:pk>/comments/', api.recipe_comments, name='api_recipe_comments'),
+    path('api/recipes/<int:pk>/ratings/', api.recipe_ratings, name='api_recipe_ratings'),
+    path('api/categories/', api.category_list, name='api_category_list'),
+    path('cache/stats/', views.cache_stats_view, name='cache_stats'),
+    path('profiling/stats/', views.profiling_stats_view, name='profiling_stats'),
 ]
 
@@ -1,51 +1,107 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import Http404, JsonResponse
 from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.models import User
 from django.contrib import messages
-from django.core.paginator import Paginator
-from django.db.models import Q, Avg
-from .models import Recipe, Category, Comment, Rating, UserProfile
+from django.urls import reverse
+from django.utils.formats import date_format
+from django.utils.http import urlencode
+from django.utils.timezone import localtime
+from .models import AuthorStats, Recipe, Category, Comment, Rating, UserProfile
+from .conditional import conditional_page, listing_validators, recipe_validators
+from .counters import count_views
+from .facets import apply_facets, facet_counts, selected_options
+from .ingredients import what_can_i_cook
+from .moderation import pending_queue, transition
 from .forms import UserRegistrationForm, RecipeForm, CommentForm, RatingForm, UserProfileForm, UserSettingsForm
+from .pagination import CursorPaginator, paginate
+from .profiling import profiling_stats
+from .search import search_recipes
+from .suggestions import suggest
+from .cache import (
+    CATEGORIES, LISTING, cache_anonymous_page, cache_stats, cached_value, get_generations,
+    page_timeout, recipe_scope,
+)
 
 
-def home(request):
-    """Homepage displaying recipes with filtering options"""
+def home_recipes(request):
+    """
+    Build the filtered home queryset; returns it with the filters that were
+    applied and the ``FacetCounts`` of the search (see recipes.facets)
+    """
     # User filter
     user_filter = request.GET.get('user_filter', '')
     
     if user_filter == 'my_recipes' and request.user.is_authenticated:
         # Show only user's own recipes (any status)
-        recipes = Recipe.objects.filter(author=request.user).order_by('-created_at')
-    elif request.user.is_authenticated:
-        # Show approved recipes + user's own recipes (any status)
-        recipes = Recipe.objects.filter(
-            Q(status='approved') | Q(author=request.user)
-        ).order_by('-created_at')
+        recipes = Recipe.objects.filter(author=request.user)
     else:
-        # Show only approved recipes for anonymous users
-        recipes = Recipe.objects.filter(status='approved').order_by('-created_at')
+        # Approved recipes, plus the user's own recipes (any status) when logged in
+        recipes = Recipe.objects.visible_to(request.user)
+    recipes = recipes.for_listing().order_by('-created_at')
     
     # Search functionality
     search_query = request.GET.get('search', '')
     if search_query:
-        recipes = recipes.filter(
-            Q(title__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(ingredients__icontains=search_query)
-        )
+        recipes = search_recipes(recipes, search_query)
     
-    # Category filter
+    # Trending first (recipes.trending), instead of newest or best search matches
+    if request.GET.get('sort') == 'trending':
+        recipes = recipes.order_by('-trending_score', '-created_at')
+    
+    # Facet counts cover the search results before the category and range filters;
+    # anonymous visitors all see the same results, so their counts are shared
     category_id = request.GET.get('category', '')
+    selected = selected_options(request.GET)
+    cache_key = None if request.user.is_authenticated else f'search={search_query}'
+    facets = facet_counts(recipes, category_id, selected, cache_key)
+    
+    # Category filter
     if category_id:
         recipes = recipes.filter(category_id=category_id)
+    # Total time, rating and servings ranges
+    recipes = apply_facets(recipes, selected)
+    
+    return recipes, search_query, category_id, user_filter, facets
+
+
+def by_date(request, search_query):
+    """True when the home listing is in date order, so it can use cursor pagination"""
+    return not search_query and request.GET.get('sort') != 'trending'
+
+
+def facet_context(facets, categories):
+    """Template context of the filter panel"""
+    counts = facets.categories()
+    return {
+        'category_options': [(category, counts.get(category.pk, 0)) for category in categories],
+        'facets': facets.facets(),
+    }
+
+
+def home_categories():
+    """Categories with recipe counts for the category strip, cached per listing generation"""
+    return cached_value(
+        LISTING, 'categories',
+        lambda: list(Category.objects.with_recipe_counts().order_by('name'))
+    )
+
+
+@conditional_page(listing_validators)
+@cache_anonymous_page(lambda: [LISTING, CATEGORIES])
+def home(request):
+    """Homepage displaying recipes with filtering options"""
+    recipes, search_query, category_id, user_filter, facets = home_recipes(request)
     
-    # Pagination
-    paginator = Paginator(recipes, 9)  # Show 9 recipes per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Pagination (page numbers, or a cursor when browsing by date); the facet counts give the total
+    page_obj = paginate(
+        request, recipes, 9,  # Show 9 recipes per page
+        ordered_by_date=by_date(request, search_query), count=facets.total,
+    )
     
-    categories = Category.objects.all().order_by('name')
+    categories = home_categories()
     
     context = {
         'page_obj': page_obj,
@@ -53,10 +109,39 @@ def home(request):
         'search_query': search_query,
         'selected_category': category_id,
         'user_filter': user_filter,
+        'cache_generation': '-'.join(map(str, get_generations(LISTING, CATEGORIES))),
+        'cache_timeout': page_timeout(),
+        **facet_context(facets, categories),
     }
     return render(request, 'recipes/home.html', context)
 
 
+COMMENTS_PER_PAGE = 10
+
+
+def comment_page(recipe_id, cursor=None):
+    """One page of a recipe's comments, newest first, with their authors joined"""
+    comments = Comment.objects.filter(recipe_id=recipe_id).select_related('author')
+    return CursorPaginator(comments, COMMENTS_PER_PAGE).get_page(cursor)
+
+
+def serialize_comment(comment):
+    return {
+        'id': comment.pk,
+        'author': comment.author.username,
+        'content': comment.content,
+        'created_at': comment.created_at.isoformat(),
+        # The formats the page's two comment lists render dates in
+        'created_display': {
+            'date': date_format(localtime(comment.created_at), 'M d, Y'),
+            'datetime': date_format(localtime(comment.created_at), 'M d, Y H:i'),
+        },
+    }
+
+
+@count_views
+@conditional_page(recipe_validators)
+@cache_anonymous_page(lambda pk: [recipe_scope(pk), CATEGORIES])
 def recipe_detail(request, pk):
     """Display recipe details with comments and ratings"""
     recipe = get_object_or_404(Recipe, pk=pk)
@@ -66,7 +151,8 @@ def recipe_detail(request, pk):
         messages.error(request, 'This recipe is not available.')
         return redirect('home')
     
-    comments = recipe.comments.all()
+    # The first page is rendered; the "load more" button fetches the rest from recipe_comments
+    comments = comment_page(recipe.pk)
     user_rating = None
     
     if request.user.is_authenticated:
@@ -118,10 +204,80 @@ def recipe_detail(request, pk):
         'comment_form': comment_form,
         'rating_form': rating_form,
         'user_rating': user_rating,
+        'recommendations': Recipe.objects.recommended_for(recipe.pk).for_listing(),
     }
     return render(request, 'recipes/recipe_detail.html', context)
 
 
+@cache_anonymous_page(lambda pk: [recipe_scope(pk)])
+def recipe_comments(request, pk):
+    """The next page of a recipe's comments as JSON, for the "load more" button"""
+    recipe = get_object_or_404(Recipe.objects.only('status'), pk=pk)
+    if not request.user.is_staff and recipe.status != 'approved':
+        raise Http404('No Recipe matches the given query.')
+
+    page = comment_page(pk, request.GET.get('cursor'))
+    return JsonResponse({
+        'comments': [serialize_comment(comment) for comment in page],
+        'next_cursor': page.next_cursor,
+    })
+
+
+INGREDIENT_RESULTS_PER_PAGE = 20
+
+
+def cook_with(request):
+    """Approved recipes ranked by how many of their ingredients the visitor has, as JSON"""
+    # ?ingredients=eggs,flour,milk or repeated ?ingredient= parameters
+    names = request.GET.getlist('ingredient') + request.GET.get('ingredients', '').split(',')
+    names = [name for name in names if name.strip()]
+    try:
+        offset = max(int(request.GET.get('offset', 0)), 0)
+    except ValueError:
+        offset = 0
+    total, results, unknown = what_can_i_cook(names, offset, INGREDIENT_RESULTS_PER_PAGE)
+    return JsonResponse({
+        'total': total,
+        'unknown_ingredients': unknown,
+        'next_offset': offset + len(results) if offset + len(results) < total else None,
+        'recipes': [
+            {
+                'id': recipe.pk,
+                'title': recipe.title,
+                'url': recipe.get_absolute_url(),
+                'category': recipe.category.name if recipe.category else None,
+                'coverage': round(covered / count, 3),
+                'matched': covered,
+                'ingredient_count': count,
+                'missing': missing,
+            }
+            for recipe, covered, count, missing in results
+        ],
+    })
+
+
+SUGGESTIONS_PER_KIND = 5
+
+
+def suggestions(request):
+    """Search box suggestions for ?q=: recipe titles, ingredients and categories, from the in-process index"""
+    found = suggest(request.GET.get('q', ''), SUGGESTIONS_PER_KIND)
+    return JsonResponse({
+        'recipes': [
+            {'id': pk, 'title': title, 'url': reverse('recipe_detail', args=[pk])}
+            for pk, title in found['recipe']
+        ],
+        'ingredients': [
+            {'name': name, 'url': f'{reverse("cook_with")}?{urlencode({"ingredients": name})}'}
+            for _, name in found['ingredient']
+        ],
+        'categories': [
+            {'id': pk, 'name': name, 'url': f'{reverse("home")}?{urlencode({"category": pk})}'}
+            for pk, name in found['category']
+        ],
+    })
+
+
 @login_required
 def submit_recipe(request):
     """Allow users to submit new recipes"""
@@ -145,26 +301,17 @@ def my_recipes(request):
     """Display recipes submitted by the current user with statistics"""
     recipes = Recipe.objects.filter(author=request.user).order_by('-created_at')
     
-    # Calculate statistics
-    approved_count = recipes.filter(status='approved').count()
-    pending_count = recipes.filter(status='pending').count()
-    rejected_count = recipes.filter(status='rejected').count()
+    # Statistics come from the materialized per-author row, not from counting recipes
+    stats = AuthorStats.for_author(request.user)
     
-    # Calculate average rating
-    avg_rating = recipes.filter(average_rating__gt=0).aggregate(
-        avg=Avg('average_rating')
-    )['avg'] or 0
-    
-    paginator = Paginator(recipes, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, recipes.for_listing(), 12, count=stats.total_recipes)
     
     context = {
         'page_obj': page_obj,
-        'approved_count': approved_count,
-        'pending_count': pending_count,
-        'rejected_count': rejected_count,
-        'avg_rating': avg_rating,
+        'approved_count': stats.approved_recipes,
+        'pending_count': stats.pending_recipes,
+        'rejected_count': stats.rejected_recipes,
+        'avg_rating': stats.average_rating,
     }
     return render(request, 'recipes/my_recipes.html', context)
 
@@ -190,31 +337,33 @@ def login_view(request):
     return LoginView.as_view(template_name='recipes/login.html')(request)
 
 
+def profile_recipes(viewer, profile_user):
+    """The profile's recipe queryset, how many recipes it holds and the author's stats row"""
+    stats = AuthorStats.for_author(profile_user)
+    # Show only approved recipes for other users, all recipes for own profile
+    if viewer == profile_user:
+        return Recipe.objects.filter(author=profile_user).order_by('-created_at'), stats.total_recipes, stats
+    recipes = Recipe.objects.approved().filter(author=profile_user).order_by('-created_at')
+    return recipes, stats.approved_recipes, stats
+
+
+def profile_average_rating(viewer, profile_user, stats):
+    return stats.average_rating if viewer == profile_user else stats.approved_average_rating
+
+
 def user_profile(request, username):
     """Display user profile with their approved recipes"""
     profile_user = get_object_or_404(User, username=username)
     
-    # Show only approved recipes for other users, all recipes for own profile
-    if request.user == profile_user:
-        recipes = Recipe.objects.filter(author=profile_user).order_by('-created_at')
-    else:
-        recipes = Recipe.objects.filter(author=profile_user, status='approved').order_by('-created_at')
-    
-    # Calculate statistics
-    total_recipes = recipes.count()
-    approved_recipes = Recipe.objects.filter(author=profile_user, status='approved').count()
-    avg_rating = recipes.filter(average_rating__gt=0).aggregate(avg=Avg('average_rating'))['avg'] or 0
-    
-    paginator = Paginator(recipes, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    recipes, total_recipes, stats = profile_recipes(request.user, profile_user)
+    page_obj = paginate(request, recipes.for_listing(), 12, count=total_recipes)
     
     context = {
         'profile_user': profile_user,
         'page_obj': page_obj,
         'total_recipes': total_recipes,
-        'approved_recipes': approved_recipes,
-        'avg_rating': avg_rating,
+        'approved_recipes': stats.approved_recipes,
+        'avg_rating': profile_average_rating(request.user, profile_user, stats),
     }
     return render(request, 'recipes/user_profile.html', context)
 
@@ -252,3 +401,34 @@ def logout_view(request):
     messages.success(request, 'You have been logged out successfully.')
     return redirect('home')
 
+
+MODERATION_QUEUE_PER_PAGE = 25
+
+
+@staff_member_required
+def moderation_queue(request):
+    """Pending recipes for review, with bulk approve/reject (staff only)"""
+    if request.method == 'POST':
+        status = {'approve': 'approved', 'reject': 'rejected'}.get(request.POST.get('action'))
+        recipe_ids = [pk for pk in request.POST.getlist('recipes') if pk.isdigit()]
+        if status and recipe_ids:
+            changed = transition(recipe_ids, status, request.user)
+            messages.success(request, f'{changed} recipe(s) {status}.')
+        else:
+            messages.error(request, 'Select at least one recipe and an action.')
+        return redirect('moderation_queue')
+
+    page_obj = pending_queue(request.GET.get('cursor'), MODERATION_QUEUE_PER_PAGE)
+    return render(request, 'recipes/moderation_queue.html', {'page_obj': page_obj})
+
+
+@staff_member_required
+def cache_stats_view(request):
+    """Hit/miss counters of the public page cache (staff only)"""
+    return JsonResponse(cache_stats())
+
+
+@staff_member_required
+def profiling_stats_view(request):
+    """Per-view timing and query percentiles recorded by the profiling middleware (staff only)"""
+    return JsonResponse(profiling_stats())
@@ -55,6 +55,39 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
+    // Search suggestions while typing (served from memory, see recipes/suggestions.py)
+    if (searchInput && searchInput.dataset.suggestionsUrl) {
+        const suggestionList = document.getElementById(searchInput.getAttribute('list'));
+        let suggestionTimer = null;
+        let lastQuery = '';
+
+        searchInput.addEventListener('input', function() {
+            clearTimeout(suggestionTimer);
+            const query = this.value.trim();
+            if (query.length < 2 || query === lastQuery) {
+                return;
+            }
+            suggestionTimer = setTimeout(() => {
+                lastQuery = query;
+                fetch(searchInput.dataset.suggestionsUrl + '?q=' + encodeURIComponent(query))
+                    .then(response => response.json())
+                    .then(data => {
+                        const labels = [
+                            ...data.recipes.map(recipe => recipe.title),
+                            ...data.ingredients.map(ingredient => ingredient.name),
+                            ...data.categories.map(category => category.name),
+                        ];
+                        suggestionList.replaceChildren(...[...new Set(labels)].map(label => {
+                            const option = document.createElement('option');
+                            option.value = label;
+                            return option;
+                        }));
+                    })
+                    .catch(() => {});
+            }, 150);
+        });
+    }
+
     // Animated counter for recipe stats (if any numbers are present)
     function animateNumbers() {
         const numbers = document.querySelectorAll('.animate-number');